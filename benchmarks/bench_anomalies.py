@@ -0,0 +1,75 @@
+"""Time the duplicate and outlier scan (expense_anomalies.py) on a synthetic ledger.
+
+Copies some rows exactly, copies some a day later and makes some amounts
+huge, then checks that the scan reports every one of them. Exits with
+status 1 if any injected anomaly is missed.
+
+Usage: python benchmarks/bench_anomalies.py [--rows 1000000] [--injected 1000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date as Date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_anomalies import find_anomalies
+from expense_tracker import gc_paused
+from synthetic import generate
+
+
+# Far above anything synthetic.generate() produces (at most Rs.1,00,000)
+OUTLIER_PAISE = 50_000_000_00
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--injected", type=int, default=1000, help="anomalies of each kind to inject")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = [(expense["id"], expense["paise"], expense["category"], expense["note"], expense["date"], None, None)
+            for expense in generate(args.rows, args.seed)]
+    # Each injected anomaly gets its own original row, so they cannot mask each other
+    picked = rng.sample(range(args.rows), 3 * args.injected)
+    next_id = len(rows) + 1
+    expected = {"duplicate": set(), "near-duplicate": set(), "outlier": set()}
+    for position in picked[:args.injected]:
+        rows.append((next_id,) + rows[position][1:])
+        expected["duplicate"].add(next_id)
+        next_id += 1
+    for position in picked[args.injected:2 * args.injected]:
+        row = rows[position]
+        later = Date.fromordinal(Date.fromisoformat(row[4]).toordinal() + 1).isoformat()
+        rows.append((next_id,) + row[1:4] + (later,) + row[5:])
+        expected["near-duplicate"].add(next_id)
+        next_id += 1
+    for position in picked[2 * args.injected:]:
+        row = rows[position]
+        rows[position] = (row[0], OUTLIER_PAISE) + row[2:]
+        expected["outlier"].add(row[0])
+
+    start = time.perf_counter()
+    with gc_paused():
+        report = find_anomalies(rows)
+    elapsed = time.perf_counter() - start
+    print(f"rows: {len(rows)}, scan: {elapsed:.2f} s ({len(rows) / elapsed:,.0f} rows/s)")
+    print(report)
+
+    failed = False
+    for kind, ids in expected.items():
+        found = {expense_id for finding in report.of_kind(kind) for expense_id in finding.ids}
+        missed = ids - found
+        failed |= bool(missed)
+        print(f"{kind:15} injected {len(ids):6}  found {len(ids) - len(missed):6}")
+    if failed:
+        print("the scan missed injected anomalies")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
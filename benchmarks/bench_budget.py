@@ -0,0 +1,107 @@
+"""Time recurring-rule materialization and budget checks on a decade of data.
+
+Builds a ten-year synthetic ledger, registers thousands of recurring rules
+(mostly monthly, some weekly and daily) and a budget per category and
+month plus every-month defaults. It then times:
+  - finding due rules when nothing is due and on each of 60 consecutive days
+  - add_expense and update_expense with their budget checks
+  - budget_status() for a month
+Exits with status 1 if the median cost of checking for due rules, of the
+budget check inside add_expense or of budget_status() exceeds TARGET_MS.
+The cost of a day with due rules grows with the occurrences it produces,
+so it is reported per occurrence instead.
+
+Usage: python benchmarks/bench_budget.py [rows] [rules]
+"""
+import contextlib
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date as Date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_budget import Budget, RecurringRule
+from expense_tracker import ExpenseManager
+from synthetic import LAST_YEAR, write_ledger
+
+
+TARGET_MS = 3.0
+
+
+def median_ms(func, calls):
+    seconds = []
+    for args in calls:
+        start = time.perf_counter()
+        func(*args)
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds) * 1000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    rule_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, 'w') as devnull:
+        path = write_ledger(os.path.join(directory, "expenses.json"), rows, years=10)
+        with contextlib.redirect_stdout(devnull):
+            manager = ExpenseManager(path)
+        manager.save_scheduler = lambda: None
+        categories = manager.categories
+        book = manager.budget
+
+        # Rules start after the data ends, so materializing walks forward day by day
+        first_day = Date(LAST_YEAR + 1, 1, 1)
+        for _ in range(rule_count):
+            frequency = rng.choices(["monthly", "weekly", "daily"], [0.75, 0.2, 0.05])[0]
+            start = (first_day + timedelta(days=rng.randrange(28))).isoformat()
+            book.add_rule(RecurringRule(round(rng.uniform(50, 5000), 2), rng.choice(categories), "subscription",
+                                        frequency, start))
+        months = [f"{year}-{month:02d}" for year in range(LAST_YEAR - 9, LAST_YEAR + 2) for month in range(1, 13)]
+        for category in categories:
+            book.set_budget(Budget(rng.uniform(5000, 50000), category))
+            for month in months:
+                book.set_budget(Budget(rng.uniform(5000, 50000), category, month))
+        for month in months:
+            book.set_budget(Budget(rng.uniform(50000, 500000), None, month))
+        budget_count = len(book.budgets)
+
+        idle = median_ms(book.due, [((first_day - timedelta(days=1)).isoformat(),)] * 1000)
+        days = [(first_day + timedelta(days=i)).isoformat() for i in range(60)]
+        due_times = []
+        due_counts = []
+        for day in days:
+            start = time.perf_counter()
+            due_counts.append(len(book.due(day)))
+            due_times.append(time.perf_counter() - start)
+        per_occurrence = sum(due_times) / max(sum(due_counts), 1) * 1e6
+
+        with contextlib.redirect_stdout(devnull):
+            manager.budget.budgets, budgets = {}, manager.budget.budgets
+            add_bare = median_ms(manager.add_expense, [(10.0, rng.choice(categories), "x")] * 500)
+            manager.budget.budgets = budgets
+            add = median_ms(manager.add_expense, [(10.0, rng.choice(categories), "x")] * 500)
+            ids = rng.sample(range(1, rows + 1), 500)
+            update = median_ms(lambda expense_id: manager.update_expense(expense_id, amount=20.0),
+                               [(i,) for i in ids])
+        status = median_ms(manager.budget_status, [(rng.choice(months),) for _ in range(200)])
+
+    print(f"{rows} expenses over 10 years, {rule_count} rules, {budget_count} budgets (median ms)")
+    print(f"  due rules, nothing due         {idle:8.4f}")
+    print(f"  due rules, per occurrence      {per_occurrence / 1000:8.4f}  "
+          f"(~{statistics.median(due_counts):.0f} due per day)")
+    print(f"  add_expense without budgets    {add_bare:8.4f}")
+    print(f"  add_expense with budget check  {add:8.4f}")
+    print(f"  update_expense with check      {update:8.4f}")
+    print(f"  budget_status(month)           {status:8.4f}")
+    slowest = max(idle, add - add_bare, status)
+    if slowest > TARGET_MS:
+        print(f"rule/budget evaluation took {slowest:.3f} ms, above the {TARGET_MS} ms target")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Compare memory use and summary latency of the list and columnar stores.
+
+Usage: python benchmarks/bench_columnar.py [rows]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_tracker import Expense, ExpenseManager
+from expense_columnar import ColumnarExpenseList
+
+
+NOTES = ["Lunch", "Bus pass", "Weekly veggies", "Movie night", "Electricity bill", "Pharmacy", ""]
+
+
+def make_expenses(rows: int, seed: int = 42):
+    rng = random.Random(seed)
+    categories = ExpenseManager.DEFAULT_CATEGORIES
+    for i in range(rows):
+        yield Expense(round(rng.uniform(1, 5000), 2), rng.choice(categories), rng.choice(NOTES),
+                      f"{rng.randint(2020, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", i + 1)
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return store, after - before
+
+
+def aggregate_time(manager, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        manager._compute_aggregates()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    expenses = list(make_expenses(rows))
+    # Copy strings so both stores pay for their own dates and notes, as after a JSON load
+    as_loaded = lambda: ((e.amount, e.category, "".join(e.note), "".join(e.date), e.id) for e in expenses)
+
+    row_store, row_bytes = measure(lambda: [Expense(*fields) for fields in as_loaded()])
+    column_store, column_bytes = measure(
+        lambda: ColumnarExpenseList(ExpenseManager.DEFAULT_CATEGORIES, (Expense(*fields) for fields in as_loaded())))
+
+    results = {}
+    for name, store, columnar in (("list", row_store, False), ("columnar", column_store, True)):
+        manager = ExpenseManager.__new__(ExpenseManager)
+        manager.expenses = store
+        manager.columnar = columnar
+        results[name] = aggregate_time(manager)
+
+    print(f"rows: {rows}")
+    print(f"list store:     {row_bytes / rows:8.1f} bytes/row  summary {results['list'] * 1000:8.1f} ms")
+    print(f"columnar store: {column_bytes / rows:8.1f} bytes/row  summary {results['columnar'] * 1000:8.1f} ms")
+    print(f"memory reduction: {row_bytes / column_bytes:.1f}x  summary speedup: {results['list'] / results['columnar']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Time full and incremental exports (expense_export.py) of a synthetic ledger.
+
+Exports a generated ledger to every format, changes about --changed of its
+rows (updates, deletes and adds), then exports again incrementally and
+checks that replaying each export file gives back the current ledger.
+Exits with status 1 if a replay does not match.
+
+Usage: python benchmarks/bench_export.py [--rows 200000] [--changed 0.01] [--columnar]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_export import iter_export
+from expense_tracker import ExpenseManager
+from synthetic import NOTES, write_ledger
+
+
+TARGETS = ("export.jsonl.gz", "export.csv", "export.cols")
+
+
+def replay(path: str) -> dict:
+    """{id: (paise, category, date)} as the export file's readers would rebuild it"""
+    rows = {}
+    for record in iter_export(path):
+        if record["op"] == "delete":
+            rows.pop(record["id"], None)
+        else:
+            rows[record["id"]] = (record["paise"], record["category"], record["date"])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--changed", type=float, default=0.01, help="share of rows changed between exports")
+    parser.add_argument("--columnar", action="store_true", help="keep the ledger in columnar mode")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        ledger = write_ledger(os.path.join(directory, "expenses.json"), args.rows, args.seed)
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = ExpenseManager(ledger, columnar=args.columnar)
+        manager.save_scheduler = lambda: None  # time the exports, not ledger saves
+
+        print(f"rows: {args.rows}, changed: {args.changed:.1%}")
+        print(f"{'target':18} {'full s':>8} {'MB':>7} {'incremental s':>14} {'MB added':>9}")
+        full = {}
+        for target in TARGETS:
+            path = os.path.join(directory, target)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                manager.export(path)
+            full[target] = (time.perf_counter() - start, os.path.getsize(path))
+
+        changes = int(args.rows * args.changed)
+        ids = [expense.id for expense in manager.expenses]
+        with contextlib.redirect_stdout(io.StringIO()):
+            for expense_id in rng.sample(ids, changes):
+                if rng.random() < 0.8:
+                    manager.update_expense(expense_id, amount=round(rng.uniform(1, 5000), 2))
+                else:
+                    manager.delete_expense(expense_id)
+            manager.add_expenses([{"amount": round(rng.uniform(1, 5000), 2), "category": "Food",
+                                   "note": rng.choice(NOTES)} for _ in range(changes // 4 or 1)])
+
+        current = {expense.id: (expense.paise, expense.category, expense.date) for expense in manager.expenses}
+        for target in TARGETS:
+            path = os.path.join(directory, target)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                manager.export(path)
+            elapsed = time.perf_counter() - start
+            seconds, size = full[target]
+            added = os.path.getsize(path) - size
+            print(f"{target:18} {seconds:8.2f} {size / 2**20:7.1f} {elapsed:14.2f} {added / 2**20:9.2f}")
+            if replay(path) != current:
+                print(f"{target}: replaying the export does not give the current ledger")
+                failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Time expense id allocation (expense_ids.IdAllocator).
+
+Allocates ids one at a time and as one bulk reservation, then has several
+processes allocate from the same file at once and checks that every id is
+unique and that each process got increasing ids. Exits with status 1 if
+any id repeats or allocating one id at a time falls below the target rate.
+
+Usage: python benchmarks/bench_ids.py [ids] [processes]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_ids import IdAllocator
+
+
+TARGET_IDS_PER_SECOND = 1_000_000
+
+
+def allocate(path: str, count: int):
+    allocator = IdAllocator(path)
+    ids = [allocator.reserve() for _ in range(count)]
+    allocator.close()
+    return ids
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else min(os.cpu_count() or 1, 4)
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        allocator = IdAllocator(os.path.join(directory, "single.ids.json"))
+        start = time.perf_counter()
+        for _ in range(count):
+            allocator.reserve()
+        elapsed = time.perf_counter() - start
+        failed |= count / elapsed < TARGET_IDS_PER_SECOND
+        print(f"one at a time  {elapsed * 1000:8.1f} ms  {count / elapsed:12,.0f} ids/s")
+
+        start = time.perf_counter()
+        allocator.reserve(count)
+        elapsed = time.perf_counter() - start
+        print(f"one block      {elapsed * 1000:8.1f} ms")
+        allocator.close()
+
+        path = os.path.join(directory, "shared.ids.json")
+        start = time.perf_counter()
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(allocate, [(path, count // processes)] * processes)
+        elapsed = time.perf_counter() - start
+        ids = [expense_id for result in results for expense_id in result]
+        unique = len(set(ids)) == len(ids)
+        increasing = all(result == sorted(result) for result in results)
+        failed |= not (unique and increasing)
+        print(f"{processes} processes    {elapsed * 1000:8.1f} ms  unique: {unique}  increasing: {increasing}")
+    if failed:
+        print(f"duplicate ids or below target of {TARGET_IDS_PER_SECOND:,} ids/s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Measure bulk import throughput for CSV and JSON Lines files.
+
+Writes a synthetic bank-statement export (about 1% invalid rows), imports it
+into an empty ledger serially and with a process pool, then imports it again
+to time a run where every row is a duplicate. Exits with status 1 if a
+first import falls below the target rate.
+
+Usage: python benchmarks/bench_import.py [rows] [workers]
+"""
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_tracker import ExpenseManager
+
+
+TARGET_ROWS_PER_SECOND = 100_000
+NOTES = ["UPI/Swiggy", "Metro card top-up", "Weekly veggies", "Netflix", "Electricity bill", "Pharmacy", ""]
+
+
+def make_rows(rows: int, seed: int = 7):
+    rng = random.Random(seed)
+    categories = ExpenseManager.DEFAULT_CATEGORIES
+    for i in range(rows):
+        row = {"date": f"{rng.randint(2020, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+               "amount": f"{rng.uniform(1, 5000):.2f}",
+               "category": rng.choice(categories).lower(),
+               "description": f"{rng.choice(NOTES)} #{i}"}
+        if rng.random() < 0.01:
+            row[rng.choice(["amount", "category", "date"])] = "n/a"
+        yield row
+
+
+def write_files(directory: str, rows: int):
+    csv_path = os.path.join(directory, "statement.csv")
+    jsonl_path = os.path.join(directory, "statement.jsonl")
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, ["date", "amount", "category", "description"])
+        writer.writeheader()
+        writer.writerows(make_rows(rows))
+    with open(jsonl_path, 'w') as f:
+        for row in make_rows(rows):
+            f.write(json.dumps(row) + "\n")
+    return csv_path, jsonl_path
+
+
+def timed_import(data_file: str, path: str, workers: int):
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = ExpenseManager(data_file)
+        start = time.perf_counter()
+        result = manager.import_file(path, workers=workers)
+        elapsed = time.perf_counter() - start
+    return result, elapsed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else min(os.cpu_count() or 1, 4)
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path, jsonl_path = write_files(directory, rows)
+        print(f"rows: {rows}  (includes save of the resulting ledger)")
+        for name, path in (("csv", csv_path), ("jsonl", jsonl_path)):
+            runs = [("serial", 1)] + ([(f"{workers} workers", workers)] if workers > 1 else [])
+            for label, pool in runs:
+                data_file = os.path.join(directory, f"{name}-{pool}.json")
+                result, elapsed = timed_import(data_file, path, pool)
+                rate = rows / elapsed
+                failed |= rate < TARGET_ROWS_PER_SECOND
+                print(f"{name:5} {label:10}  {elapsed:6.2f} s  {rate:10,.0f} rows/s  "
+                      f"added {result.added}  rejected {len(result.rejects)}")
+            result, elapsed = timed_import(data_file, path, 1)
+            print(f"{name:5} {'re-import':10}  {elapsed:6.2f} s  {rows / elapsed:10,.0f} rows/s  "
+                  f"duplicates {result.duplicates}")
+    if failed:
+        print(f"below target of {TARGET_ROWS_PER_SECOND:,} rows/s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Compare aggregation over integer paise with the old float rupees.
+
+Builds a synthetic ledger (benchmarks/synthetic.py) and times the same
+aggregation code over float amounts and over integer paise: the running
+aggregates (ExpenseManager._accumulate), the columnar summary and a report
+Partial. Also shows how far float sums drift from the exact totals, what
+converting a legacy float ledger costs, and loading a legacy ledger against
+one already in paise. Exits with status 1 if an integer aggregate is more
+than --threshold slower than its float counterpart.
+
+Usage: python benchmarks/bench_money.py [--rows 200000] [--repeat 5] [--threshold 0.1]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_columnar import ColumnarExpenseList
+from expense_money import format_minor, to_minor
+from expense_reports import Partial, make_spec
+from expense_tracker import Expense, ExpenseManager
+from synthetic import generate
+
+
+def best_of(repeat: int, function) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed slowdown of integer sums")
+    args = parser.parse_args()
+
+    rows = list(generate(args.rows))
+    as_rupees = [dict(row, amount=row["paise"] / 100) for row in rows]
+    for row in as_rupees:
+        del row["paise"]
+    # _accumulate only reads .paise, .category and .date, so the float run
+    # goes through the same code with rupee floats in that slot
+    float_expenses = [SimpleNamespace(paise=row["amount"], category=row["category"], date=row["date"])
+                      for row in as_rupees]
+    expenses = [Expense.from_dict(row) for row in rows]
+    float_rows = [(row["category"], row["date"], row["amount"]) for row in as_rupees]
+    int_rows = [(row["category"], row["date"], row["paise"]) for row in rows]
+    specs = [make_spec(["category", "month"], ["sum", "count", "min", "max"])]
+    columnar = ColumnarExpenseList(ExpenseManager.DEFAULT_CATEGORIES, expenses)
+
+    print(f"rows: {args.rows}, best of {args.repeat}")
+    print(f"{'aggregate':12} {'float ms':>9} {'paise ms':>9} {'ratio':>6}")
+    failed = False
+    for name, run_float, run_int in (
+            ("running", lambda: ExpenseManager._accumulate(float_expenses, 0.0, {}, {}, {}),
+             lambda: ExpenseManager._accumulate(expenses, 0, {}, {}, {})),
+            ("report", lambda: Partial(specs).add_rows(float_rows),
+             lambda: Partial(specs).add_rows(int_rows))):
+        float_time = best_of(args.repeat, run_float)
+        int_time = best_of(args.repeat, run_int)
+        ratio = int_time / float_time
+        failed |= ratio > 1 + args.threshold
+        print(f"{name:12} {float_time * 1000:9.1f} {int_time * 1000:9.1f} {ratio:6.2f}")
+    columnar_time = best_of(args.repeat, columnar.compute_aggregates)
+    print(f"{'columnar':12} {'':>9} {columnar_time * 1000:9.1f}")
+
+    exact, _, category_totals, _ = ExpenseManager._accumulate(expenses, 0, {}, {}, {})
+    drifted, _, float_totals, _ = ExpenseManager._accumulate(float_expenses, 0.0, {}, {}, {})
+    off = sum(float_totals[category][0] != entry[0] / 100 for category, entry in category_totals.items())
+    print(f"exact total Rs.{format_minor(exact)}, float sum {drifted!r}; "
+          f"{off} of {len(category_totals)} category float sums are off the exact total")
+
+    amounts = [row["amount"] for row in as_rupees]
+    convert_time = best_of(args.repeat, lambda: [to_minor(amount) for amount in amounts])
+    lossless = all(to_minor(row["amount"]) == original["paise"] for row, original in zip(as_rupees, rows))
+    print(f"legacy conversion: {args.rows / convert_time:,.0f} amounts/s, lossless: {lossless}")
+    failed |= not lossless
+
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        times = {}
+        for name, data in (("legacy", as_rupees), ("paise", rows)):
+            path = os.path.join(directory, f"{name}.json")
+            with open(path, 'w') as f:
+                json.dump(data, f)
+            times[name] = best_of(args.repeat, lambda: ExpenseManager(path))
+    print(f"load: legacy {times['legacy'] * 1000:.0f} ms, paise {times['paise'] * 1000:.0f} ms")
+
+    if failed:
+        print(f"integer aggregation regressed by more than {args.threshold:.0%} or conversion was lossy")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measure cold and warm start-up of the tracker on a synthetic ledger.
+
+Every start runs in a fresh interpreter and loads the ledger the way the
+GUI does (create_manager(cache=True, load=False) plus iter_load). A cold
+start has no binary cache and parses the JSON; it leaves the cache behind,
+so the starts after it are warm. Reported per start, from process launch:
+when the window could appear (interpreter and imports done), when the
+first rows are available and when the whole ledger is in memory.
+
+Usage: python benchmarks/bench_startup.py [rows] [warm runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import write_ledger
+
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import expense_tracker_gui
+from expense_tracker import create_manager
+imported = time.perf_counter()
+manager = create_manager({path!r}, cache=True, load=False)
+first = None
+for count in manager.iter_load(batch_size=5000):
+    if first is None and count:
+        first = time.perf_counter()
+loaded = time.perf_counter()
+print(json.dumps({{"window": imported - start, "first_rows": (first or loaded) - start,
+                  "loaded": loaded - start, "count": count}}))
+"""
+
+
+def start_once(path: str) -> dict:
+    launched = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", CHILD.format(root=ROOT, path=path)],
+                            check=True, capture_output=True, text=True).stdout
+    total = time.perf_counter() - launched
+    timings = json.loads(output.strip().splitlines()[-1])
+    # Child timings start after interpreter start-up; add it back in
+    startup = total - timings["loaded"]
+    return {name: value + startup if name != "count" else value for name, value in timings.items()}
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    warm_runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_ledger(os.path.join(directory, "expenses.json"), rows)
+        cold = start_once(path)
+        if not os.path.exists(path + ".cache"):
+            print("cold start did not write a cache")
+            sys.exit(1)
+        warm = [start_once(path) for _ in range(warm_runs)]
+
+    print(f"rows: {rows}  (seconds from process launch; warm = median of {warm_runs})")
+    print(f"{'':6} {'window':>8} {'first rows':>11} {'loaded':>8}")
+    for label, timings in (("cold", [cold]), ("warm", warm)):
+        window, first, loaded = (statistics.median(run[name] for run in timings)
+                                 for name in ("window", "first_rows", "loaded"))
+        print(f"{label:6} {window:8.3f} {first:11.3f} {loaded:8.3f}")
+    speedup = cold["loaded"] / statistics.median(run["loaded"] for run in warm)
+    print(f"warm start loads {speedup:.1f}x faster than cold")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Time ExpenseManager's hot paths on deterministic synthetic ledgers.
+
+For each ledger size a ledger is generated (benchmarks/synthetic.py), then
+load, save, add, update, delete, id lookup, filtering, the summary report
+and, when a display is available, the GUI list refresh are timed. Each
+operation reports p50/p90/p99/max latency; each size also reports the peak
+traced memory of a load. Mutations run with saves deferred, as in the GUI,
+so their timings exclude the snapshot write that save_expenses measures.
+
+Results are written as JSON. With --baseline the run is compared against
+an earlier results file and exits with status 1 if any operation's median
+(or the load's peak memory) grew by more than --threshold.
+
+Usage: python benchmarks/bench_suite.py [--sizes 10000,100000] [--samples 200]
+           [--output results.json] [--baseline old.json] [--threshold 0.25] [--columnar]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_reports import percentile
+from expense_tracker import ExpenseManager
+from synthetic import LAST_YEAR, NOTES, write_ledger
+
+
+# Medians below this many ms apart are noise, whatever the ratio
+MIN_DELTA_MS = 0.05
+# Row budget for operations that scan the whole ledger: fewer samples on big ledgers
+SCAN_BUDGET = 20_000_000
+
+
+def summarize(seconds: List[float]) -> Dict[str, float]:
+    ordered = sorted(seconds)
+    stats = {"samples": len(ordered), "mean_ms": sum(ordered) / len(ordered) * 1000}
+    for q in (50, 90, 99):
+        stats[f"p{q}_ms"] = percentile(ordered, q) * 1000
+    stats["max_ms"] = ordered[-1] * 1000
+    return stats
+
+
+def time_calls(func: Callable, calls: List[tuple], before: Optional[Callable] = None) -> Dict[str, float]:
+    """Time func(*args) for each args in calls; before() runs untimed first"""
+    seconds = []
+    for args in calls:
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        func(*args)
+        seconds.append(time.perf_counter() - start)
+    return summarize(seconds)
+
+
+def refresh_timings(data_file: str, repeat: int) -> Optional[Dict[str, float]]:
+    """Time ExpenseTrackerGUI.refresh_expense_list, or None without a display"""
+    try:
+        import tkinter
+        from expense_tracker_gui import ExpenseTrackerGUI
+    except ImportError:
+        return None
+    try:
+        gui = ExpenseTrackerGUI(data_file)
+    except tkinter.TclError:
+        return None
+    try:
+        def refresh():
+            gui.refresh_expense_list()
+            gui.root.update_idletasks()
+        return time_calls(refresh, [()] * repeat)
+    finally:
+        gui.on_close()
+
+
+def bench_size(size: int, directory: str, samples: int, seed: int, columnar: bool) -> Dict:
+    data_file = write_ledger(os.path.join(directory, f"ledger-{size}.json"), size, seed)
+    rng = random.Random(seed)
+    heavy = max(1, min(5, SCAN_BUDGET // 4 // size))
+    scans = max(3, min(samples, SCAN_BUDGET // size))
+    operations = {}
+
+    manager = ExpenseManager(data_file, columnar=columnar)
+    categories = manager.categories
+    operations["load_expenses"] = time_calls(manager.load_expenses, [()] * heavy)
+    operations["save_expenses"] = time_calls(manager.save_expenses, [()] * heavy)
+
+    manager.save_scheduler = lambda: None
+    ids = rng.sample(range(1, size + 1), min(samples, size))
+    operations["get_expense_by_id"] = time_calls(manager.get_expense_by_id, [(i,) for i in ids])
+    operations["add_expense"] = time_calls(
+        manager.add_expense,
+        [(round(rng.uniform(1, 500), 2), rng.choice(categories), rng.choice(NOTES)) for _ in range(samples)])
+    operations["update_expense"] = time_calls(
+        lambda expense_id, amount: manager.update_expense(expense_id, amount=amount),
+        [(i, round(rng.uniform(1, 500), 2)) for i in ids])
+
+    months = [f"{year}-{month:02d}" for year in range(LAST_YEAR - 4, LAST_YEAR + 1) for month in range(1, 13)]
+    operations["filter_category"] = time_calls(
+        lambda category: manager.filter_expenses(filter_category=category),
+        [(rng.choice(categories),) for _ in range(scans)])
+    operations["filter_month"] = time_calls(
+        lambda month: manager.filter_expenses(date_from=month + "-01", date_to=month + "-31"),
+        [(rng.choice(months),) for _ in range(samples)])
+    operations["query_text"] = time_calls(
+        lambda word: manager.query(text=word, limit=100),
+        [(rng.choice(["veggies", "metro", "rent", "taxi airport"]),) for _ in range(samples)])
+    operations["view_expenses"] = time_calls(
+        lambda category, month: manager.view_expenses(category, date_from=month + "-01", date_to=month + "-07"),
+        [(rng.choice(categories), rng.choice(months)) for _ in range(scans)])
+    operations["get_summary_report"] = time_calls(
+        manager.get_summary_report, [()] * heavy, before=manager.report_cache.clear)
+    operations["get_summary_report_cached"] = time_calls(manager.get_summary_report, [()] * samples)
+    operations["delete_expense"] = time_calls(manager.delete_expense, [(i,) for i in ids])
+    del manager
+
+    gui = refresh_timings(data_file, min(samples, 50))
+    if gui is not None:
+        operations["gui_refresh_expense_list"] = gui
+
+    tracemalloc.start()
+    manager = ExpenseManager(data_file, columnar=columnar)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del manager
+    memory = {"ledger_mb": current / 2**20, "load_peak_mb": peak / 2**20}
+    return {"operations": operations, "memory": memory}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Describe every result that regressed past threshold against baseline"""
+    regressions = []
+    for size, current in results["sizes"].items():
+        before = baseline.get("sizes", {}).get(size)
+        if before is None:
+            continue
+        for name, stats in current["operations"].items():
+            old = before["operations"].get(name)
+            if old is None:
+                continue
+            if (stats["p50_ms"] > old["p50_ms"] * (1 + threshold)
+                    and stats["p50_ms"] - old["p50_ms"] > MIN_DELTA_MS):
+                regressions.append(f"{size} rows {name}: p50 {old['p50_ms']:.3f} -> {stats['p50_ms']:.3f} ms")
+        old_peak, peak = before["memory"]["load_peak_mb"], current["memory"]["load_peak_mb"]
+        if peak > old_peak * (1 + threshold):
+            regressions.append(f"{size} rows load peak memory: {old_peak:.1f} -> {peak:.1f} MB")
+    return regressions
+
+
+def print_size(size: str, result: Dict) -> None:
+    print(f"\n{size} rows  (load peak {result['memory']['load_peak_mb']:.1f} MB, "
+          f"ledger {result['memory']['ledger_mb']:.1f} MB)")
+    print(f"  {'operation':28} {'n':>5} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for name, stats in result["operations"].items():
+        print(f"  {name:28} {stats['samples']:>5} {stats['p50_ms']:>10.3f} {stats['p90_ms']:>10.3f} "
+              f"{stats['p99_ms']:>10.3f} {stats['max_ms']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ExpenseManager hot paths")
+    parser.add_argument("--sizes", default="10000,100000",
+                        help="comma-separated ledger sizes (10000 to 10000000)")
+    parser.add_argument("--samples", type=int, default=200, help="calls timed per cheap operation")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--columnar", action="store_true", help="use the columnar store")
+    parser.add_argument("--output", default="bench_results.json", help="JSON results file")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown as a fraction (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "generated": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "samples": args.samples,
+            "columnar": args.columnar,
+        },
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, 'w') as devnull:
+        for size in (int(size) for size in args.sizes.split(",")):
+            with contextlib.redirect_stdout(devnull):
+                result = bench_size(size, directory, args.samples, args.seed, args.columnar)
+            results["sizes"][str(size)] = result
+            print_size(str(size), result)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Load-test the JSON API server (expense_server.py).
+
+Starts a server on a synthetic ledger in a subprocess (or targets --url)
+and runs --clients threads for --duration seconds. Each client keeps one
+keep-alive connection and sends a weighted mix of requests:
+  - page     GET /expenses, a month's page in one or two categories
+  - get      GET /expenses/<id>
+  - summary  GET /summary, revalidated with If-None-Match when it has an ETag
+  - report   GET /report?group_by=category,month
+  - write    POST /expenses with --batch expenses
+Reports requests per second overall and count, p50 and p99 latency per
+kind, plus how many answers were 304 Not Modified. Exits with status 1 if
+any request failed.
+
+Usage: python benchmarks/load_test.py [--rows 100000] [--clients 8] [--duration 10]
+           [--writes 0.1] [--batch 1] [--journal] [--url http://127.0.0.1:8765] [--output results.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from expense_reports import percentile
+from expense_tracker import ExpenseManager
+from synthetic import LAST_YEAR, NOTES, write_ledger
+
+
+def start_server(ledger: str, workers: int, journal: bool) -> Tuple[subprocess.Popen, str]:
+    """Run expense_server.py on a free port; returns the process and its URL"""
+    command = [sys.executable, os.path.join(ROOT, "expense_server.py"), ledger, "--port", "0",
+               "--workers", str(workers)]
+    if journal:
+        command.append("--journal")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    for line in process.stdout:
+        if line.startswith("Serving"):
+            return process, line.split(" on ")[1].split()[0].rstrip("/")
+    raise RuntimeError("server exited before it started listening")
+
+
+class Client(threading.Thread):
+
+    def __init__(self, url: str, seed: int, deadline: float, write_share: float, batch: int,
+                 categories: List[str], max_id: int):
+        super().__init__(daemon=True)
+        address = urlsplit(url)
+        self.connection = http.client.HTTPConnection(address.hostname, address.port, timeout=60)
+        self.rng = random.Random(seed)
+        self.deadline = deadline
+        self.batch = batch
+        self.categories = categories
+        self.max_id = max_id
+        read_share = 1 - write_share
+        self.kinds = ["page", "get", "summary", "report", "write"]
+        self.weights = [read_share * 0.4, read_share * 0.3, read_share * 0.2, read_share * 0.1, write_share]
+        self.summary_etag = None
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.not_modified = 0
+        self.failures: List[str] = []
+
+    def request(self, method: str, path: str, body=None, headers=None) -> Tuple[int, http.client.HTTPResponse]:
+        data = json.dumps(body) if body is not None else None
+        self.connection.request(method, path, data, headers or {})
+        response = self.connection.getresponse()
+        response.read()
+        return response.status, response
+
+    def run(self):
+        rng = self.rng
+        while time.perf_counter() < self.deadline:
+            kind = rng.choices(self.kinds, self.weights)[0]
+            month = f"{LAST_YEAR - rng.randrange(5)}-{rng.randint(1, 12):02d}"
+            start = time.perf_counter()
+            try:
+                if kind == "page":
+                    categories = ",".join(rng.sample(self.categories, rng.randint(1, 2)))
+                    status, _ = self.request("GET", f"/expenses?category={categories}&date_from={month}-01"
+                                                    f"&date_to={month}-28&limit=50")
+                elif kind == "get":
+                    status, _ = self.request("GET", f"/expenses/{rng.randint(1, self.max_id)}")
+                elif kind == "summary":
+                    headers = {"If-None-Match": self.summary_etag} if self.summary_etag else {}
+                    status, response = self.request("GET", "/summary", headers=headers)
+                    self.summary_etag = response.getheader("ETag")
+                elif kind == "report":
+                    status, _ = self.request("GET", "/report?group_by=category,month&stats=sum,count")
+                else:
+                    items = [{"amount": round(rng.lognormvariate(5, 1), 2), "category": rng.choice(self.categories),
+                              "note": rng.choice(NOTES), "date": f"{month}-{rng.randint(1, 28):02d}"}
+                             for _ in range(self.batch)]
+                    status, _ = self.request("POST", "/expenses", items)
+            except (OSError, http.client.HTTPException) as e:
+                self.failures.append(f"{kind}: {e}")
+                break
+            self.latencies[kind].append(time.perf_counter() - start)
+            if status == 304:
+                self.not_modified += 1
+            elif status >= 400 and not (kind == "get" and status == 404):
+                self.failures.append(f"{kind}: HTTP {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--url", help="test a running server instead of starting one")
+    parser.add_argument("--rows", type=int, default=100_000, help="size of the generated ledger")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--writes", type=float, default=0.1, help="share of requests that add expenses")
+    parser.add_argument("--batch", type=int, default=1, help="expenses per write request")
+    parser.add_argument("--journal", action="store_true", help="start the server in journal mode")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the results here as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        process = None
+        url = args.url
+        if url is None:
+            ledger = write_ledger(os.path.join(directory, "expenses.json"), args.rows, args.seed)
+            process, url = start_server(ledger, args.clients * 2, args.journal)
+        try:
+            deadline = time.perf_counter() + args.duration
+            clients = [Client(url, args.seed * 1000 + i, deadline, args.writes, args.batch,
+                              ExpenseManager.DEFAULT_CATEGORIES, args.rows) for i in range(args.clients)]
+            started = time.perf_counter()
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    for client in clients:
+        for kind, seconds in client.latencies.items():
+            latencies[kind].extend(seconds)
+    every = sorted(second for seconds in latencies.values() for second in seconds)
+    failures = [failure for client in clients for failure in client.failures]
+    results = {
+        "clients": args.clients, "seconds": elapsed, "requests": len(every),
+        "rps": len(every) / elapsed,
+        "p50_ms": percentile(every, 50) * 1000 if every else None,
+        "p99_ms": percentile(every, 99) * 1000 if every else None,
+        "not_modified": sum(client.not_modified for client in clients),
+        "failures": len(failures),
+        "kinds": {kind: {"count": len(seconds), "p50_ms": percentile(sorted(seconds), 50) * 1000,
+                         "p99_ms": percentile(sorted(seconds), 99) * 1000}
+                  for kind, seconds in sorted(latencies.items())},
+    }
+
+    print(f"{results['requests']} requests from {args.clients} clients in {elapsed:.1f}s: "
+          f"{results['rps']:.0f} req/s, p50 {results['p50_ms'] or 0:.2f} ms, p99 {results['p99_ms'] or 0:.2f} ms")
+    print(f"{'':8} {'count':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for kind, stats in results["kinds"].items():
+        print(f"{kind:8} {stats['count']:7} {stats['p50_ms']:8.2f} {stats['p99_ms']:8.2f}")
+    print(f"304 Not Modified: {results['not_modified']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if failures:
+        print(f"{len(failures)} requests failed, e.g. {failures[:3]}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
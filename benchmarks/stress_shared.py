@@ -0,0 +1,102 @@
+"""Hammer one shared ledger from several processes at once.
+
+Each worker opens the ledger the way run.py --shared does (shared mode
+plus the binary cache), adds expenses and deletes about a third of the
+ones it added, with a small compaction threshold so snapshots are
+rewritten while other processes are appending. Afterwards the ledger must hold exactly the
+expenses that were added and not deleted, with no duplicate ids.
+
+Usage: python benchmarks/stress_shared.py [processes] [operations per process]
+"""
+import contextlib
+import io
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_tracker import ExpenseManager, create_manager
+
+
+def worker(data_file: str, worker_id: int, operations: int, results) -> None:
+    rng = random.Random(worker_id)
+    added = []
+    deleted = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = create_manager(data_file, cache=True, history=False, shared=True, compact_threshold=200)
+        for i in range(operations):
+            if added and rng.random() < 0.25:
+                expense_id = added.pop(rng.randrange(len(added)))
+                if not manager.delete_expense(expense_id):
+                    raise RuntimeError(f"worker {worker_id} could not delete {expense_id}")
+                deleted.append(expense_id)
+            else:
+                if not manager.add_expense(round(rng.uniform(1, 500), 2), "Food", f"w{worker_id}-{i}"):
+                    raise RuntimeError(f"worker {worker_id} could not add an expense")
+                added.append(manager.ids.next - 1)
+    results.put((worker_id, added, deleted))
+
+
+def collect(results, workers) -> list:
+    """Each worker's result. A worker that raised never sends one, so this
+    stops waiting once every worker has exited."""
+    outcomes = []
+    while len(outcomes) < len(workers):
+        try:
+            outcomes.append(results.get(timeout=1))
+        except queue.Empty:
+            if all(process.exitcode is not None for process in workers):
+                break
+    return outcomes
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    with tempfile.TemporaryDirectory() as directory:
+        data_file = os.path.join(directory, "expenses.json")
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=worker, args=(data_file, n, operations, results))
+                   for n in range(processes)]
+        start = time.perf_counter()
+        for process in workers:
+            process.start()
+        outcomes = collect(results, workers)
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - start
+        crashed = [n for n, process in enumerate(workers) if process.exitcode]
+        if crashed:
+            # Their expenses are unknown, so the ledger cannot be checked
+            print(f"FAILED: worker {', '.join(map(str, crashed))} exited with an error")
+            sys.exit(1)
+
+        expected = set()
+        for worker_id, added, deleted in outcomes:
+            expected.update(added)
+        with contextlib.redirect_stdout(io.StringIO()):
+            final = ExpenseManager(data_file)
+        ids = [expense.id for expense in final.expenses]
+
+    total_operations = processes * operations
+    print(f"{processes} processes x {operations} operations in {elapsed:.2f}s "
+          f"({total_operations / elapsed:.0f} ops/s)")
+    failures = []
+    if len(ids) != len(set(ids)):
+        failures.append(f"{len(ids) - len(set(ids))} duplicate ids")
+    if set(ids) != expected:
+        failures.append(f"{len(expected - set(ids))} expenses lost, {len(set(ids) - expected)} unexpected")
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print(f"OK: {len(ids)} expenses, no lost records, no duplicate ids")
+
+
+if __name__ == "__main__":
+    main()
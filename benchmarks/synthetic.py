@@ -0,0 +1,56 @@
+"""Deterministic synthetic ledgers for benchmarks.
+
+The same (count, seed, years) always yields the same expenses, so timings
+from different runs and machines are measured on identical data.
+
+Usage: python benchmarks/synthetic.py rows output.json [seed] [years]
+"""
+import os
+import random
+import sys
+from datetime import date as Date
+from typing import Dict, Iterator, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_storage import write_snapshot
+from expense_tracker import ExpenseManager
+
+
+NOTES = ["Lunch", "Bus pass", "Weekly veggies", "Movie night", "Electricity bill", "Pharmacy",
+         "UPI/Swiggy", "Metro card top-up", "Taxi to airport", "Rent", "Gift for Amma", ""]
+LAST_YEAR = 2025
+
+
+def generate(count: int, seed: int = 1, years: int = 5, categories: Optional[List[str]] = None) -> Iterator[Dict]:
+    """Yield count expense dicts with ids 1..count spread over the last years
+    calendar years up to LAST_YEAR, in ledger (id) order"""
+    rng = random.Random(seed)
+    categories = categories or ExpenseManager.DEFAULT_CATEGORIES
+    first_day = Date(LAST_YEAR - years + 1, 1, 1).toordinal()
+    days = Date(LAST_YEAR, 12, 31).toordinal() - first_day + 1
+    # Categories and amounts are skewed the way real ledgers are: a few
+    # categories dominate and most amounts are small
+    weights = [1 / (rank + 1) for rank in range(len(categories))]
+    for expense_id in range(1, count + 1):
+        yield {
+            "id": expense_id,
+            "paise": max(round(min(rng.lognormvariate(5, 1.2), 100000) * 100), 1),
+            "category": rng.choices(categories, weights)[0],
+            "note": rng.choice(NOTES),
+            "date": Date.fromordinal(first_day + rng.randrange(days)).isoformat(),
+        }
+
+
+def write_ledger(path: str, count: int, seed: int = 1, years: int = 5,
+                 categories: Optional[List[str]] = None) -> str:
+    """Write a synthetic expenses.json to path, streaming, and return path"""
+    write_snapshot(path, generate(count, seed, years, categories), flat=True)
+    return path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(2)
+    write_ledger(sys.argv[2], int(sys.argv[1]), *(int(arg) for arg in sys.argv[3:5]))
@@ -0,0 +1,217 @@
+import argparse
+import math
+import sys
+from bisect import bisect_left, insort
+from collections import deque
+from datetime import date as Date
+from itertools import compress, count, islice
+from operator import and_, eq, itemgetter, sub
+from typing import List, Dict, FrozenSet, Iterable, Iterator, Optional, Tuple
+
+from expense_money import format_minor
+from expense_query import tokenize
+
+
+# (id, paise, category, note, date, currency, original), as ExpenseManager._export_rows() yields them
+LedgerRow = Tuple[int, int, str, str, str, Optional[str], Optional[int]]
+
+KINDS = ("duplicate", "near-duplicate", "outlier")
+# A near-duplicate candidate is compared with at most this many earlier rows
+# of the same amount and category, so a burst of identical charges stays linear
+MAX_COMPARE = 50
+
+
+class Finding:
+    """Expenses worth a second look: a group of duplicates or one outlier"""
+
+    __slots__ = ("kind", "rows", "reason")
+
+    def __init__(self, kind: str, rows: List[LedgerRow], reason: str):
+        self.kind = kind
+        self.rows = rows
+        self.reason = reason
+
+    @property
+    def ids(self) -> List[int]:
+        return [row[0] for row in self.rows]
+
+    def __str__(self) -> str:
+        return f"{self.kind.capitalize()}: {self.reason} (ids {', '.join(map(str, self.ids))})"
+
+
+class AnomalyReport:
+    """Findings of one scan, duplicates first, each kind in date order"""
+
+    def __init__(self, rows: int, findings: List[Finding]):
+        self.rows = rows
+        self.findings = findings
+
+    def of_kind(self, kind: str) -> List[Finding]:
+        return [finding for finding in self.findings if finding.kind == kind]
+
+    def __str__(self) -> str:
+        counts = {kind: len(self.of_kind(kind)) for kind in KINDS}
+        return (f"Checked {self.rows} expenses: {counts['duplicate']} duplicate groups, "
+                f"{counts['near-duplicate']} near-duplicate groups, {counts['outlier']} outliers")
+
+
+def similar_words(first: FrozenSet[str], second: FrozenSet[str], threshold: float) -> bool:
+    """Whether two notes' words overlap by at least threshold of their union
+    (Jaccard similarity); two empty notes count as similar"""
+    if not first and not second:
+        return True
+    return len(first & second) >= threshold * len(first | second)
+
+
+def _root(parents: Dict[int, int], position: int) -> int:
+    while parents.get(position, position) != position:
+        grandparent = parents.get(parents[position], parents[position])
+        parents[position] = grandparent
+        position = grandparent
+    return position
+
+
+def _close_runs(members: List[Tuple[int, int, int]], days: int) -> Iterator[List[Tuple[int, int, int]]]:
+    """Yield the runs of members, (day, row, paise) sorted by amount then
+    date, whose neighbours share the amount and are at most days apart.
+    Rows outside every run cannot be duplicates of anything. The neighbour
+    tests run in map() and compress(), so a row costs no Python bytecode
+    unless it has such a neighbour."""
+    amounts = list(map(itemgetter(2), members))
+    dates = list(map(itemgetter(0), members))
+    same = map(eq, amounts, islice(amounts, 1, None))
+    near = map(days.__ge__, map(sub, islice(dates, 1, None), dates))
+    first = last = None  # members[first:last + 2] is the run being collected
+    for i in compress(count(), map(and_, same, near)):
+        if last is not None and i == last + 1:
+            last = i
+            continue
+        if first is not None:
+            yield members[first:last + 2]
+        first = last = i
+    if first is not None:
+        yield members[first:last + 2]
+
+
+def _link_duplicates(rows: List[LedgerRow], run: List[Tuple[int, int, int]], days: int, similarity: float,
+                     words: Dict[str, FrozenSet[str]], exact: Dict[int, int], near: Dict[int, int]) -> None:
+    """Union the duplicate pairs in run, rows of one amount and category in
+    date order, comparing each row only with the earlier ones inside the
+    sliding window of days"""
+    members = []  # (day, row, note words)
+    for day, position, _ in run:
+        note = rows[position][3]
+        note_words = words.get(note)
+        if note_words is None:
+            note_words = words[note] = frozenset(tokenize(note))
+        members.append((day, position, note_words))
+    start = 0
+    for i, (day, position, note_words) in enumerate(members):
+        while members[start][0] < day - days:
+            start += 1
+        for earlier_day, earlier, earlier_words in members[max(start, i - MAX_COMPARE):i]:
+            if earlier_day == day and earlier_words == note_words:
+                exact[_root(exact, position)] = _root(exact, earlier)
+            elif similar_words(earlier_words, note_words, similarity):
+                near[_root(near, position)] = _root(near, earlier)
+
+
+def find_anomalies(rows: Iterable[LedgerRow], days: int = 3, similarity: float = 0.5, window: int = 50,
+                   spread: float = 3.0, factor: float = 3.0, min_history: int = 10) -> AnomalyReport:
+    """Scan rows for three kinds of finding, without comparing every pair
+    of rows:
+
+    - duplicate: rows with the same amount, category, date and note words
+      (ignoring case and punctuation).
+    - near-duplicate: rows with the same amount and category, dated at most
+      days apart, whose notes share at least similarity of their words.
+    - outlier: a row far above the rolling median of the previous window
+      expenses of its category (in date order), once min_history came
+      before it. Far means at least factor times the median and above the
+      upper quartile by more than spread interquartile ranges, measured on
+      a log scale as amounts are skewed.
+
+    Each category's rows are sorted by date, and that list stably sorted by
+    amount, so candidate duplicates end up next to each other in date order
+    and only rows inside a sliding window of days are compared. The outlier
+    window is kept sorted, so its median and quartiles are read off by
+    position. Takes O(n log n) time overall.
+    """
+    rows = list(rows)
+    ordinals: Dict[str, int] = {}
+    by_category: Dict[str, List[Tuple[int, int, int]]] = {}  # category -> [(day, row, paise)], in ledger order
+    for position, (_, paise, category, _, date, _, _) in enumerate(rows):
+        day = ordinals.get(date)
+        if day is None:
+            day = ordinals[date] = Date.fromisoformat(date).toordinal()
+        by_category.setdefault(category, []).append((day, position, paise))
+
+    findings = []
+    words: Dict[str, FrozenSet[str]] = {}  # note -> its words, tokenized once per distinct note
+    exact: Dict[int, int] = {}
+    near: Dict[int, int] = {}
+    for category, members in by_category.items():
+        members.sort(key=itemgetter(0))  # stable, so rows stay in ledger order within a day
+
+        for run in _close_runs(sorted(members, key=itemgetter(2)), days):
+            _link_duplicates(rows, run, days, similarity, words, exact, near)
+
+        # Outliers against the rolling window of the category
+        if len(members) <= min_history:
+            continue
+        ordered: List[int] = []  # the window's amounts, sorted
+        recent = deque()  # the window's amounts, oldest first
+        for _, position, paise in members:
+            size = len(ordered)
+            if size >= min_history:
+                median = ordered[size // 2]
+                if paise >= factor * median > 0:
+                    low, high = ordered[size // 4], ordered[(3 * size) // 4]
+                    if low > 0 and math.log(paise) > math.log(high) + spread * (math.log(high) - math.log(low)):
+                        findings.append(Finding("outlier", [rows[position]],
+                                                f"Rs.{format_minor(paise)} in {category} on {rows[position][4]} is "
+                                                f"{paise / median:.1f}x the median Rs.{format_minor(median)} "
+                                                f"of the previous {size}"))
+            insort(ordered, paise)
+            recent.append(paise)
+            if size >= window:
+                del ordered[bisect_left(ordered, recent.popleft())]
+
+    for kind, parents in (("duplicate", exact), ("near-duplicate", near)):
+        groups: Dict[int, List[int]] = {}
+        for position in parents:
+            groups.setdefault(_root(parents, position), []).append(position)
+        for root, positions in groups.items():
+            positions = sorted(set(positions) | {root}, key=lambda position: (rows[position][4], rows[position][0]))
+            members = [rows[position] for position in positions]
+            paise, category, first, last = members[0][1], members[0][2], members[0][4], members[-1][4]
+            if kind == "duplicate":
+                reason = f"{len(members)} x Rs.{format_minor(paise)} in {category} on {first}"
+            else:
+                reason = (f"{len(members)} x Rs.{format_minor(paise)} in {category} between {first} and {last} "
+                          f"with similar notes")
+            findings.append(Finding(kind, members, reason))
+
+    order = {kind: i for i, kind in enumerate(KINDS)}
+    findings.sort(key=lambda finding: (order[finding.kind], finding.rows[0][4], finding.rows[0][0]))
+    return AnomalyReport(len(rows), findings)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="List duplicate and outlier expenses in a ledger")
+    parser.add_argument("ledger", help="expenses.json, a .db file or a partition directory")
+    parser.add_argument("--days", type=int, default=3, help="how far apart near-duplicates may be dated")
+    parser.add_argument("--similarity", type=float, default=0.5, help="share of note words near-duplicates share")
+    parser.add_argument("--factor", type=float, default=3.0, help="minimum multiple of the median for an outlier")
+    args = parser.parse_args(argv)
+
+    from expense_tracker import create_manager
+
+    manager = create_manager(args.ledger)
+    report = manager.find_anomalies(days=args.days, similarity=args.similarity, factor=args.factor)
+    for finding in report.findings:
+        print(finding)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,257 @@
+import calendar
+import heapq
+import json
+import os
+import re
+from datetime import date as Date, timedelta
+from typing import List, Dict, Optional, Tuple
+
+from expense_storage import write_json
+
+
+FREQUENCIES = ("daily", "weekly", "monthly")
+MONTH_PATTERN = re.compile(r"\d{4}-(0[1-9]|1[0-2])$")
+WARN_AT = 0.8  # default share of a budget at which it starts to warn
+
+
+def add_months(day: Date, months: int, anchor_day: int) -> Date:
+    """day moved by months, on anchor_day or the last day of a shorter month"""
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    month += 1
+    return Date(year, month, min(anchor_day, calendar.monthrange(year, month)[1]))
+
+
+class RecurringRule:
+    """An expense repeated every interval days, weeks or months from start
+    until end (inclusive, optional). next_date is the first occurrence that
+    has not been added to the ledger yet, or None once the rule has ended."""
+
+    __slots__ = ("id", "amount", "category", "note", "frequency", "interval", "start", "end", "next_date",
+                 "_anchor_day")
+
+    def __init__(self, amount: float, category: str, note: str, frequency: str, start: str,
+                 end: Optional[str] = None, interval: int = 1, rule_id: int = 0):
+        self.id = rule_id
+        self.amount = amount
+        self.category = category
+        self.note = note
+        self.frequency = frequency
+        self.interval = interval
+        self.start = start
+        self.end = end
+        self.next_date = start if end is None or start <= end else None
+        self._anchor_day = int(start[8:10])  # monthly rules keep this day where the month has it
+
+    def _following(self, day: str) -> Optional[str]:
+        current = Date.fromisoformat(day)
+        if self.frequency == "daily":
+            following = current + timedelta(days=self.interval)
+        elif self.frequency == "weekly":
+            following = current + timedelta(weeks=self.interval)
+        else:
+            following = add_months(current, self.interval, self._anchor_day)
+        following = following.isoformat()
+        return None if self.end is not None and following > self.end else following
+
+    def advance(self, until: str) -> List[str]:
+        """Dates of the occurrences on or before until; next_date moves past them"""
+        dates = []
+        while self.next_date is not None and self.next_date <= until:
+            dates.append(self.next_date)
+            self.next_date = self._following(self.next_date)
+        return dates
+
+    def to_dict(self) -> Dict:
+        return {"id": self.id, "amount": self.amount, "category": self.category, "note": self.note,
+                "frequency": self.frequency, "interval": self.interval, "start": self.start, "end": self.end,
+                "next_date": self.next_date}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'RecurringRule':
+        rule = cls(data["amount"], data["category"], data.get("note", ""), data["frequency"], data["start"],
+                   data.get("end"), data.get("interval", 1), data["id"])
+        rule.next_date = data.get("next_date")
+        return rule
+
+    def __str__(self) -> str:
+        every = self.frequency if self.interval == 1 else f"every {self.interval} {self.frequency}"
+        until = f" until {self.end}" if self.end else ""
+        return (f"Rule {self.id} | {self.category} | Rs.{self.amount:.2f} {every} from {self.start}{until} | "
+                f"Note: {self.note}")
+
+
+class Budget:
+    """A spending limit for one category (None: all categories) in one
+    YYYY-MM month (None: every month)"""
+
+    __slots__ = ("category", "month", "limit", "warn_at")
+
+    def __init__(self, limit: float, category: Optional[str] = None, month: Optional[str] = None,
+                 warn_at: float = WARN_AT):
+        self.limit = limit
+        self.category = category
+        self.month = month
+        self.warn_at = warn_at
+
+    def to_dict(self) -> Dict:
+        return {"limit": self.limit, "category": self.category, "month": self.month, "warn_at": self.warn_at}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Budget':
+        return cls(data["limit"], data.get("category"), data.get("month"), data.get("warn_at", WARN_AT))
+
+
+class BudgetStatus:
+    """How much of a budget one month has used"""
+
+    __slots__ = ("budget", "month", "spent")
+
+    def __init__(self, budget: Budget, month: str, spent: float):
+        self.budget = budget
+        self.month = month
+        self.spent = spent
+
+    @property
+    def utilization(self) -> float:
+        return self.spent / self.budget.limit
+
+    @property
+    def level(self) -> str:
+        """One of ok, warning (from warn_at of the limit) or over (past it)"""
+        if self.spent > self.budget.limit:
+            return "over"
+        if self.spent >= self.budget.limit * self.budget.warn_at:
+            return "warning"
+        return "ok"
+
+    def __str__(self) -> str:
+        return (f"{self.budget.category or 'All categories'} in {self.month}: Rs.{self.spent:.2f} "
+                f"of Rs.{self.budget.limit:.2f} ({self.utilization:.0%})")
+
+
+class BudgetBook:
+    """The recurring rules and budgets of one ledger, kept in a JSON file
+    next to it.
+
+    Rules wait in a heap keyed by next_date, so finding the due ones costs
+    a look at the top of the heap however many rules there are. Budgets are
+    keyed by (category, month), None meaning all categories or every month,
+    so the budgets a change counts against are found with four dict lookups
+    and compared with the manager's running totals instead of the history.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rules: Dict[int, RecurringRule] = {}
+        self.budgets: Dict[Tuple[Optional[str], Optional[str]], Budget] = {}
+        self.next_rule_id = 1
+        self._heap: List[Tuple[str, int]] = []  # (next_date, rule id); stale entries are skipped
+
+    @classmethod
+    def load(cls, path: str) -> 'BudgetBook':
+        book = cls(path)
+        if not os.path.exists(path):
+            return book
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            for rule_data in data.get("rules", []):
+                book._add(RecurringRule.from_dict(rule_data))
+            for budget_data in data.get("budgets", []):
+                book.set_budget(Budget.from_dict(budget_data))
+            book.next_rule_id = max([data.get("next_rule_id", 1)] + [rule_id + 1 for rule_id in book.rules])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error loading budgets from {path}: {e}")
+        return book
+
+    def save(self) -> None:
+        write_json(self.path, {
+            "next_rule_id": self.next_rule_id,
+            "rules": [rule.to_dict() for rule in self.rules.values()],
+            "budgets": [budget.to_dict() for budget in self.budgets.values()],
+        })
+
+    def _add(self, rule: RecurringRule) -> None:
+        self.rules[rule.id] = rule
+        if rule.next_date is not None:
+            heapq.heappush(self._heap, (rule.next_date, rule.id))
+
+    def add_rule(self, rule: RecurringRule) -> RecurringRule:
+        rule.id = self.next_rule_id
+        self.next_rule_id += 1
+        self._add(rule)
+        return rule
+
+    def remove_rule(self, rule_id: int) -> Optional[RecurringRule]:
+        # Its heap entry is dropped lazily by due()
+        return self.rules.pop(rule_id, None)
+
+    def due(self, until: str) -> List[Tuple[RecurringRule, str]]:
+        """Every (rule, date) occurrence on or before until, in date order,
+        advancing the rules past them"""
+        occurrences = []
+        heap = self._heap
+        while heap and heap[0][0] <= until:
+            next_date, rule_id = heap[0]
+            rule = self.rules.get(rule_id)
+            if rule is None or rule.next_date != next_date:
+                heapq.heappop(heap)
+                continue
+            occurrences.extend((rule, day) for day in rule.advance(until))
+            if rule.next_date is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (rule.next_date, rule_id))
+        occurrences.sort(key=lambda occurrence: (occurrence[1], occurrence[0].id))
+        return occurrences
+
+    def rewind(self, occurrences: List[Tuple[RecurringRule, str]]) -> None:
+        """Undo due(): move each rule back to the first of its occurrences,
+        for when they could not be added"""
+        first = {}
+        for rule, day in occurrences:
+            if rule.id not in first or day < first[rule.id][1]:
+                first[rule.id] = (rule, day)
+        for rule, day in first.values():
+            rule.next_date = day
+            # The entry due() left for the later date is now stale and skipped
+            heapq.heappush(self._heap, (day, rule.id))
+
+    def set_budget(self, budget: Budget) -> None:
+        self.budgets[(budget.category, budget.month)] = budget
+
+    def remove_budget(self, category: Optional[str] = None, month: Optional[str] = None) -> Optional[Budget]:
+        return self.budgets.pop((category, month), None)
+
+    def recategorize(self, old: str, new: str) -> bool:
+        """Point the rules and budgets of category old at new. A budget of
+        old is dropped where new already has one for the same month.
+        Returns True if anything changed."""
+        changed = False
+        for rule in self.rules.values():
+            if rule.category == old:
+                rule.category = new
+                changed = True
+        for (category, month), budget in list(self.budgets.items()):
+            if category == old:
+                del self.budgets[(category, month)]
+                budget.category = new
+                self.budgets.setdefault((new, month), budget)
+                changed = True
+        return changed
+
+    def applicable(self, category: str, month: str) -> List[Budget]:
+        """The budgets spending in category during month counts against: the
+        category's own and the all-categories one, a budget set for that
+        month taking precedence over the every-month one"""
+        found = []
+        for key in (category, None):
+            budget = self.budgets.get((key, month)) or self.budgets.get((key, None))
+            if budget is not None:
+                found.append(budget)
+        return found
+
+    def for_month(self, month: str) -> List[Budget]:
+        """Every budget in force during month"""
+        return [budget for (category, budget_month), budget in self.budgets.items()
+                if budget_month == month or (budget_month is None and (category, month) not in self.budgets)]
@@ -0,0 +1,146 @@
+import json
+import os
+import sys
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+from expense_storage import write_json
+
+
+class CategoryRegistry:
+    """The categories of one ledger, kept in a JSON file next to it.
+
+    Every category has a stable integer id and a single interned name
+    string, which all expenses in that category share. Validation is an
+    exact dict lookup and filters resolve names through a lowercase table,
+    so neither scans a list or lowercases rows. version goes up with every
+    change, letting callers tell a stale category list from a current one.
+
+    names is the live list of category names in id order; it is changed in
+    place, so references to it (such as ExpenseManager.categories) stay
+    current.
+    """
+
+    def __init__(self, path: Optional[str], defaults: Iterable[str] = ()):
+        self.path = path
+        self.defaults = list(defaults)
+        self.names: List[str] = []
+        self.version = 0
+        self.next_id = 1
+        self._ids: Dict[str, int] = {}
+        self._folded: Dict[str, str] = {}  # name.lower() -> name
+        self._seen: Optional[Tuple[int, int]] = None
+        self.reload()
+
+    def _identity(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except (OSError, TypeError):
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _clear(self) -> None:
+        del self.names[:]
+        self._ids.clear()
+        self._folded.clear()
+        self.version = 0
+        self.next_id = 1
+
+    def _register(self, name: str, category_id: int) -> None:
+        name = sys.intern(name)
+        self.names.append(name)
+        self._ids[name] = category_id
+        self._folded.setdefault(name.lower(), name)
+        self.next_id = max(self.next_id, category_id + 1)
+
+    def reload(self) -> None:
+        """Read the file, or start from the defaults if there is none"""
+        self._clear()
+        self._seen = self._identity()
+        if self._seen is None:
+            for name in self.defaults:
+                self._register(name, self.next_id)
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            for entry in data["categories"]:
+                self._register(entry["name"], entry["id"])
+            self.version = data.get("version", 0)
+            self.next_id = max(self.next_id, data.get("next_id", 1))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error loading categories from {self.path}: {e}")
+            self._clear()
+            for name in self.defaults:
+                self._register(name, self.next_id)
+
+    def refresh(self) -> bool:
+        """Reload if another process rewrote the file; returns True if so"""
+        if self._identity() == self._seen:
+            return False
+        self.reload()
+        return True
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        write_json(self.path, self.to_dict())
+        self._seen = self._identity()
+
+    def to_dict(self) -> Dict:
+        return {"version": self.version, "next_id": self.next_id,
+                "categories": [{"id": self._ids[name], "name": name} for name in self.names]}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ids
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def id_of(self, name: str) -> Optional[int]:
+        return self._ids.get(name)
+
+    def resolve(self, name: str) -> Optional[str]:
+        """The registered spelling of name, matched ignoring case"""
+        if name in self._ids:
+            return name
+        return self._folded.get(name.lower())
+
+    def add(self, name: str) -> int:
+        """Register a new category and return its id"""
+        category_id = self.next_id
+        self._register(name, category_id)
+        self.version += 1
+        return category_id
+
+    def add_missing(self, names: Iterable[str]) -> bool:
+        """Register any of names not known yet, such as categories found in
+        a ledger written before the registry existed. Returns True if any
+        were added."""
+        missing = [name for name in names if name not in self._ids]
+        for name in missing:
+            self.add(name)
+        return bool(missing)
+
+    def rename(self, old: str, new: str) -> None:
+        """Give category old the name new, keeping its id"""
+        new = sys.intern(new)
+        category_id = self._ids.pop(old)
+        self.names[self.names.index(old)] = new
+        self._ids[new] = category_id
+        self._refold()
+        self.version += 1
+
+    def remove(self, name: str) -> None:
+        """Drop a category, for example once it has been merged into another"""
+        del self._ids[name]
+        self.names.remove(name)
+        self._refold()
+        self.version += 1
+
+    def _refold(self) -> None:
+        self._folded.clear()
+        for name in self.names:
+            self._folded.setdefault(name.lower(), name)
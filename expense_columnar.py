@@ -0,0 +1,202 @@
+from array import array
+from collections import Counter
+from datetime import date as Date
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+try:
+    import numpy
+except ImportError:  # numpy is optional; summaries fall back to plain loops
+    numpy = None
+
+from expense_tracker import Expense
+
+
+class ColumnarExpenseList:
+    """Compact, list-like container that stores expenses column by column.
+
+    ids live in an int64 array, amounts as integer paise, dates as day
+    ordinals and categories as uint16 codes into a small name table that
+    starts out as the manager's categories. Notes are kept in a plain list
+    with repeated strings shared, and the few expenses entered in another
+    currency keep that original amount in a dict by id. Indexing returns a
+    fresh Expense built on demand; write changes back with item assignment.
+    """
+
+    def __init__(self, categories: Iterable[str] = (), expenses: Iterable[Expense] = ()):
+        self.ids = array('q')
+        self.amounts = array('q')  # paise
+        self.dates = array('l')  # date.toordinal()
+        self.category_codes = array('H')
+        self.notes: List[str] = []
+        self.category_names: List[str] = []
+        self._category_lookup: Dict[str, int] = {}
+        self._note_pool: Dict[str, str] = {}
+        self.foreign: Dict[int, Tuple[str, int]] = {}  # id -> (currency, original minor units)
+        for category in categories:
+            self._category_code(category)
+        self.extend(expenses)
+
+    def _category_code(self, category: str) -> int:
+        code = self._category_lookup.get(category)
+        if code is None:
+            code = len(self.category_names)
+            self.category_names.append(category)
+            self._category_lookup[category] = code
+        return code
+
+    def _columns(self, expense: Expense) -> Tuple[int, int, int, int, str]:
+        note = self._note_pool.setdefault(expense.note, expense.note)
+        if expense.foreign is not None:
+            self.foreign[expense.id] = expense.foreign
+        else:
+            self.foreign.pop(expense.id, None)
+        return (expense.id, expense.paise, Date.fromisoformat(expense.date).toordinal(),
+                self._category_code(expense.category), note)
+
+    def _build(self, i: int) -> Expense:
+        expense_id = self.ids[i]
+        return Expense.from_paise(self.amounts[i], self.category_names[self.category_codes[i]], self.notes[i],
+                                  Date.fromordinal(self.dates[i]).isoformat(), expense_id,
+                                  self.foreign.get(expense_id) if self.foreign else None)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[Expense]:
+        for i in range(len(self.ids)):
+            yield self._build(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._build(i) for i in range(*index.indices(len(self.ids)))]
+        if index < 0:
+            index += len(self.ids)
+        if not 0 <= index < len(self.ids):
+            raise IndexError("expense index out of range")
+        return self._build(index)
+
+    def __setitem__(self, index: int, expense: Expense) -> None:
+        expense_id, amount, day, code, note = self._columns(expense)
+        self.ids[index] = expense_id
+        self.amounts[index] = amount
+        self.dates[index] = day
+        self.category_codes[index] = code
+        self.notes[index] = note
+
+    def append(self, expense: Expense) -> None:
+        expense_id, amount, day, code, note = self._columns(expense)
+        self.ids.append(expense_id)
+        self.amounts.append(amount)
+        self.dates.append(day)
+        self.category_codes.append(code)
+        self.notes.append(note)
+
+    def extend(self, expenses: Iterable[Expense]) -> None:
+        for expense in expenses:
+            self.append(expense)
+
+    def pop(self, index: int = -1) -> Expense:
+        expense = self[index]
+        for column in (self.ids, self.amounts, self.dates, self.category_codes, self.notes):
+            del column[index]
+        self.foreign.pop(expense.id, None)
+        return expense
+
+    def remove_ids(self, expense_ids: set) -> List[Expense]:
+        """Drop every row whose id is in expense_ids, returning them as Expenses"""
+        keep = [expense_id not in expense_ids for expense_id in self.ids]
+        removed = [self._build(i) for i, kept in enumerate(keep) if not kept]
+        self.ids = array('q', (v for v, kept in zip(self.ids, keep) if kept))
+        self.amounts = array('q', (v for v, kept in zip(self.amounts, keep) if kept))
+        self.dates = array('l', (v for v, kept in zip(self.dates, keep) if kept))
+        self.category_codes = array('H', (v for v, kept in zip(self.category_codes, keep) if kept))
+        self.notes = [v for v, kept in zip(self.notes, keep) if kept]
+        for expense in removed:
+            self.foreign.pop(expense.id, None)
+        return removed
+
+    def recategorize(self, old: str, new: str) -> None:
+        """Move every row of category old to new. A rename only changes the
+        name table; merging into a category already in it rewrites the code
+        column in one pass."""
+        code = self._category_lookup.pop(old, None)
+        if code is None:
+            return
+        target = self._category_lookup.get(new)
+        if target is None:
+            self.category_names[code] = new
+            self._category_lookup[new] = code
+        else:
+            # old keeps its slot in the name table, but no row refers to it
+            self.category_codes = array('H', (target if value == code else value for value in self.category_codes))
+
+    def report_rows(self) -> Iterator[Tuple[str, str, int]]:
+        """(category, date, paise) per row, without building Expense objects"""
+        dates: Dict[int, str] = {}
+        for day, code, amount in zip(self.dates, self.category_codes, self.amounts):
+            date = dates.get(day)
+            if date is None:
+                date = dates[day] = Date.fromordinal(day).isoformat()
+            yield self.category_names[code], date, amount
+
+    def export_rows(self) -> Iterator[Tuple[int, int, str, str, str, Optional[str], Optional[int]]]:
+        """(id, paise, category, note, date, currency, original) per row,
+        without building Expense objects"""
+        dates: Dict[int, str] = {}
+        no_currency = (None, None)
+        for expense_id, amount, day, code, note in zip(self.ids, self.amounts, self.dates, self.category_codes,
+                                                       self.notes):
+            date = dates.get(day)
+            if date is None:
+                date = dates[day] = Date.fromordinal(day).isoformat()
+            currency, original = self.foreign.get(expense_id, no_currency) if self.foreign else no_currency
+            yield expense_id, amount, self.category_names[code], note, date, currency, original
+
+    def compute_aggregates(self) -> Tuple[int, Dict[str, list], Dict[str, list], Dict[Tuple[str, str], list]]:
+        """Totals and counts by category, month and (category, month), in the
+        same shape as ExpenseManager._compute_aggregates, without building
+        any Expense objects"""
+        # Sum per (category code, date) first: there are far fewer distinct
+        # pairs than rows, so the string work below stays small
+        cells: Dict[Tuple[int, int], list] = {}
+        if numpy is not None and len(self.ids):
+            codes = numpy.frombuffer(self.category_codes, dtype=numpy.uint16).astype(numpy.int64)
+            days = numpy.frombuffer(self.dates, dtype=numpy.dtype(f"i{self.dates.itemsize}")).astype(numpy.int64)
+            amounts = numpy.frombuffer(self.amounts, dtype=numpy.int64)
+            first_day = int(days.min())
+            span = int(days.max()) - first_day + 1
+            keys = codes * span + (days - first_day)
+            unique_keys, inverse = numpy.unique(keys, return_inverse=True)
+            # bincount adds the weights as float64, which is exact for whole
+            # paise up to 2**53 per cell
+            sums = numpy.bincount(inverse, weights=amounts)
+            counts = numpy.bincount(inverse)
+            for key, total, count in zip(unique_keys.tolist(), sums.tolist(), counts.tolist()):
+                cells[(key // span, key % span + first_day)] = [int(total), count]
+        else:
+            keys = [(day << 16) | code for day, code in zip(self.dates, self.category_codes)]
+            sums = dict.fromkeys(keys, 0)
+            for key, amount in zip(keys, self.amounts):
+                sums[key] += amount
+            for key, count in Counter(keys).items():
+                cells[(key & 0xFFFF, key >> 16)] = [sums[key], count]
+
+        total = 0
+        category_totals: Dict[str, list] = {}
+        month_totals: Dict[str, list] = {}
+        category_month_totals: Dict[Tuple[str, str], list] = {}
+        for (code, day), (amount, count) in cells.items():
+            category = self.category_names[code]
+            month = Date.fromordinal(day).isoformat()[:7]
+            total += amount
+            for totals, key in ((category_totals, category),
+                                (month_totals, month),
+                                (category_month_totals, (category, month))):
+                entry = totals.get(key)
+                if entry is None:
+                    totals[key] = [amount, count]
+                else:
+                    entry[0] += amount
+                    entry[1] += count
+
+        return total, category_totals, month_totals, category_month_totals
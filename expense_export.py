@@ -0,0 +1,393 @@
+import argparse
+import csv
+import gzip
+import hashlib
+import json
+import os
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow is optional; the .cols format needs nothing extra
+    pyarrow = None
+
+from expense_money import format_minor
+from expense_storage import atomic_open
+
+
+# One exported row: the ledger row plus what happened to it since the last
+# export. A delete carries only its id.
+FIELDS = ("op", "id", "date", "paise", "amount", "category", "note", "currency", "original")
+# (id, paise, category, note, date, currency, original), as ExpenseManager._export_rows() yields them
+LedgerRow = Tuple[int, int, str, str, str, Optional[str], Optional[int]]
+
+FORMATS = ("jsonl", "csv", "cols", "parquet")
+# Rows per columnar block (a row group in Parquet terms)
+BLOCK_ROWS = 65536
+COLS_MAGIC = b"EXPCOLS1\n"
+
+
+def detect_format(path: str) -> str:
+    """Export format from the file name; a trailing .gz means gzip"""
+    name = path[:-3] if path.endswith(".gz") else path
+    fmt = os.path.splitext(name)[1].lstrip(".").lower()
+    if fmt == "json":
+        fmt = "jsonl"
+    if fmt not in FORMATS:
+        raise ValueError(f"cannot tell the export format of {path!r}; use one of "
+                         f"{', '.join('.' + fmt for fmt in FORMATS)}")
+    if path.endswith(".gz") and fmt in ("cols", "parquet"):
+        raise ValueError(f"{fmt} files are compressed already; drop the .gz")
+    return fmt
+
+
+def row_digest(row: LedgerRow) -> int:
+    """64-bit fingerprint of a ledger row, stable across processes"""
+    expense_id, paise, category, note, date, currency, original = row
+    data = f"{expense_id}\x1f{paise}\x1f{category}\x1f{note}\x1f{date}\x1f{currency}\x1f{original}".encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+class ExportResult:
+    """What an export wrote"""
+
+    def __init__(self, path: str, full: bool):
+        self.path = path
+        self.full = full
+        self.rows = 0  # ledger rows checked
+        self.upserts = 0
+        self.deletes = 0
+
+    def __str__(self) -> str:
+        kind = "Full export" if self.full else "Incremental export"
+        return (f"{kind} to {self.path}: {self.upserts} new or changed and {self.deletes} deleted "
+                f"expenses written ({self.rows} in the ledger)")
+
+
+class Watermark:
+    """What the last export of a target contained, kept in <target>.state.
+
+    That is the id and a fingerprint of every row exported, as two arrays
+    sorted by id. The next export fingerprints the ledger again and writes
+    only the rows that are new or whose fingerprint changed, plus a delete
+    for every id that is gone, so no change is missed whatever backend or
+    process made it. The file is replaced only after the rows were written,
+    so an interrupted export is simply repeated by the next one; readers
+    should treat rows as upserts keyed by id, with the last one winning.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ids = array('q')
+        self.digests = array('Q')
+        self.exports = 0  # number of exports so far
+        self.format = None
+
+    @classmethod
+    def load(cls, path: str) -> Optional['Watermark']:
+        """The watermark in path, or None if there is none (or it is unreadable)"""
+        watermark = cls(path)
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                watermark.exports = header["exports"]
+                watermark.format = header["format"]
+                watermark.ids.fromfile(f, header["rows"])
+                watermark.digests.fromfile(f, header["rows"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, EOFError) as e:
+            print(f"Ignoring unreadable export state {path}: {e}")
+            return None
+        return watermark
+
+    def save(self) -> None:
+        header = {"format": self.format, "exports": self.exports, "rows": len(self.ids),
+                  "time": datetime.now().isoformat(timespec="seconds")}
+        with atomic_open(self.path, 'wb') as f:
+            f.write((json.dumps(header) + "\n").encode('utf-8'))
+            self.ids.tofile(f)
+            self.digests.tofile(f)
+
+    def changes(self, rows: Iterable[LedgerRow], current: 'Watermark') -> Iterator[Tuple[str, LedgerRow]]:
+        """("upsert", row) for every row that is new or changed since this
+        watermark and then ("delete", (id,)) for every id that is gone,
+        while filling current with the fingerprints of rows"""
+        ids, digests = self.ids, self.digests
+        seen = bytearray(len(ids))
+        ordered = True
+        last_id = None
+        for row in rows:
+            expense_id = row[0]
+            digest = row_digest(row)
+            current.ids.append(expense_id)
+            current.digests.append(digest)
+            if last_id is not None and expense_id < last_id:
+                ordered = False
+            last_id = expense_id
+            i = bisect_left(ids, expense_id)
+            if i < len(ids) and ids[i] == expense_id:
+                seen[i] = 1
+                if digests[i] == digest:
+                    continue
+            yield "upsert", row
+        for i in range(len(ids)):
+            if not seen[i]:
+                yield "delete", (ids[i],)
+        if not ordered:
+            pairs = sorted(zip(current.ids, current.digests))
+            current.ids = array('q', (pair[0] for pair in pairs))
+            current.digests = array('Q', (pair[1] for pair in pairs))
+
+
+def _record(op: str, row: Tuple) -> Dict:
+    if op == "delete":
+        return dict(dict.fromkeys(FIELDS), op=op, id=row[0])
+    expense_id, paise, category, note, date, currency, original = row
+    return {"op": op, "id": expense_id, "date": date, "paise": paise, "amount": paise / 100,
+            "category": category, "note": note, "currency": currency, "original": original}
+
+
+def _open_text(path: str, append: bool):
+    mode = 'at' if append else 'wt'
+    if path.endswith(".gz"):
+        # Appending adds a gzip member; readers see the members as one stream
+        # Level 6 (gzip's own default) is several times faster than 9 for
+        # nearly the same size
+        return gzip.open(path, mode, compresslevel=6, encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def _write_jsonl(path: str, records: Iterator[Dict], append: bool) -> None:
+    with _open_text(path, append) as f:
+        batch = []
+        for record in records:
+            batch.append(json.dumps(record, ensure_ascii=False))
+            if len(batch) == 1000:
+                f.write("\n".join(batch) + "\n")
+                batch = []
+        if batch:
+            f.write("\n".join(batch) + "\n")
+
+
+def _write_csv(path: str, records: Iterator[Dict], append: bool) -> None:
+    new = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+    with _open_text(path, append) as f:
+        writer = csv.writer(f)
+        if new:
+            writer.writerow(FIELDS)
+        for record in records:
+            if record["paise"] is not None:
+                # Exact decimal text rather than the float
+                record["amount"] = format_minor(record["paise"])
+            writer.writerow([record[field] for field in FIELDS])
+
+
+def _blocks(records: Iterator[Dict]) -> Iterator[Dict[str, list]]:
+    """records regrouped as columns, BLOCK_ROWS rows at a time"""
+    columns = {field: [] for field in FIELDS}
+    for record in records:
+        for field in FIELDS:
+            columns[field].append(record[field])
+        if len(columns["id"]) == BLOCK_ROWS:
+            yield columns
+            columns = {field: [] for field in FIELDS}
+    if columns["id"]:
+        yield columns
+
+
+# Column types of the .cols format. Strings with few distinct values are
+# stored as codes into a dictionary kept in the block header.
+COLUMN_TYPES = {"op": "dict", "id": "int64", "date": "dict", "paise": "int64", "amount": "float64",
+                "category": "dict", "note": "str", "currency": "dict", "original": "int64"}
+
+
+def _encode_column(kind: str, values: list) -> Tuple[Dict, List[bytes]]:
+    """Column metadata and buffers. Every column has a validity buffer (one
+    byte per row, 0 for null) ahead of its data."""
+    valid = bytes(value is not None for value in values)
+    meta = {"type": kind}
+    if kind == "int64":
+        buffers = [array('q', (value or 0 for value in values)).tobytes()]
+    elif kind == "float64":
+        buffers = [array('d', (value or 0.0 for value in values)).tobytes()]
+    elif kind == "dict":
+        codes: Dict[Optional[str], int] = {}
+        buffers = [array('L', (codes.setdefault(value, len(codes)) for value in values)).tobytes()]
+        meta["dictionary"] = list(codes)
+    else:
+        encoded = [(value or "").encode('utf-8') for value in values]
+        offsets = array('q', [0])
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        buffers = [offsets.tobytes(), b"".join(encoded)]
+    return meta, [valid] + buffers
+
+
+def _write_cols(path: str, records: Iterator[Dict], append: bool) -> None:
+    """Append blocks to a .cols file: a magic line, then per block a JSON
+    header line followed by the zlib-compressed buffers it lists"""
+    new = not append or not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, 'ab' if append else 'wb') as f:
+        if new:
+            f.write(COLS_MAGIC)
+        for columns in _blocks(records):
+            metas, payload = [], []
+            for field in FIELDS:
+                meta, buffers = _encode_column(COLUMN_TYPES[field], columns[field])
+                compressed = [zlib.compress(buffer, 1) for buffer in buffers]
+                meta["name"] = field
+                meta["sizes"] = [len(buffer) for buffer in compressed]
+                metas.append(meta)
+                payload.extend(compressed)
+            header = {"rows": len(columns["id"]), "columns": metas}
+            f.write((json.dumps(header, ensure_ascii=False) + "\n").encode('utf-8'))
+            for buffer in payload:
+                f.write(buffer)
+
+
+def _decode_column(meta: Dict, buffers: List[bytes], rows: int) -> list:
+    valid, data = buffers[0], buffers[1:]
+    kind = meta["type"]
+    if kind == "int64":
+        values = array('q', data[0]).tolist()
+    elif kind == "float64":
+        values = array('d', data[0]).tolist()
+    elif kind == "dict":
+        dictionary = meta["dictionary"]
+        values = [dictionary[code] for code in array('L', data[0])]
+    else:
+        offsets = array('q', data[0])
+        text = data[1]
+        values = [text[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(rows)]
+    return [value if flag else None for value, flag in zip(values, valid)]
+
+
+def iter_cols(path: str) -> Iterator[Dict[str, list]]:
+    """The blocks of a .cols file, each as {column name: values}"""
+    with open(path, 'rb') as f:
+        if f.readline() != COLS_MAGIC:
+            raise ValueError(f"{path} is not a .cols export")
+        for line in f:
+            header = json.loads(line)
+            columns = {}
+            for meta in header["columns"]:
+                buffers = [zlib.decompress(f.read(size)) for size in meta["sizes"]]
+                columns[meta["name"]] = _decode_column(meta, buffers, header["rows"])
+            yield columns
+
+
+def _write_parquet(path: str, records: Iterator[Dict], append: bool, part: int) -> None:
+    """Parquet files cannot be appended to, so the target is a directory
+    holding one part file per export, which pyarrow reads as one dataset"""
+    if pyarrow is None:
+        raise ValueError("Parquet export needs pyarrow; export to a .cols file instead")
+    os.makedirs(path, exist_ok=True)
+    if not append:
+        for name in os.listdir(path):
+            if name.startswith("part-") and name.endswith(".parquet"):
+                os.remove(os.path.join(path, name))
+    # Fixed types, so parts whose columns happen to be all null still match
+    types = {"int64": pyarrow.int64(), "float64": pyarrow.float64(), "dict": pyarrow.string(), "str": pyarrow.string()}
+    schema = pyarrow.schema([(field, types[COLUMN_TYPES[field]]) for field in FIELDS])
+    writer = None
+    try:
+        for columns in _blocks(records):
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(os.path.join(path, f"part-{part:05d}.parquet"), schema)
+            writer.write_table(pyarrow.table(columns, schema=schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def iter_export(path: str) -> Iterator[Dict]:
+    """Read back the records of a jsonl, csv or cols export, oldest first"""
+    fmt = detect_format(path)
+    if fmt == "cols":
+        for columns in iter_cols(path):
+            for values in zip(*(columns[field] for field in FIELDS)):
+                yield dict(zip(FIELDS, values))
+        return
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as f:
+        if fmt == "jsonl":
+            for line in f:
+                yield json.loads(line)
+        elif fmt == "csv":
+            # CSV has no null: empty cells (an empty note too) read as None
+            for record in csv.DictReader(f):
+                for field in FIELDS:
+                    if record[field] == "":
+                        record[field] = None
+                    elif field in ("id", "paise", "original"):
+                        record[field] = int(record[field])
+                yield record
+        else:
+            raise ValueError("read Parquet exports with pyarrow.dataset")
+
+
+def export_rows(rows: Iterable[LedgerRow], path: str, fmt: Optional[str] = None, full: bool = False) -> ExportResult:
+    """Write the rows that changed since the last export to path (all of
+    them, replacing the file, on the first export or with full=True) and
+    move the watermark. Raises ValueError for an unknown format."""
+    fmt = fmt or detect_format(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}; use {', '.join(FORMATS)}")
+    state_path = path.rstrip("/\\") + ".state"
+    previous = None if full else Watermark.load(state_path)
+    if previous is not None and (previous.format != fmt or not os.path.exists(path)):
+        previous = None
+    full = previous is None
+    current = Watermark(state_path)
+    current.format = fmt
+    current.exports = 1 if full else previous.exports + 1
+    result = ExportResult(path, full)
+
+    def records():
+        for op, row in (previous or Watermark(state_path)).changes(rows, current):
+            if op == "delete":
+                result.deletes += 1
+            else:
+                result.upserts += 1
+            yield _record(op, row)
+
+    if fmt == "jsonl":
+        _write_jsonl(path, records(), not full)
+    elif fmt == "csv":
+        _write_csv(path, records(), not full)
+    elif fmt == "cols":
+        _write_cols(path, records(), not full)
+    else:
+        _write_parquet(path, records(), not full, current.exports)
+    result.rows = len(current.ids)
+    current.save()
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export a ledger's new and changed expenses")
+    parser.add_argument("ledger", help="expenses.json, a .db file or a partition directory")
+    parser.add_argument("output", help="target file: .jsonl.gz, .jsonl, .csv, .csv.gz, .cols or .parquet (a directory)")
+    parser.add_argument("--full", action="store_true", help="rewrite the target with every expense")
+    args = parser.parse_args(argv)
+
+    from expense_tracker import create_manager
+
+    try:
+        detect_format(args.output)
+    except ValueError as e:
+        parser.error(str(e))
+    manager = create_manager(args.ledger)
+    if manager.export(args.output, full=args.full) is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,243 @@
+import bisect
+import json
+import os
+import shutil
+from collections import deque
+from datetime import datetime
+from typing import List, Dict, Iterator, Optional, Tuple
+
+from expense_storage import atomic_open
+
+
+# A change is [expense id, before, after]. before is None for an add and
+# after None for a delete; for an update both hold only the fields that
+# changed, so a one-field edit stores two small dicts.
+Change = list
+
+FIELDS = ("paise", "category", "note", "date", "currency", "original")
+
+
+def field_changes(before: Dict, after: Dict) -> Tuple[Dict, Dict]:
+    """The old and new values of the fields that differ between two rows"""
+    changed = [field for field in FIELDS if before.get(field) != after.get(field)]
+    return {field: before.get(field) for field in changed}, {field: after.get(field) for field in changed}
+
+
+def invert(changes: List[Change]) -> List[Change]:
+    """Changes that undo changes, in reverse order"""
+    return [[expense_id, after, before] for expense_id, before, after in reversed(changes)]
+
+
+def apply_to_rows(rows: Dict[int, Dict], changes: List[Change]) -> None:
+    """Apply changes to {id: expense dict}"""
+    for expense_id, before, after in changes:
+        if after is None:
+            rows.pop(expense_id, None)
+        elif before is None:
+            rows[expense_id] = dict(after, id=expense_id)
+        else:
+            row = rows.get(expense_id)
+            if row is not None:
+                row.update(after)
+
+
+class History:
+    """Bounded audit log of ledger changes, kept as per-change deltas.
+
+    Every change is appended to a JSON Lines file as {"seq", "time", "op",
+    "changes"}. Undo and redo are logged as changes too (op "undo" with the
+    inverse delta, "redo" with the original), so replaying the log always
+    leads to the current ledger. The undo and redo stacks hold sequence
+    numbers only and deltas are read back from the file by offset, so
+    memory stays small however large a change (an import, say) was.
+
+    save_expenses() offers the snapshot it just wrote as a checkpoint every
+    checkpoint_every entries; it is kept as a hard link (or a copy where
+    links are not supported). At most keep_checkpoints are kept, and the
+    log only keeps the entries after the oldest of them, so disk use stays
+    bounded. Backends without checkpoints keep the last checkpoint_every *
+    keep_checkpoints entries. A past state is rebuilt either from the
+    current ledger by undoing the entries after it, or from the nearest
+    checkpoint before it by replaying at most checkpoint_every entries.
+    """
+
+    def __init__(self, path: str, max_undo: int = 200, checkpoint_every: int = 500, keep_checkpoints: int = 3):
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.keep_checkpoints = keep_checkpoints
+        self.max_entries = checkpoint_every * keep_checkpoints
+        self.seq = 0
+        # The earliest time the log can rebuild: its creation, or the last
+        # entry pruned
+        self.horizon: Optional[str] = None
+        self.undo_stack = deque(maxlen=max_undo)
+        self.redo_stack: List[int] = []
+        # Retained entries in log order, as parallel columns
+        self._seqs: List[int] = []
+        self._times: List[str] = []
+        self._offsets: List[int] = []
+        self.checkpoints: List[Tuple[int, str, str]] = []  # (seq, time, file path)
+        self._size = 0
+        self.load()
+
+    @staticmethod
+    def now() -> str:
+        return datetime.now().isoformat(timespec="microseconds")
+
+    def load(self) -> None:
+        """Index the log file, dropping a torn last line. A new log starts
+        with a header, as states from before it cannot be rebuilt."""
+        self._seqs, self._times, self._offsets, self.checkpoints = [], [], [], []
+        self.horizon = None
+        offset = 0
+        if not os.path.exists(self.path):
+            self._size = 0
+            self._append({"horizon": self.now(), "seq": self.seq})
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    record = None
+                if record is None:
+                    break
+                if "horizon" in record:
+                    self.horizon = record["horizon"]
+                    self.seq = max(self.seq, record.get("seq", 0))
+                elif "checkpoint" in record:
+                    self.checkpoints.append((record["checkpoint"], record["time"],
+                                             os.path.join(os.path.dirname(self.path), record["file"])))
+                else:
+                    self._seqs.append(record["seq"])
+                    self._times.append(record["time"])
+                    self._offsets.append(offset)
+                    self.seq = max(self.seq, record["seq"])
+                offset += len(line)
+        if offset != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+        self._size = offset
+
+    def _append(self, record: Dict) -> int:
+        data = (json.dumps(record, separators=(",", ":")) + "\n").encode('utf-8')
+        offset = self._size
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+        self._size += len(data)
+        return offset
+
+    def _log(self, op: str, changes: List[Change]) -> int:
+        self.seq += 1
+        time = self.now()
+        offset = self._append({"seq": self.seq, "time": time, "op": op, "changes": changes})
+        self._seqs.append(self.seq)
+        self._times.append(time)
+        self._offsets.append(offset)
+        if len(self._seqs) > 2 * self.max_entries and not self.checkpoints:
+            self._prune(self.seq - self.max_entries)
+        return self.seq
+
+    def record(self, op: str, changes: List[Change]) -> int:
+        """Log an ordinary change; it becomes the next one to undo"""
+        seq = self._log(op, changes)
+        self.undo_stack.append(seq)
+        self.redo_stack.clear()
+        return seq
+
+    def read(self, seq: int) -> Optional[Dict]:
+        """The logged entry with sequence number seq, if still retained"""
+        i = bisect.bisect_left(self._seqs, seq)
+        if i == len(self._seqs) or self._seqs[i] != seq:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(self._offsets[i])
+            return json.loads(f.readline())
+
+    def entries(self, after: int, through: int) -> Iterator[Dict]:
+        """Logged entries with after < seq <= through, oldest first"""
+        i = bisect.bisect_right(self._seqs, after)
+        if i == len(self._seqs) or self._seqs[i] > through:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offsets[i])
+            for line in f:
+                record = json.loads(line)
+                if "seq" not in record or "op" not in record:
+                    continue
+                if record["seq"] > through:
+                    return
+                yield record
+
+    def undone(self, seq: int, changes: List[Change]) -> None:
+        """Log the undo of entry seq, which then becomes redoable"""
+        self._log("undo", changes)
+        self.undo_stack.pop()
+        self.redo_stack.append(seq)
+
+    def redone(self, seq: int, changes: List[Change]) -> None:
+        """Log the redo of entry seq, which can then be undone again"""
+        self._log("redo", changes)
+        self.redo_stack.pop()
+        self.undo_stack.append(seq)
+
+    def seq_at(self, time: str) -> int:
+        """Sequence number of the last change made at or before time"""
+        i = bisect.bisect_right(self._times, time)
+        if i:
+            return self._seqs[i - 1]
+        return self._seqs[0] - 1 if self._seqs else self.seq
+
+    def plan(self, time: str) -> Optional[Tuple[int, Optional[Tuple[int, str, str]]]]:
+        """How to rebuild the ledger as of time: (target seq, checkpoint to
+        replay forward from, or None to undo backwards from the current
+        state). None if the log does not reach back that far."""
+        if self.horizon is not None and time < self.horizon:
+            return None
+        target = self.seq_at(time)
+        if self.seq - target <= self.checkpoint_every:
+            return target, None
+        usable = [checkpoint for checkpoint in self.checkpoints if checkpoint[0] <= target]
+        return target, (usable[-1] if usable else None)
+
+    def checkpoint_due(self) -> bool:
+        last = self.checkpoints[-1][0] if self.checkpoints else (self._seqs[0] - 1 if self._seqs else self.seq)
+        return self.seq - last >= self.checkpoint_every
+
+    def add_checkpoint(self, snapshot: str) -> None:
+        """Keep the snapshot file just written as the state after self.seq"""
+        path = f"{self.path}.{self.seq}"
+        if os.path.exists(path):
+            os.remove(path)
+        try:
+            # Snapshots are replaced by rename, so the link keeps this version
+            os.link(snapshot, path)
+        except OSError:
+            shutil.copyfile(snapshot, path)
+        time = self.now()
+        self._append({"checkpoint": self.seq, "time": time, "file": os.path.basename(path)})
+        self.checkpoints.append((self.seq, time, path))
+        if len(self.checkpoints) > self.keep_checkpoints:
+            self._prune(self.checkpoints[-self.keep_checkpoints][0])
+
+    def _prune(self, cutoff: int) -> None:
+        """Forget the entries up to cutoff and the checkpoints before it,
+        rewriting the log without them"""
+        i = bisect.bisect_right(self._seqs, cutoff)
+        horizon = self._times[i - 1] if i else self.horizon
+        kept = [checkpoint for checkpoint in self.checkpoints if checkpoint[0] >= cutoff]
+        for checkpoint in self.checkpoints:
+            if checkpoint[0] < cutoff and os.path.exists(checkpoint[2]):
+                os.remove(checkpoint[2])
+        with atomic_open(self.path, 'wb') as out:
+            out.write((json.dumps({"horizon": horizon, "seq": self.seq}) + "\n").encode('utf-8'))
+            for seq, time, path in kept:
+                out.write((json.dumps({"checkpoint": seq, "time": time, "file": os.path.basename(path)},
+                                      separators=(",", ":")) + "\n").encode('utf-8'))
+            for entry in self.entries(cutoff, self.seq):
+                out.write((json.dumps(entry, separators=(",", ":")) + "\n").encode('utf-8'))
+        self.load()
+        for stack in (self.undo_stack, self.redo_stack):
+            retained = [seq for seq in stack if seq > cutoff]
+            stack.clear()
+            stack.extend(retained)
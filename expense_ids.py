@@ -0,0 +1,69 @@
+import json
+
+from expense_storage import FileLock, write_json
+
+
+class IdAllocator:
+    """Hands out expense ids that are never reused, reserving them in blocks.
+
+    The file holds the first id that no process has reserved yet. reserve()
+    serves ids from the block this process holds in memory and only goes to
+    the file, under a lock shared by every process using it, to claim the
+    next block, so allocating an id is usually just a counter bump. Blocks
+    start at MIN_BLOCK ids and double with every refill up to MAX_BLOCK, so a
+    million ids take a couple of dozen file writes while a session that adds
+    a handful leaves only a small gap behind. Ids are increasing within a
+    process and unique across every process and partition sharing the file;
+    ids left in a block when the process exits are never handed out.
+
+    observe() tells the allocator about ids that exist without having come
+    from it (ledgers written before it existed, or edited by hand), so they
+    are never handed out again either.
+    """
+
+    MIN_BLOCK = 16
+    MAX_BLOCK = 1 << 16
+
+    def __init__(self, path: str):
+        self.path = path
+        self.next = 1  # next id of the block held in memory
+        self.limit = 1  # end of that block; next == limit means no block is held
+        self.floor = 1  # every id handed out from now on is at least this
+        self.block = self.MIN_BLOCK
+        self.file_lock = FileLock(path + ".lock")
+
+    def _read(self) -> int:
+        try:
+            with open(self.path, 'r') as f:
+                return int(json.load(f)["next"])
+        except FileNotFoundError:
+            return 1
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            # The ledger's own ids still bound what can be handed out,
+            # through observe()
+            print(f"Error reading id allocator {self.path}: {e}")
+            return 1
+
+    def reserve(self, count: int = 1) -> int:
+        """Reserve count consecutive new ids and return the first"""
+        if self.next + count > self.limit:
+            size = max(count, self.block)
+            with self.file_lock:
+                start = max(self._read(), self.floor)
+                write_json(self.path, {"next": start + size})
+            self.next, self.limit = start, start + size
+            self.block = min(self.block * 2, self.MAX_BLOCK)
+        start = self.next
+        self.next += count
+        self.floor = max(self.floor, self.next)
+        return start
+
+    def observe(self, expense_id: int) -> None:
+        """Make sure expense_id, which is already in use, is never handed out"""
+        if expense_id >= self.floor:
+            self.floor = expense_id + 1
+            if self.next <= expense_id < self.limit:
+                self.next = expense_id + 1
+
+    def close(self) -> None:
+        self.file_lock.close()
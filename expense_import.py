@@ -0,0 +1,264 @@
+import csv
+import io
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date as Date
+from typing import List, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from expense_money import to_minor
+
+
+# Column names accepted in CSV headers and JSON Lines keys, lower-cased
+FIELD_ALIASES = {
+    "amount": "amount",
+    "category": "category",
+    "note": "note",
+    "description": "note",
+    "memo": "note",
+    "narration": "note",
+    "date": "date",
+    "transaction date": "date",
+}
+
+# Below this size a file is parsed in-process even when workers > 1
+PARALLEL_MIN_BYTES = 4 << 20
+
+Row = Tuple[str, int, str, str]  # (date, amount in paise, category, note)
+Reject = Tuple[int, str, str]  # (line number, reason, raw row)
+
+
+class ImportResult:
+    """Outcome of an import: counts plus the rows that were turned away"""
+
+    def __init__(self):
+        self.added = 0
+        self.duplicates = 0
+        self.rejects: List[Reject] = []
+
+    def write_rejects(self, path: str) -> None:
+        """Write the rejects report as CSV (line, reason, row)"""
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["line", "reason", "row"])
+            writer.writerows(self.rejects)
+
+    def __str__(self) -> str:
+        return (f"Imported {self.added} expenses "
+                f"({self.duplicates} duplicates skipped, {len(self.rejects)} rejected)")
+
+
+def detect_format(path: str) -> str:
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def dedupe_key(date: str, paise: int, note: str) -> Tuple[str, int, str]:
+    """Identity used to spot an expense that is already in the ledger"""
+    return date, paise, note
+
+
+def drop_duplicates(rows: List[Row], seen: Set[Tuple[str, int, str]], result: ImportResult) -> List[Row]:
+    """Drop rows whose key is in seen (adding the keys of the rest), counting
+    the dropped ones in result.duplicates"""
+    fresh = []
+    for row in rows:
+        key = (row[0], row[1], row[3])
+        if key in seen:
+            result.duplicates += 1
+        else:
+            seen.add(key)
+            fresh.append(row)
+    return fresh
+
+
+def _clean(raw_amount, raw_category, note, raw_date, lookup: Dict[str, str],
+           default_category: Optional[str]) -> Row:
+    """Validate and normalize one row, raising ValueError with the reason"""
+    if isinstance(raw_amount, str):
+        raw_amount = raw_amount.replace(",", "").strip()
+    # Text is parsed as a decimal, so "19.99" is exactly 1999 paise
+    paise = to_minor(raw_amount)
+    if paise <= 0:
+        raise ValueError("amount must be at least 0.01")
+
+    if raw_category:
+        category = lookup.get(str(raw_category).strip().lower())
+        if category is None:
+            raise ValueError(f"unknown category {raw_category!r}")
+    elif default_category:
+        category = default_category
+    else:
+        raise ValueError("missing category")
+
+    try:
+        date = Date.fromisoformat(raw_date.strip()).isoformat()
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError(f"invalid date {raw_date!r}")
+    return date, paise, category, "" if note is None else str(note)
+
+
+def csv_columns(header: List[str]) -> Tuple[int, Optional[int], Optional[int], int]:
+    """Positions of (amount, category, note, date) in a CSV header row"""
+    positions = {}
+    for i, name in enumerate(header):
+        field = FIELD_ALIASES.get(name.strip().lower())
+        if field is not None and field not in positions:
+            positions[field] = i
+    missing = [field for field in ("amount", "date") if field not in positions]
+    if missing:
+        raise ValueError(f"CSV header has no {' or '.join(missing)} column")
+    return positions["amount"], positions.get("category"), positions.get("note"), positions["date"]
+
+
+def parse_csv(reader, columns, lookup: Dict[str, str], default_category: Optional[str] = None,
+              line_base: int = 0, limit: Optional[int] = None) -> Tuple[List[Row], List[Reject], int]:
+    """Validate up to limit rows from a csv.reader. Returns the good rows,
+    the rejects and how many rows were consumed."""
+    amount_i, category_i, note_i, date_i = columns
+    rows = []
+    rejects = []
+    consumed = 0
+    for values in itertools.islice(reader, limit):
+        consumed += 1
+        if not values:
+            continue
+        try:
+            rows.append(_clean(values[amount_i],
+                               values[category_i] if category_i is not None else None,
+                               values[note_i] if note_i is not None else "",
+                               values[date_i], lookup, default_category))
+        except IndexError:
+            rejects.append((line_base + reader.line_num, "missing fields", ",".join(values)))
+        except ValueError as e:
+            rejects.append((line_base + reader.line_num, str(e), ",".join(values)))
+    return rows, rejects, consumed
+
+
+def _json_key_names(keys: Tuple[str, ...]) -> Tuple[str, str, str, str]:
+    """Which of keys holds the amount, category, note and date"""
+    names = {}
+    for key in keys:
+        field = FIELD_ALIASES.get(key.lower())
+        if field is not None and field not in names:
+            names[field] = key
+    return tuple(names.get(field, field) for field in ("amount", "category", "note", "date"))
+
+
+def parse_jsonl(lines: List[str], lookup: Dict[str, str], default_category: Optional[str] = None,
+                line_base: int = 0) -> Tuple[List[Row], List[Reject]]:
+    """Validate JSON Lines records; the first line is line_base + 1"""
+    rows = []
+    rejects = []
+    key_names = {}  # record keys -> the key holding each field, per distinct key set
+    numbered = [(number, line) for number, line in enumerate(lines, line_base + 1) if line.strip()]
+    try:
+        # Decode the whole batch in one C-level call; only a batch with a
+        # malformed line is decoded line by line
+        records = json.loads("[" + ",".join(line for _, line in numbered) + "]")
+        if len(records) != len(numbered):
+            records = None
+    except ValueError:
+        records = None
+    for i, (number, line) in enumerate(numbered):
+        try:
+            record = records[i] if records is not None else json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("not a JSON object")
+            keys = tuple(record)
+            names = key_names.get(keys)
+            if names is None:
+                names = key_names[keys] = _json_key_names(keys)
+            amount_key, category_key, note_key, date_key = names
+            get = record.get
+            rows.append(_clean(get(amount_key), get(category_key), get(note_key, ""), get(date_key),
+                               lookup, default_category))
+        except ValueError as e:
+            rejects.append((number, str(e), line.rstrip("\r\n")))
+    return rows, rejects
+
+
+def _parse_chunk(path: str, start: int, end: int, fmt: str, columns, lookup: Dict[str, str],
+                 default_category: Optional[str]) -> Tuple[List[Row], List[Reject], int]:
+    """Worker side of a parallel import: parse the lines in [start, end).
+    Reject line numbers are relative to the chunk."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    lines = io.StringIO(text, newline='')
+    if fmt == "csv":
+        rows, rejects, _ = parse_csv(csv.reader(lines), columns, lookup, default_category)
+    else:
+        rows, rejects = parse_jsonl(lines, lookup, default_category)
+    return rows, rejects, text.count("\n")
+
+
+def _chunk_bounds(path: str, start: int, chunks: int) -> List[Tuple[int, int]]:
+    """Split [start, EOF) into about chunks byte ranges that end on line breaks"""
+    size = os.path.getsize(path)
+    step = max((size - start) // chunks, 1 << 20)
+    bounds = []
+    with open(path, 'rb') as f:
+        while start < size:
+            f.seek(min(start + step, size))
+            f.readline()
+            end = min(f.tell(), size)
+            bounds.append((start, end))
+            start = end
+    return bounds
+
+
+def iter_import_batches(path: str, categories: Iterable[str], fmt: Optional[str] = None,
+                        default_category: Optional[str] = None, workers: int = 1,
+                        batch_size: int = 10000) -> Iterator[Tuple[List[Row], List[Reject]]]:
+    """Stream a CSV or JSON Lines file as batches of (valid rows, rejects).
+
+    Categories are matched case-insensitively and returned in their
+    canonical spelling. With workers > 1 large files are cut into line-
+    aligned byte ranges that are parsed in a process pool; in that mode CSV
+    fields must not contain line breaks.
+    """
+    fmt = fmt or detect_format(path)
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"unsupported import format {fmt!r}")
+    lookup = {category.lower(): category for category in categories}
+    if default_category is not None:
+        default_category = lookup.get(default_category.lower(), default_category)
+
+    columns = None
+    data_start = 0
+    if fmt == "csv":
+        with open(path, 'rb') as f:
+            header_line = f.readline()
+            data_start = f.tell()
+        columns = csv_columns(next(csv.reader([header_line.decode('utf-8-sig')]), []))
+
+    if workers > 1 and os.path.getsize(path) - data_start >= PARALLEL_MIN_BYTES:
+        line_base = 1 if fmt == "csv" else 0
+        bounds = _chunk_bounds(path, data_start, workers * 4)
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(_parse_chunk, path, start, end, fmt, columns, lookup, default_category)
+                       for start, end in bounds]
+            for future in futures:
+                rows, rejects, line_count = future.result()
+                yield rows, [(line_base + number, reason, raw) for number, reason, raw in rejects]
+                line_base += line_count
+        return
+
+    with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+        if fmt == "csv":
+            reader = csv.reader(f)
+            next(reader, None)
+            while True:
+                rows, rejects, consumed = parse_csv(reader, columns, lookup, default_category, limit=batch_size)
+                if not consumed:
+                    return
+                yield rows, rejects
+        else:
+            line_base = 0
+            while True:
+                lines = list(itertools.islice(f, batch_size))
+                if not lines:
+                    return
+                yield parse_jsonl(lines, lookup, default_category, line_base)
+                line_base += len(lines)
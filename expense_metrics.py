@@ -0,0 +1,150 @@
+import atexit
+import functools
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from expense_storage import write_json
+
+
+# EXPENSE_METRICS=1 turns instrumentation on; a value ending in .json also
+# dumps the snapshot to that file when the process exits
+METRICS_ENV = "EXPENSE_METRICS"
+# EXPENSE_PROFILE=cprofile or tracemalloc captures a profile of the whole
+# run, written to EXPENSE_PROFILE_FILE (default expense_profile.prof / .txt)
+PROFILE_ENV = "EXPENSE_PROFILE"
+PROFILE_FILE_ENV = "EXPENSE_PROFILE_FILE"
+
+
+class Metrics:
+    """Process-wide timers, value distributions and counters.
+
+    Timers and values keep [count, total, max, last] per name, counters a
+    plain number. Recording is a no-op while the instance is disabled.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.timers: Dict[str, List[float]] = {}
+        self.values: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _observe(table: Dict[str, List[float]], name: str, value: float) -> None:
+        entry = table.get(name)
+        if entry is None:
+            table[name] = [1, value, value, value]
+        else:
+            entry[0] += 1
+            entry[1] += value
+            if value > entry[2]:
+                entry[2] = value
+            entry[3] = value
+
+    def record_time(self, name: str, seconds: float) -> None:
+        if self.enabled:
+            with self._lock:
+                self._observe(self.timers, name, seconds)
+
+    def observe(self, name: str, value: float) -> None:
+        """Record one sample of a size, such as the bytes written by a save"""
+        if self.enabled:
+            with self._lock:
+                self._observe(self.values, name, value)
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def last_time(self, name: str) -> Optional[float]:
+        """Seconds taken by the latest timed call of name, if any"""
+        entry = self.timers.get(name)
+        return entry[3] if entry is not None else None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.timers.clear()
+            self.values.clear()
+            self.counters.clear()
+
+    def snapshot(self) -> Dict:
+        """JSON-ready copy of everything recorded so far; times in ms"""
+        with self._lock:
+            timers = {name: {"count": count, "total_ms": total * 1000, "mean_ms": total / count * 1000,
+                             "max_ms": peak * 1000, "last_ms": last * 1000}
+                      for name, (count, total, peak, last) in sorted(self.timers.items())}
+            values = {name: {"count": count, "total": total, "mean": total / count, "max": peak, "last": last}
+                      for name, (count, total, peak, last) in sorted(self.values.items())}
+            return {"enabled": self.enabled, "timers": timers, "values": values, "counters": dict(self.counters)}
+
+    def dump(self, path: str, extra: Optional[Dict] = None) -> None:
+        """Write snapshot() (merged with extra) to path as JSON"""
+        data = self.snapshot()
+        data.update(extra or {})
+        write_json(path, data)
+
+
+metrics = Metrics(os.environ.get(METRICS_ENV, "") not in ("", "0"))
+
+
+def timed(name: Optional[str] = None) -> Callable:
+    """Time every call of the decorated function under name (default: its
+    name). When metrics are disabled at import time the function is
+    returned unwrapped, so instrumentation costs nothing."""
+    def decorate(func):
+        if not metrics.enabled:
+            return func
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.record_time(label, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def start_profiling(mode: Optional[str] = None, path: Optional[str] = None) -> bool:
+    """Start a cProfile or tracemalloc capture that is written out at exit.
+    mode and path default to the EXPENSE_PROFILE* environment variables."""
+    mode = (mode or os.environ.get(PROFILE_ENV, "")).lower()
+    path = path or os.environ.get(PROFILE_FILE_ENV)
+    if mode == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def finish():
+            profiler.disable()
+            profiler.dump_stats(path or "expense_profile.prof")
+    elif mode == "tracemalloc":
+        import tracemalloc
+        tracemalloc.start(25)
+
+        def finish():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            with open(path or "expense_profile.txt", 'w') as f:
+                f.write(f"current {current / 2**20:.1f} MB, peak {peak / 2**20:.1f} MB\n\n")
+                for stat in snapshot.statistics("lineno")[:50]:
+                    f.write(f"{stat}\n")
+    elif mode:
+        print(f"Unknown {PROFILE_ENV} mode {mode!r}; use cprofile or tracemalloc")
+        return False
+    else:
+        return False
+    atexit.register(finish)
+    return True
+
+
+def dump_at_exit(snapshot: Callable[[], Dict]) -> None:
+    """If EXPENSE_METRICS names a .json file, write snapshot() there at exit"""
+    path = os.environ.get(METRICS_ENV, "")
+    if metrics.enabled and path.endswith(".json"):
+        atexit.register(lambda: write_json(path, snapshot()))
@@ -0,0 +1,159 @@
+import bisect
+import json
+import math
+import os
+import re
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from fractions import Fraction
+from typing import Dict, List, Optional, Tuple
+
+from expense_storage import write_json
+
+
+# Amounts are kept as whole numbers of the currency's minor unit (paise for
+# the rupee). Sums of integers are exact, so totals never drift by a paisa
+# however many rows are added up.
+BASE_CURRENCY = "INR"
+# Digits after the decimal point, for currencies whose minor unit is not a
+# hundredth; every other code gets 2
+MINOR_DIGITS = {"JPY": 0, "KRW": 0, "VND": 0, "BHD": 3, "KWD": 3, "OMR": 3, "JOD": 3, "TND": 3}
+CURRENCY_CODE = re.compile(r"[A-Z]{3}$")
+
+
+def minor_digits(currency: str) -> int:
+    return MINOR_DIGITS.get(currency, 2)
+
+
+def to_minor(amount, digits: int = 2) -> int:
+    """amount in major units (int, float, str or Decimal) as a whole number
+    of minor units, rounding half up. A float is read as the decimal it
+    prints as, so a legacy amount such as 0.1 or 19.99 converts exactly.
+    Raises ValueError for anything that is not a finite number."""
+    if type(amount) is str:
+        # Text with up to digits decimal places takes the float path below,
+        # which is exact for it and several times faster than Decimal
+        try:
+            amount = float(amount)
+        except ValueError:
+            raise ValueError(f"invalid amount {amount!r}")
+    if type(amount) is float:
+        scale = 10 ** digits
+        try:
+            minor = round(amount * scale)
+        except (OverflowError, ValueError):
+            raise ValueError(f"invalid amount {amount!r}")
+        # The common case: amount is exactly the float nearest to
+        # minor / scale, so it came from a decimal with at most digits places
+        if minor / scale == amount:
+            return minor
+        amount = repr(amount)
+    elif isinstance(amount, int):
+        if isinstance(amount, bool):
+            raise ValueError(f"invalid amount {amount!r}")
+        return amount * 10 ** digits
+    try:
+        value = Decimal(amount)
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError(f"invalid amount {amount!r}")
+    if not value.is_finite():
+        raise ValueError(f"invalid amount {amount!r}")
+    return int(value.scaleb(digits).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(minor: int, digits: int = 2) -> float:
+    """minor units as a float in major units, for display and for callers
+    that expect one; the nearest float to the exact value"""
+    return minor / 10 ** digits
+
+
+def format_minor(minor: int, digits: int = 2) -> str:
+    """Exact decimal text of minor units, e.g. 123456 -> '1234.56'"""
+    if digits == 0:
+        return str(minor)
+    sign = "-" if minor < 0 else ""
+    whole, fraction = divmod(abs(minor), 10 ** digits)
+    return f"{sign}{whole}.{fraction:0{digits}d}"
+
+
+def _round_half_up(value: Fraction) -> int:
+    return math.floor(value + Fraction(1, 2))
+
+
+class RateTable:
+    """Exchange rates into the base currency, kept in a JSON file next to
+    the ledger.
+
+    The file maps each currency to {effective date: rate}, the rate being
+    how many base units one unit of the currency buys, as a decimal string
+    so it is read back exactly. A rate applies from its date until the next
+    one. Conversions use exact fractions; the rate found for a (currency,
+    date) pair is cached, so converting a batch costs one dict lookup per
+    row after the first.
+    """
+
+    def __init__(self, path: str, base: str = BASE_CURRENCY):
+        self.path = path
+        self.base = base
+        self.rates: Dict[str, Dict[str, str]] = {}
+        self._dates: Dict[str, List[str]] = {}  # currency -> sorted effective dates
+        self._cache: Dict[Tuple[str, str], Optional[Fraction]] = {}
+
+    @classmethod
+    def load(cls, path: str, base: str = BASE_CURRENCY) -> 'RateTable':
+        table = cls(path, base)
+        if not os.path.exists(path):
+            return table
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            for currency, rates in data.get("rates", {}).items():
+                for date, rate in rates.items():
+                    table._set(currency, Decimal(str(rate)), date)
+        except (OSError, ValueError, TypeError, AttributeError, InvalidOperation) as e:
+            print(f"Error loading exchange rates from {path}: {e}")
+        return table
+
+    def save(self) -> None:
+        write_json(self.path, {"base": self.base, "rates": self.rates})
+
+    def _set(self, currency: str, rate: Decimal, date: str) -> None:
+        self.rates.setdefault(currency, {})[date] = str(rate)
+        self._dates[currency] = sorted(self.rates[currency])
+        self._cache = {key: value for key, value in self._cache.items() if key[0] != currency}
+
+    def set_rate(self, currency: str, rate, date: str) -> None:
+        """Use rate for currency from date on. Raises ValueError for an
+        unknown currency code or a rate that is not a positive number."""
+        if not CURRENCY_CODE.match(currency or "") or currency == self.base:
+            raise ValueError(f"invalid currency {currency!r}")
+        try:
+            value = Decimal(repr(rate) if isinstance(rate, float) else str(rate))
+        except InvalidOperation:
+            raise ValueError(f"invalid rate {rate!r}")
+        if not (value.is_finite() and value > 0):
+            raise ValueError("rate must be greater than 0")
+        self._set(currency, value, date)
+
+    def rate(self, currency: str, date: str) -> Optional[Fraction]:
+        """Base units per unit of currency on date, or None if no rate
+        applies that early"""
+        if currency == self.base:
+            return Fraction(1)
+        key = (currency, date)
+        if key in self._cache:
+            return self._cache[key]
+        dates = self._dates.get(currency, [])
+        i = bisect.bisect_right(dates, date)
+        rate = Fraction(Decimal(self.rates[currency][dates[i - 1]])) if i else None
+        self._cache[key] = rate
+        return rate
+
+    def convert(self, minor: int, currency: str, date: str) -> int:
+        """minor units of currency as minor units of the base currency at
+        the rate for date, rounding half up. Raises ValueError without a
+        rate."""
+        rate = self.rate(currency, date)
+        if rate is None:
+            raise ValueError(f"no {currency} exchange rate on or before {date}")
+        shift = minor_digits(self.base) - minor_digits(currency)
+        return _round_half_up(minor * rate * Fraction(10) ** shift)
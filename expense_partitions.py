@@ -0,0 +1,304 @@
+import json
+import os
+import sys
+from datetime import date as Date
+from typing import List, Dict, Iterable, Iterator, Tuple
+
+from expense_budget import MONTH_PATTERN
+from expense_metrics import metrics, timed
+from expense_money import to_minor
+from expense_query import SORT_FIELDS, order_page
+from expense_storage import iter_json_array, write_json, write_snapshot
+from expense_tracker import Expense, ExpenseManager, exclusive, synchronized
+
+
+MANIFEST = "manifest.json"
+
+
+class PartitionedExpenseManager(ExpenseManager):
+    """ExpenseManager over a directory holding one JSON file per month.
+
+    Next to the YYYY-MM.json files sits manifest.json with every month's
+    total, count, per-category totals, id range and file size. Startup reads
+    the manifest and loads only the last recent_months months; totals and
+    summaries for the rest come from the manifest. Older months are loaded
+    the first time a query, id lookup, row-level report or scroll reaches
+    them. A save rewrites only the months that changed, then the manifest.
+    """
+
+    def __init__(self, directory: str = "expenses", recent_months: int = 3, columnar: bool = False,
+                 load: bool = True, history: bool = False):
+        self.directory = directory
+        self.recent_months = recent_months
+        self.manifest: Dict = {"next_id": 1, "units": "paise", "partitions": {}}
+        self._loaded = set()  # months whose rows are in memory
+        self._dirty = set()  # months changed since the last save
+        self._loading = False
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(directory, columnar=columnar, load=load, history=history)
+
+    def _partition_path(self, month: str) -> str:
+        # month comes from expense dates; it must never name a file outside
+        # the directory
+        if not MONTH_PATTERN.match(month):
+            raise ValueError(f"invalid partition month {month!r}")
+        return os.path.join(self.directory, f"{month}.json")
+
+    def _read_manifest(self) -> Dict:
+        try:
+            with open(os.path.join(self.directory, MANIFEST), 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {"next_id": 1, "units": "paise", "partitions": {}}
+        if manifest.get("units") != "paise":
+            # Older manifests hold rupee floats; the next save writes paise
+            for meta in manifest["partitions"].values():
+                meta["total"] = to_minor(meta["total"])
+                for entry in meta["categories"].values():
+                    entry[0] = to_minor(entry[0])
+            manifest["units"] = "paise"
+        return manifest
+
+    def _cutoff(self) -> str:
+        """First month that counts as recent"""
+        today = Date.today()
+        months = today.year * 12 + today.month - 1 - (self.recent_months - 1)
+        return f"{months // 12:04d}-{months % 12 + 1:02d}"
+
+    def _partition_intact(self, month: str) -> bool:
+        """False if the file no longer matches the manifest (for example a
+        save that stopped between writing it and writing the manifest)"""
+        try:
+            return os.path.getsize(self._partition_path(month)) == self.manifest["partitions"][month]["size"]
+        except OSError:
+            return False
+
+    def iter_load(self, batch_size: int = 1000) -> Iterator[int]:
+        """Read the manifest and load the recent months, yielding the number
+        of expenses in memory after each month"""
+        self._loaded = set()
+        self._dirty = set()
+        self.manifest = self._read_manifest()
+        self._reset()
+        self.category_registry.refresh()
+        # Months that are not loaded yet may hold ids up to the manifest's mark
+        self.ids.observe(self.manifest.get("next_id", 1) - 1)
+        cutoff = self._cutoff()
+        for month in sorted(self.manifest["partitions"], reverse=True):
+            if month >= cutoff or not self._partition_intact(month):
+                self._load_partition(month)
+                yield len(self.expenses)
+        # The aggregates cover the months left on disk too, so categories of
+        # rows that are not loaded are registered as well
+        if self.category_registry.add_missing(self._category_totals):
+            self.category_registry.save()
+        yield len(self.expenses)
+
+    def _compute_aggregates(self):
+        """Aggregates over the loaded rows plus the manifest figures of the
+        months that are still on disk only"""
+        total, category_totals, month_totals, category_month_totals = super()._compute_aggregates()
+        for month, meta in self.manifest["partitions"].items():
+            if month in self._loaded:
+                continue
+            for category, (amount, count) in meta["categories"].items():
+                total += amount
+                for totals, key in ((category_totals, category),
+                                    (month_totals, month),
+                                    (category_month_totals, (category, month))):
+                    entry = totals.get(key)
+                    if entry is None:
+                        totals[key] = [amount, count]
+                    else:
+                        entry[0] += amount
+                        entry[1] += count
+        return total, category_totals, month_totals, category_month_totals
+
+    def _drop_manifest_figures(self, month: str) -> None:
+        """Take a month's manifest figures out of the running aggregates"""
+        for category, (amount, count) in self.manifest["partitions"][month]["categories"].items():
+            for totals, key in ((self._category_totals, category),
+                                (self._month_totals, month),
+                                (self._category_month_totals, (category, month))):
+                entry = totals[key]
+                if entry[1] == count:
+                    del totals[key]
+                else:
+                    entry[0] -= amount
+                    entry[1] -= count
+            self._total = self._total - amount if self._category_totals else 0
+
+    def _load_partition(self, month: str) -> None:
+        expenses = []
+        if os.path.exists(self._partition_path(month)):
+            expenses = [Expense.from_dict(data) for data in iter_json_array(self._partition_path(month))]
+        # Swap the manifest's figures for the real rows
+        self._drop_manifest_figures(month)
+        self._loaded.add(month)
+        self._loading = True
+        try:
+            self._insert_many(expenses)
+        finally:
+            self._loading = False
+        if expenses:
+            self.ids.observe(max(expense.id for expense in expenses))
+        if len(self._positions) != len(self.expenses):
+            # An id this month shares with a month loaded earlier; the
+            # renumbered rows' months are marked dirty for the next save
+            repaired = self._repair_duplicate_ids()
+            print(f"Gave new ids to {len(repaired)} expenses whose ids were duplicated")
+        if not self._partition_intact(month):
+            # The manifest was behind the file; the next save corrects it
+            self._dirty.add(month)
+
+    def _load_months(self, months: Iterable[str]) -> None:
+        for month in sorted(set(months), reverse=True):
+            if month not in self._loaded and month in self.manifest["partitions"]:
+                self._load_partition(month)
+
+    def _touch(self, months: Iterable[str]) -> None:
+        months = set(months)
+        super()._touch(months)
+        if not self._loading:
+            self._dirty.update(months)
+
+    def _load_ids(self, expense_ids: Iterable[int]) -> None:
+        missing = [expense_id for expense_id in expense_ids if expense_id not in self._positions]
+        if missing:
+            self._load_months(month for month, meta in self.manifest["partitions"].items()
+                              if month not in self._loaded and meta["count"]
+                              and any(meta["min_id"] <= expense_id <= meta["max_id"] for expense_id in missing))
+
+    @synchronized
+    def load_all(self) -> None:
+        """Bring every month into memory"""
+        self._load_months(self.manifest["partitions"])
+
+    @synchronized
+    def query(self, date_from: str = None, date_to: str = None, *, sort_by: str = None, descending: bool = False,
+              offset: int = 0, limit: int = None, **criteria) -> List[Expense]:
+        """ExpenseManager.query, after loading the months the date range
+        covers. Rows sit in the order their months were loaded, so matches
+        are put in id order before sorting and paging, as on the other
+        backends."""
+        self._load_months(month for month in self.manifest["partitions"]
+                          if (not date_from or month >= date_from[:7]) and (not date_to or month <= date_to[:7]))
+        if sort_by is not None and sort_by not in SORT_FIELDS:
+            return super().query(sort_by=sort_by)
+        matches = super().query(date_from, date_to, sort_by="id", **criteria)
+        return order_page(matches, sort_by, descending, offset, limit)
+
+    @synchronized
+    def get_page(self, offset: int, limit: int) -> List[Expense]:
+        """Scrolling past the loaded rows pulls in older months, newest first"""
+        while offset + limit > len(self.expenses):
+            unloaded = [month for month in self.manifest["partitions"] if month not in self._loaded]
+            if not unloaded:
+                break
+            self._load_partition(max(unloaded))
+        return super().get_page(offset, limit)
+
+    def _report_rows(self) -> Iterator[Tuple[str, str, int]]:
+        self.load_all()
+        return super()._report_rows()
+
+    def _report_rows_for_months(self, months: List[str]) -> Iterator[Tuple[str, str, int]]:
+        self._load_months(months)
+        return super()._report_rows_for_months(months)
+
+    def _count(self) -> int:
+        return sum(entry[1] for entry in self._month_totals.values())
+
+    @synchronized
+    def get_totals(self) -> Tuple[float, int]:
+        """Return (total, count) for the whole ledger, loaded or not"""
+        return self._total / 100, self._count()
+
+    @synchronized
+    def get_summary_totals(self) -> Tuple[float, int, Dict[str, float], Dict[str, float]]:
+        """ExpenseManager.get_summary_totals with the ledger-wide count"""
+        total, _, category_totals, month_totals = super().get_summary_totals()
+        return total, self._count(), category_totals, month_totals
+
+    @timed()
+    @exclusive
+    def save_expenses(self) -> None:
+        """Rewrite the months that changed since the last save, then the manifest"""
+        try:
+            # A month can change while it is still unloaded, e.g. when an
+            # expense is re-dated into it; merge it with its file first
+            self._load_months(self._dirty)
+            dirty = set(self._dirty)
+            rows: Dict[str, List[Expense]] = {month: [] for month in dirty}
+            for expense in self.expenses:
+                month_rows = rows.get(expense.date[:7])
+                if month_rows is not None:
+                    month_rows.append(expense)
+
+            partitions = self.manifest["partitions"]
+            written = 0
+            for month in sorted(dirty):
+                path = self._partition_path(month)
+                expenses = rows[month]
+                if not expenses:
+                    if os.path.exists(path):
+                        os.remove(path)
+                    partitions.pop(month, None)
+                    continue
+                written += write_snapshot(path, (expense.to_dict() for expense in expenses), flat=True)
+                categories = {category: entry for (category, entry_month), entry in self._category_month_totals.items()
+                              if entry_month == month}
+                partitions[month] = {
+                    "total": self._month_totals[month][0],
+                    "count": self._month_totals[month][1],
+                    "categories": {category: [entry[0], entry[1]] for category, entry in sorted(categories.items())},
+                    "min_id": min(expense.id for expense in expenses),
+                    "max_id": max(expense.id for expense in expenses),
+                    "size": os.path.getsize(path),
+                }
+            self.manifest["next_id"] = self.ids.floor
+            write_json(os.path.join(self.directory, MANIFEST), self.manifest)
+            metrics.observe("save_expenses.bytes", written + os.path.getsize(os.path.join(self.directory, MANIFEST)))
+            self._dirty -= dirty
+            # Every month just written came from memory
+            self._loaded |= dirty
+        except Exception as e:
+            print(f"Error saving expenses: {e}")
+
+    def migrate_json(self, json_file: str) -> int:
+        """Split a single-file expenses.json ledger into monthly partitions,
+        returning the number of expenses copied. Expenses whose id is already
+        in the partitions, or repeated in the file, get new ids instead of
+        being dropped."""
+        expenses = [Expense.from_dict(data) for data in iter_json_array(json_file)]
+        with self.lock:
+            self.load_all()
+            taken = set(self._positions)
+            for expense in expenses:
+                if expense.id is not None:
+                    self.ids.observe(expense.id)
+            renumbered = 0
+            for expense in expenses:
+                if expense.id is None or expense.id in taken:
+                    expense.id = self.ids.reserve()
+                    renumbered += 1
+                taken.add(expense.id)
+            self._insert_many(expenses)
+            if self.category_registry.add_missing(self._category_totals):
+                self.category_registry.save()
+            self.save_expenses()
+        if renumbered:
+            print(f"Gave new ids to {renumbered} expenses whose ids were already taken")
+        return len(expenses)
+
+
+def partition_ledger(json_file: str = "expenses.json", directory: str = "expenses") -> PartitionedExpenseManager:
+    """One-shot conversion of a JSON ledger into a partitioned directory"""
+    manager = PartitionedExpenseManager(directory)
+    count = manager.migrate_json(json_file)
+    print(f"Partitioned {count} expenses from {json_file} into {directory}")
+    return manager
+
+
+if __name__ == "__main__":
+    partition_ledger(*sys.argv[1:3])
@@ -0,0 +1,102 @@
+import heapq
+import re
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from operator import attrgetter
+from typing import List, Dict, Iterable, Optional, Set, Tuple
+
+from expense_tracker import Expense
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+SORT_FIELDS = ("id", "date", "amount", "category", "note")
+
+
+def tokenize(text: str) -> Set[str]:
+    return set(TOKEN_PATTERN.findall(text.lower()))
+
+
+def order_page(rows: Iterable[Expense], sort_by: Optional[str], descending: bool, offset: int,
+               limit: Optional[int]) -> List[Expense]:
+    """Sort rows, given in id order, by sort_by and return the page of limit
+    rows from offset. Ties stay in id order either way, as with SQL's ORDER
+    BY field, id; without sort_by the rows keep id order, reversed if
+    descending."""
+    end = None if limit is None else offset + limit
+    if sort_by is None:
+        if descending:
+            return list(rows)[::-1][offset:end]
+        # Already in order, so paging can stop reading early
+        return list(islice(rows, offset, end))
+    key = attrgetter("paise" if sort_by == "amount" else sort_by)
+    if limit is not None:
+        # A page near the top only needs a bounded heap, not a full sort
+        pick = heapq.nlargest if descending else heapq.nsmallest
+        return pick(end, rows, key=key)[offset:]
+    return sorted(rows, key=key, reverse=descending)[offset:]
+
+
+class ExpenseIndex:
+    """Secondary indexes used by ExpenseManager.query and month-scoped reports.
+
+    by_date is a sorted list of (date, id) pairs, so a date range is two
+    bisects and a slice. tokens maps every lower-cased word of a note to
+    the ids whose note contains it; it is only built by build_tokens(), the
+    first time a text search needs it.
+    """
+
+    def __init__(self, expenses: Iterable[Expense] = ()):
+        self.by_date: List[Tuple[str, int]] = sorted((expense.date, expense.id) for expense in expenses)
+        self.tokens: Optional[Dict[str, Set[int]]] = None
+
+    def build_tokens(self, expenses: Iterable[Expense]) -> None:
+        self.tokens = {}
+        for expense in expenses:
+            self._add_tokens(expense)
+
+    def _add_tokens(self, expense: Expense) -> None:
+        for token in tokenize(expense.note):
+            ids = self.tokens.get(token)
+            if ids is None:
+                self.tokens[token] = {expense.id}
+            else:
+                ids.add(expense.id)
+
+    def add(self, expense: Expense) -> None:
+        insort(self.by_date, (expense.date, expense.id))
+        if self.tokens is not None:
+            self._add_tokens(expense)
+
+    def remove(self, expense: Expense) -> None:
+        key = (expense.date, expense.id)
+        position = bisect_left(self.by_date, key)
+        if position < len(self.by_date) and self.by_date[position] == key:
+            del self.by_date[position]
+        if self.tokens is None:
+            return
+        for token in tokenize(expense.note):
+            ids = self.tokens.get(token)
+            if ids is not None:
+                ids.discard(expense.id)
+                if not ids:
+                    del self.tokens[token]
+
+    def ids_in_date_range(self, date_from: Optional[str], date_to: Optional[str]) -> List[int]:
+        """Ids with date_from <= date <= date_to (either bound optional), in date order"""
+        start = 0 if date_from is None else bisect_left(self.by_date, (date_from,))
+        # (date_to, inf) sorts after every (date_to, id) pair
+        end = len(self.by_date) if date_to is None else bisect_right(self.by_date, (date_to, float("inf")))
+        return [expense_id for _, expense_id in self.by_date[start:end]]
+
+    def ids_with_tokens(self, words: Set[str]) -> Set[int]:
+        """Ids whose note contains every one of the given words"""
+        sets = sorted((self.tokens.get(word, set()) for word in words), key=len)
+        if not sets:
+            return set()
+        result = set(sets[0])
+        for ids in sets[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
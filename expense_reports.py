@@ -0,0 +1,460 @@
+import argparse
+import collections
+import csv
+import gzip
+import io
+import itertools
+import json
+import math
+import re
+import sys
+from datetime import date as Date, datetime
+from typing import List, Dict, Callable, Iterable, Optional, Sequence, Tuple
+
+
+GROUP_FIELDS = ("category", "month", "week", "day")
+STATS = ("sum", "count", "mean", "min", "max", "share")
+PERCENTILE = re.compile(r"p(100|\d{1,2}(\.\d+)?)$")
+
+# Stats that can be computed from (total, count) cells alone
+CELL_STATS = {"sum", "count", "mean", "share"}
+
+# One section per grouping: (group_by fields, stats)
+Spec = Tuple[Tuple[str, ...], Tuple[str, ...]]
+
+# The classic summary: totals with share by category, then totals by month
+SUMMARY: Tuple[Spec, ...] = ((("category",), ("sum", "share")), (("month",), ("sum",)))
+
+Row = Tuple[str, str, int]  # (category, date, amount in paise)
+
+
+def make_spec(group_by: Sequence[str], stats: Sequence[str] = ("sum",)) -> Spec:
+    """Validate a grouping and its stats, raising ValueError on unknown names"""
+    group_by = tuple(group_by)
+    stats = tuple(stats)
+    if not group_by:
+        raise ValueError("group_by needs at least one field")
+    for field in group_by:
+        if field not in GROUP_FIELDS:
+            raise ValueError(f"unknown group field {field!r}; use {', '.join(GROUP_FIELDS)}")
+    for stat in stats:
+        if stat not in STATS and not PERCENTILE.match(stat):
+            raise ValueError(f"unknown stat {stat!r}; use {', '.join(STATS)} or pNN")
+    return group_by, stats
+
+
+def week_of(date: str) -> str:
+    year, week, _ = Date.fromisoformat(date).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _key_function(group_by: Tuple[str, ...]) -> Callable[[Row], Tuple[str, ...]]:
+    weeks: Dict[str, str] = {}
+
+    def week(row):
+        value = weeks.get(row[1])
+        if value is None:
+            value = weeks[row[1]] = week_of(row[1])
+        return value
+
+    getters = {
+        "category": lambda row: row[0],
+        "month": lambda row: row[1][:7],
+        "week": week,
+        "day": lambda row: row[1],
+    }
+    if group_by == ("category",):
+        return lambda row: (row[0],)
+    if group_by == ("month",):
+        return lambda row: (row[1][:7],)
+    parts = [getters[field] for field in group_by]
+    return lambda row: tuple(part(row) for part in parts)
+
+
+def _needs_values(stats: Tuple[str, ...]) -> bool:
+    return any(PERCENTILE.match(stat) for stat in stats)
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """q-th percentile of sorted values, interpolating between ranks"""
+    position = (len(ordered) - 1) * q / 100
+    low = math.floor(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+class Partial:
+    """Per-group accumulators for a set of report specs.
+
+    Partials built over disjoint chunks of the ledger merge into the partial
+    of the whole, which is what lets chunks be scanned in worker processes
+    and, later, lets results be cached per month. Each group holds
+    [sum, count, min, max, values], where values is only kept when a
+    percentile was asked for. Amounts are whole paise, so sums stay exact
+    however they are split and merged; finish() converts to rupees, with
+    means and percentiles rounded to the paisa first.
+    """
+
+    def __init__(self, specs: Sequence[Spec]):
+        self.specs = tuple(specs)
+        self.total = 0
+        self.count = 0
+        self.groups: List[Dict[Tuple[str, ...], list]] = [{} for _ in self.specs]
+
+    def add_rows(self, rows: List[Row]) -> 'Partial':
+        for _, _, amount in rows:
+            self.total += amount
+        self.count += len(rows)
+        for (group_by, stats), groups in zip(self.specs, self.groups):
+            key_of = _key_function(group_by)
+            keep = _needs_values(stats)
+            for row in rows:
+                key = key_of(row)
+                amount = row[2]
+                entry = groups.get(key)
+                if entry is None:
+                    groups[key] = [amount, 1, amount, amount, [amount] if keep else None]
+                else:
+                    entry[0] += amount
+                    entry[1] += 1
+                    if amount < entry[2]:
+                        entry[2] = amount
+                    if amount > entry[3]:
+                        entry[3] = amount
+                    if keep:
+                        entry[4].append(amount)
+        return self
+
+    def add_cells(self, cells: Dict[Tuple[str, str], Tuple[int, int]]) -> 'Partial':
+        """Fold in pre-aggregated {(category, month): (total, count)} cells;
+        only valid for specs that cells_suffice() accepts"""
+        for (category, month), (amount, count) in cells.items():
+            self.total += amount
+            self.count += count
+            for (group_by, _), groups in zip(self.specs, self.groups):
+                key = tuple(category if field == "category" else month for field in group_by)
+                entry = groups.get(key)
+                if entry is None:
+                    groups[key] = [amount, count, None, None, None]
+                else:
+                    entry[0] += amount
+                    entry[1] += count
+        return self
+
+    def merge(self, other: 'Partial') -> 'Partial':
+        self.total += other.total
+        self.count += other.count
+        for groups, other_groups in zip(self.groups, other.groups):
+            for key, theirs in other_groups.items():
+                entry = groups.get(key)
+                if entry is None:
+                    groups[key] = [theirs[0], theirs[1], theirs[2], theirs[3],
+                                   list(theirs[4]) if theirs[4] is not None else None]
+                    continue
+                entry[0] += theirs[0]
+                entry[1] += theirs[1]
+                if theirs[2] is not None and (entry[2] is None or theirs[2] < entry[2]):
+                    entry[2] = theirs[2]
+                if theirs[3] is not None and (entry[3] is None or theirs[3] > entry[3]):
+                    entry[3] = theirs[3]
+                if theirs[4] is not None:
+                    entry[4].extend(theirs[4])
+        return self
+
+    def size(self) -> int:
+        """Groups plus retained amounts, the unit ReportCache budgets in"""
+        return sum(len(groups) + sum(len(entry[4]) for entry in groups.values() if entry[4] is not None)
+                   for groups in self.groups)
+
+    def finish(self) -> 'Report':
+        tables = []
+        for (group_by, stats), groups in zip(self.specs, self.groups):
+            rows = []
+            for key in sorted(groups):
+                amount, count, low, high, values = groups[key]
+                ordered = sorted(values) if values is not None else None
+                row = {}
+                for stat in stats:
+                    if stat == "sum":
+                        row[stat] = amount / 100
+                    elif stat == "count":
+                        row[stat] = count
+                    elif stat == "mean":
+                        row[stat] = round(amount / count) / 100
+                    elif stat == "min":
+                        row[stat] = low / 100
+                    elif stat == "max":
+                        row[stat] = high / 100
+                    elif stat == "share":
+                        row[stat] = (amount / self.total) * 100 if self.total > 0 else 0
+                    else:
+                        row[stat] = round(percentile(ordered, float(stat[1:]))) / 100
+                rows.append((key, row))
+            tables.append(ReportTable(group_by, stats, rows))
+        return Report(self.total / 100, self.count, tables)
+
+
+class ReportTable:
+    """One grouping of a report: rows of (group key, {stat: value}) sorted by key"""
+
+    def __init__(self, group_by: Tuple[str, ...], stats: Tuple[str, ...],
+                 rows: List[Tuple[Tuple[str, ...], Dict[str, float]]]):
+        self.group_by = group_by
+        self.stats = stats
+        self.rows = rows
+
+
+class Report:
+
+    def __init__(self, total: float, count: int, tables: List[ReportTable]):
+        self.total = total
+        self.count = count
+        self.tables = tables
+        self.generated = datetime.now()
+
+    def copy(self) -> 'Report':
+        """Same figures with a fresh generated timestamp; tables are shared"""
+        return Report(self.total, self.count, self.tables)
+
+
+def cells_suffice(specs: Sequence[Spec]) -> bool:
+    """True if every spec can be answered from (category, month) totals"""
+    return all(set(group_by) <= {"category", "month"} and set(stats) <= CELL_STATS
+               for group_by, stats in specs)
+
+
+def _scan_chunk(specs: Tuple[Spec, ...], rows: List[Row]) -> Partial:
+    return Partial(specs).add_rows(rows)
+
+
+def _scan_chunk_by_month(specs: Tuple[Spec, ...], rows: List[Row]) -> Dict[str, Partial]:
+    by_month: Dict[str, List[Row]] = {}
+    for row in rows:
+        month = row[1][:7]
+        month_rows = by_month.get(month)
+        if month_rows is None:
+            by_month[month] = [row]
+        else:
+            month_rows.append(row)
+    return {month: Partial(specs).add_rows(month_rows) for month, month_rows in by_month.items()}
+
+
+def _map_chunks(func, specs: Tuple[Spec, ...], rows: Iterable[Row], workers: int, chunk_size: int):
+    """Yield func(specs, chunk) for consecutive chunks of rows, in order.
+    With workers > 1 the chunks are spread over a process pool; at most two
+    chunks per worker are in flight, so memory stays bounded."""
+    rows = iter(rows)
+    chunks = iter(lambda: list(itertools.islice(rows, chunk_size)), [])
+    if workers <= 1:
+        for chunk in chunks:
+            yield func(specs, chunk)
+        return
+
+    # Imported here: the process pool machinery is slow to import and
+    # only parallel reports need it
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(workers) as pool:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.submit(func, specs, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def scan_rows(rows: Iterable[Row], specs: Sequence[Spec], workers: int = 1, chunk_size: int = 50000) -> Partial:
+    """Aggregate a stream of (category, date, paise) rows chunk by chunk"""
+    specs = tuple(specs)
+    result = Partial(specs)
+    for partial in _map_chunks(_scan_chunk, specs, rows, workers, chunk_size):
+        result.merge(partial)
+    return result
+
+
+def scan_rows_by_month(rows: Iterable[Row], specs: Sequence[Spec], workers: int = 1,
+                       chunk_size: int = 50000) -> Dict[str, Partial]:
+    """Like scan_rows, but keep a separate Partial per YYYY-MM"""
+    specs = tuple(specs)
+    months: Dict[str, Partial] = {}
+    for partials in _map_chunks(_scan_chunk_by_month, specs, rows, workers, chunk_size):
+        for month, partial in partials.items():
+            if month in months:
+                months[month].merge(partial)
+            else:
+                months[month] = partial
+    return months
+
+
+class ReportCache:
+    """Size-bounded LRU store for built reports and per-month partials.
+
+    Every entry is stored with the ledger version it was computed from
+    (the whole-ledger version for reports, the month's own version for
+    month partitions). A lookup with a newer version is a miss, and the
+    fresh result then replaces the stale one, so edits never serve old
+    numbers and stale entries do not pile up. Size is counted in groups
+    plus retained amounts; least recently used entries are evicted once it
+    exceeds max_size.
+    """
+
+    def __init__(self, max_size: int = 1_000_000):
+        self.max_size = max_size
+        self.size = 0
+        self.hits: Dict[str, int] = collections.Counter()  # by entry kind
+        self.misses: Dict[str, int] = collections.Counter()
+        self.evictions = 0
+        self._entries: "collections.OrderedDict[tuple, tuple]" = collections.OrderedDict()
+
+    def get(self, key: tuple, version: int):
+        """Value stored under key for this version, or None. key[0] names
+        the kind of entry for the counters."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            self.misses[key[0]] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits[key[0]] += 1
+        return entry[1]
+
+    def put(self, key: tuple, version: int, value, size: int = 1) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= old[2]
+        if size > self.max_size:
+            return
+        self._entries[key] = (version, value, size)
+        self.size += size
+        while self.size > self.max_size:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self.size -= evicted
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring: hits and misses per entry kind, evictions and size"""
+        stats = {"entries": len(self._entries), "size": self.size, "evictions": self.evictions}
+        for kind in sorted(set(self.hits) | set(self.misses)):
+            stats[f"{kind}_hits"] = self.hits[kind]
+            stats[f"{kind}_misses"] = self.misses[kind]
+        return stats
+
+
+def _label(key: Tuple[str, ...]) -> str:
+    return " / ".join(str(part) for part in key)
+
+
+def _format_stat(stat: str, value) -> str:
+    if stat == "count":
+        return f"count: {value}"
+    return f"{stat}: Rs.{value:.2f}"
+
+
+def render_text(report: Report, title: str = "EXPENSE SUMMARY REPORT") -> str:
+    """Plain-text report; for the SUMMARY specs this is the classic summary layout"""
+    lines = ["=" * 60, title, "=" * 60,
+             f"Generated on: {report.generated.strftime('%Y-%m-%d %H:%M:%S')}",
+             f"Total Expenses: Rs.{report.total:.2f}",
+             f"Total Transactions: {report.count}"]
+    for table in report.tables:
+        lines.append("\nBy " + " / ".join(field.title() for field in table.group_by) + ":")
+        for key, row in table.rows:
+            line = f"  {_label(key)}:"
+            if "sum" in row:
+                line += f" Rs.{row['sum']:.2f}"
+            if "share" in row:
+                line += f" ({row['share']:.1f}%)"
+            others = [_format_stat(stat, row[stat]) for stat in table.stats if stat not in ("sum", "share")]
+            if others:
+                line += (" | " if "sum" in row or "share" in row else " ") + " | ".join(others)
+            lines.append(line)
+    lines.append("=" * 60)
+    return "\n".join(lines)
+
+
+def render_csv(report: Report) -> str:
+    """One CSV row per group: grouping, group, then every stat of any table"""
+    stats = []
+    for table in report.tables:
+        stats.extend(stat for stat in table.stats if stat not in stats)
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(["grouping", "group"] + stats)
+    for table in report.tables:
+        grouping = "+".join(table.group_by)
+        for key, row in table.rows:
+            writer.writerow([grouping, _label(key)] + [row.get(stat, "") for stat in stats])
+    return out.getvalue()
+
+
+def report_to_dict(report: Report) -> Dict:
+    """The report as plain JSON-ready data"""
+    return {
+        "generated": report.generated.strftime('%Y-%m-%d %H:%M:%S'),
+        "total": report.total,
+        "count": report.count,
+        "tables": [{
+            "group_by": list(table.group_by),
+            "stats": list(table.stats),
+            "rows": [dict(zip(table.group_by, key), **row) for key, row in table.rows],
+        } for table in report.tables],
+    }
+
+
+def render_json(report: Report) -> str:
+    return json.dumps(report_to_dict(report), indent=2)
+
+
+# Output formats by name; add an entry to support another one
+RENDERERS: Dict[str, Callable[[Report], str]] = {
+    "text": render_text,
+    "csv": render_csv,
+    "json": render_json,
+}
+
+
+def render(report: Report, fmt: str = "text") -> str:
+    renderer = RENDERERS.get(fmt)
+    if renderer is None:
+        raise ValueError(f"unknown report format {fmt!r}; use {', '.join(RENDERERS)}")
+    return renderer(report)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build an expense report from a ledger file")
+    parser.add_argument("ledger", nargs="?", default="expenses.json")
+    parser.add_argument("--group-by", action="append", metavar="FIELDS",
+                        help="comma-separated fields from category, month, week, day; repeat for more tables")
+    parser.add_argument("--stats", default="sum,share",
+                        help="comma-separated stats: sum, count, mean, min, max, share, pNN (default: sum,share)")
+    parser.add_argument("--format", default="text", choices=sorted(RENDERERS))
+    parser.add_argument("--workers", type=int, default=1, help="processes used to scan the ledger")
+    parser.add_argument("--output", help="write the report here instead of printing it (gzipped if it ends in .gz)")
+    args = parser.parse_args(argv)
+
+    from expense_tracker import create_manager
+
+    try:
+        if args.group_by:
+            specs = [make_spec(fields.split(","), args.stats.split(",")) for fields in args.group_by]
+        else:
+            specs = SUMMARY
+    except ValueError as e:
+        parser.error(str(e))
+
+    manager = create_manager(args.ledger)
+    text = render(manager.build_report(specs, workers=args.workers), args.format)
+    if args.output:
+        opener = gzip.open if args.output.endswith(".gz") else open
+        with opener(args.output, 'wt', encoding='utf-8', newline='') as f:
+            f.write(text if text.endswith("\n") else text + "\n")
+        print(f"Report saved to: {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,556 @@
+import argparse
+import contextlib
+import json
+import queue
+import re
+import sys
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date as Date
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import List, Dict, Callable, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from expense_budget import MONTH_PATTERN
+from expense_query import SORT_FIELDS
+from expense_reports import SUMMARY, make_spec, report_to_dict
+from expense_tracker import ExpenseManager, create_manager
+
+
+DEFAULT_PORT = 8765
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_BODY = 16 * 2**20
+FIELDS = ("amount", "category", "note", "date", "currency")
+
+
+class ApiError(Exception):
+    """An error answered with the given HTTP status and a JSON message"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ThreadOutput:
+    """sys.stdout stand-in that diverts what a capturing thread prints into
+    a list, so the manager's messages (such as why a change was rejected)
+    can be returned to the client. Other threads write straight through."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def write(self, text: str) -> int:
+        captured = getattr(self._local, "captured", None)
+        if captured is None:
+            return self.stream.write(text)
+        captured.append(text)
+        return len(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    @contextlib.contextmanager
+    def capture(self):
+        previous = getattr(self._local, "captured", None)
+        self._local.captured = captured = []
+        try:
+            yield captured
+        finally:
+            self._local.captured = previous
+
+
+def captured_message(captured: List[str]) -> str:
+    lines = [line.strip() for line in "".join(captured).splitlines() if line.strip()]
+    return "; ".join(lines) if lines else "Request rejected"
+
+
+class SerialWriter:
+    """Applies every change to the ledger on one thread, in arrival order.
+
+    Request threads submit a job and wait for its result. The writer takes
+    whatever queued up while it was busy (up to max_batch jobs) and runs it
+    as one batch. Full-snapshot saves the manager asks for are deferred
+    through save_scheduler and written once per batch, before any request
+    of the batch is answered, so concurrent writers share a single save.
+    """
+
+    def __init__(self, manager: ExpenseManager, output: ThreadOutput, max_batch: int = 256):
+        self.manager = manager
+        self.output = output
+        self.max_batch = max_batch
+        self.batches = 0
+        self.jobs = 0
+        self._queue = queue.SimpleQueue()
+        self._save_requested = False
+        manager.save_scheduler = self._request_save
+        self._thread = threading.Thread(target=self._run, name="expense-writer", daemon=True)
+        self._thread.start()
+
+    def _request_save(self) -> None:
+        self._save_requested = True
+
+    def submit(self, job: Callable[[], Tuple[int, Dict, str]]) -> Future:
+        future = Future()
+        self._queue.put((job, future))
+        return future
+
+    def stop(self) -> None:
+        """Finish the queued jobs (and their save), then end the thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = None in batch
+            batch = [entry for entry in batch if entry is not None]
+
+            outcomes = []
+            for job, future in batch:
+                with self.output.capture() as captured:
+                    try:
+                        outcomes.append((future, job(), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+            if self._save_requested:
+                self._save_requested = False
+                with self.output.capture() as captured:
+                    self.manager.save_expenses()
+                if captured:
+                    # save_expenses() reports failures by printing them
+                    failure = ApiError(500, captured_message(captured))
+                    outcomes = [(future, None, error or failure) for future, _, error in outcomes]
+            self.batches += 1
+            self.jobs += len(batch)
+            for future, result, error in outcomes:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+
+def parse_date(value, field: str = "date") -> str:
+    try:
+        return Date.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{field} must be a date in YYYY-MM-DD format")
+
+
+def parse_number(value, field: str) -> float:
+    if isinstance(value, bool):
+        raise ApiError(400, f"{field} must be a number")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{field} must be a number")
+
+
+def parse_int(value, field: str, low: int = 0, high: Optional[int] = None) -> int:
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{field} must be an integer")
+    if number < low or (high is not None and number > high):
+        raise ApiError(400, f"{field} must be between {low} and {high}" if high is not None
+                       else f"{field} must be at least {low}")
+    return number
+
+
+def parse_fields(data, require: bool = False) -> Dict:
+    """amount/category/note/date/currency from a JSON object, validated for
+    type. amount is in currency (rupees if absent)."""
+    if not isinstance(data, dict):
+        raise ApiError(400, "Expected a JSON object")
+    unknown = set(data) - set(FIELDS)
+    if unknown:
+        raise ApiError(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+    if require:
+        for field in ("amount", "category"):
+            if data.get(field) is None:
+                raise ApiError(400, f"{field} is required")
+    fields = {}
+    if data.get("amount") is not None:
+        fields["amount"] = parse_number(data["amount"], "amount")
+    for field in ("category", "note", "currency"):
+        if data.get(field) is not None:
+            if not isinstance(data[field], str):
+                raise ApiError(400, f"{field} must be a string")
+            fields[field] = data[field]
+    if data.get("date") is not None:
+        fields["date"] = parse_date(data["date"])
+    return fields
+
+
+def expense_to_json(expense) -> Dict:
+    """An expense as stored, plus its amount in rupees for clients that
+    do not want to handle paise"""
+    return dict(expense.to_dict(), amount=expense.amount)
+
+
+class ExpenseApi:
+    """The JSON endpoints over one ExpenseManager, independent of HTTP.
+
+    Reads run on the calling thread under the manager's lock; changes are
+    handed to the SerialWriter. Every response carries the ledger version
+    as its ETag (prefixed with a tag unique to this server process, so
+    tags never match across restarts): a GET with a matching If-None-Match
+    is answered 304 without running the query, and a change sent with
+    If-Match is refused with 412 once the ledger has moved on.
+    """
+
+    def __init__(self, manager: ExpenseManager, writer: SerialWriter):
+        self.manager = manager
+        self.writer = writer
+        self.instance = uuid.uuid4().hex[:8]
+
+    def ledger_etag(self) -> str:
+        return f'"{self.instance}-{self.manager.version}"'
+
+    def categories_etag(self) -> str:
+        return f'"{self.instance}-c{self.manager.category_registry.version}"'
+
+    def etag_for(self, route: str) -> str:
+        if self.manager.shared:
+            self.manager.sync()
+        return self.categories_etag() if route.startswith("/categories") else self.ledger_etag()
+
+    # Reads
+
+    def list_expenses(self, params: Dict[str, List[str]]) -> Dict:
+        criteria = {}
+        for field in ("date_from", "date_to"):
+            if field in params:
+                criteria[field] = parse_date(params[field][-1], field)
+        for field in ("min_amount", "max_amount"):
+            if field in params:
+                criteria[field] = parse_number(params[field][-1], field)
+        categories = [name for value in params.get("category", []) for name in value.split(",") if name]
+        if categories:
+            criteria["categories"] = categories
+        for field in ("text", "note_contains", "sort_by"):
+            if field in params:
+                criteria[field] = params[field][-1]
+        if criteria.get("sort_by") not in (None,) + SORT_FIELDS:
+            raise ApiError(400, f"sort_by must be one of {', '.join(SORT_FIELDS)}")
+        criteria["descending"] = params.get("descending", ["false"])[-1].lower() in ("1", "true", "yes")
+        offset = parse_int(params.get("offset", [0])[-1], "offset")
+        limit = parse_int(params.get("limit", [PAGE_SIZE])[-1], "limit", 1, MAX_PAGE_SIZE)
+
+        with self.manager.lock:
+            # One row past the page tells whether another page follows
+            rows = self.manager.query(offset=offset, limit=limit + 1, **criteria)
+            expenses = [expense_to_json(expense) for expense in rows[:limit]]
+        return {"expenses": expenses, "offset": offset, "limit": limit,
+                "next_offset": offset + limit if len(rows) > limit else None}
+
+    def get_expense(self, params: Dict, expense_id: str) -> Dict:
+        with self.manager.lock:
+            expense = self.manager.get_expense_by_id(int(expense_id))
+            if expense is None:
+                raise ApiError(404, f"Expense with ID {expense_id} not found")
+            return expense_to_json(expense)
+
+    def summary(self, params: Dict) -> Dict:
+        total, count, categories, months = self.manager.get_summary_totals()
+        return {"total": total, "count": count, "categories": categories, "months": months}
+
+    def report(self, params: Dict) -> Dict:
+        try:
+            if "group_by" in params:
+                stats = params.get("stats", ["sum,share"])[-1].split(",")
+                specs = [make_spec(fields.split(","), stats) for fields in params["group_by"]]
+            else:
+                specs = SUMMARY
+        except ValueError as e:
+            raise ApiError(400, str(e))
+        return report_to_dict(self.manager.build_report(specs))
+
+    def budgets(self, params: Dict) -> Dict:
+        month = params.get("month", [None])[-1]
+        if month is not None and not MONTH_PATTERN.match(month):
+            raise ApiError(400, "month must be in YYYY-MM format")
+        return {"budgets": [{"category": status.budget.category, "month": status.month,
+                             "limit": status.budget.limit, "spent": status.spent,
+                             "utilization": status.utilization, "level": status.level}
+                            for status in self.manager.budget_status(month)]}
+
+    def list_categories(self, params: Dict) -> Dict:
+        with self.manager.lock:
+            return self.manager.category_registry.to_dict()
+
+    # Changes; each returns a job for the writer thread
+
+    def _change(self, apply: Callable[[], Dict], status: int = 200, if_match: Optional[str] = None,
+                etag: Optional[Callable[[], str]] = None) -> Callable[[], Tuple[int, Dict, str]]:
+        etag = etag or self.ledger_etag
+
+        def job():
+            if if_match is not None and if_match != "*" and if_match != etag():
+                raise ApiError(412, "The resource changed since it was read")
+            return status, apply(), etag()
+        return job
+
+    @staticmethod
+    def _require(succeeded: bool, captured: List[str]) -> None:
+        if not succeeded:
+            raise ApiError(400, captured_message(captured))
+
+    def add_expenses(self, params: Dict, body, if_match: Optional[str] = None):
+        items = body if isinstance(body, list) else [body]
+        if not items:
+            raise ApiError(400, "Expected at least one expense")
+        items = [parse_fields(item, require=True) for item in items]
+        manager = self.manager
+
+        def apply():
+            with self.writer.output.capture() as captured:
+                succeeded = manager.add_expenses(items)
+            self._require(succeeded, captured)
+            # add_expenses reserves the batch's ids as one consecutive run
+            return {"ids": list(range(manager.ids.next - len(items), manager.ids.next))}
+        return self._change(apply, 201, if_match)
+
+    def update_expense(self, params: Dict, body, expense_id: str, if_match: Optional[str] = None):
+        return self.update_expenses(params, {expense_id: body}, if_match)
+
+    def update_expenses(self, params: Dict, body, if_match: Optional[str] = None):
+        if not isinstance(body, dict) or not body:
+            raise ApiError(400, 'Expected {"<id>": {field: value}, ...}')
+        try:
+            updates = {int(expense_id): parse_fields(fields) for expense_id, fields in body.items()}
+        except ValueError:
+            raise ApiError(400, "Expense ids must be integers")
+        manager = self.manager
+
+        def apply():
+            missing = [expense_id for expense_id in updates if manager.get_expense_by_id(expense_id) is None]
+            if missing:
+                raise ApiError(404, f"Expenses not found: {missing[:10]}")
+            with self.writer.output.capture() as captured:
+                succeeded = manager.update_expenses(updates)
+            self._require(succeeded, captured)
+            return {"updated": sorted(updates)}
+        return self._change(apply, 200, if_match)
+
+    def delete_expense(self, params: Dict, body, expense_id: str, if_match: Optional[str] = None):
+        return self.delete_expenses(params, {"ids": [int(expense_id)]}, if_match)
+
+    def delete_expenses(self, params: Dict, body, if_match: Optional[str] = None):
+        ids = body.get("ids") if isinstance(body, dict) else None
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+            raise ApiError(400, 'Expected {"ids": [<id>, ...]}')
+        manager = self.manager
+
+        def apply():
+            missing = [expense_id for expense_id in ids if manager.get_expense_by_id(expense_id) is None]
+            if missing:
+                raise ApiError(404, f"Expenses not found: {missing[:10]}")
+            with self.writer.output.capture() as captured:
+                succeeded = manager.delete_expenses(ids)
+            self._require(succeeded, captured)
+            return {"deleted": sorted(set(ids))}
+        return self._change(apply, 200, if_match)
+
+    def _category_change(self, method: Callable[..., bool], body, names: Tuple[str, ...],
+                         status: int, if_match: Optional[str]):
+        if not isinstance(body, dict) or not all(isinstance(body.get(name), str) for name in names):
+            raise ApiError(400, "Expected {" + ", ".join(f'"{name}": "..."' for name in names) + "}")
+        args = [body[name] for name in names]
+
+        def apply():
+            with self.writer.output.capture() as captured:
+                succeeded = method(*args)
+            self._require(succeeded, captured)
+            return self.manager.category_registry.to_dict()
+        return self._change(apply, status, if_match, self.categories_etag)
+
+    def add_category(self, params: Dict, body, if_match: Optional[str] = None):
+        return self._category_change(self.manager.add_category, body, ("name",), 201, if_match)
+
+    def rename_category(self, params: Dict, body, if_match: Optional[str] = None):
+        return self._category_change(self.manager.rename_category, body, ("old", "new"), 200, if_match)
+
+    def merge_category(self, params: Dict, body, if_match: Optional[str] = None):
+        return self._category_change(self.manager.merge_category, body, ("source", "target"), 200, if_match)
+
+
+# (method, path pattern, ExpenseApi method). GET handlers return the
+# response body; the others return a job for the SerialWriter.
+ROUTES = [
+    ("GET", r"/expenses", "list_expenses"),
+    ("POST", r"/expenses", "add_expenses"),
+    ("PATCH", r"/expenses", "update_expenses"),
+    ("DELETE", r"/expenses", "delete_expenses"),
+    ("GET", r"/expenses/(\d+)", "get_expense"),
+    ("PATCH", r"/expenses/(\d+)", "update_expense"),
+    ("DELETE", r"/expenses/(\d+)", "delete_expense"),
+    ("GET", r"/summary", "summary"),
+    ("GET", r"/report", "report"),
+    ("GET", r"/budgets", "budgets"),
+    ("GET", r"/categories", "list_categories"),
+    ("POST", r"/categories", "add_category"),
+    ("POST", r"/categories/rename", "rename_category"),
+    ("POST", r"/categories/merge", "merge_category"),
+]
+ROUTES = [(method, re.compile(pattern + "/?$"), name) for method, pattern, name in ROUTES]
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so clients reuse connections
+    server_version = "ExpenseTracker"
+    timeout = 10  # idle keep-alive connections give their worker back
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # second waits for the client's delayed ACK (~40 ms per request)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _route(self, method: str, path: str):
+        allowed = False
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(path)
+            if match:
+                if route_method == method:
+                    return getattr(self.server.api, name), match.groups()
+                allowed = True
+        raise ApiError(405 if allowed else 404, f"No {method} endpoint at {path}" if allowed
+                       else f"Unknown path {path}")
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            raise ApiError(413, f"Request body is larger than {MAX_BODY} bytes")
+        if not length:
+            return None
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError as e:
+            raise ApiError(400, f"Invalid JSON: {e}")
+
+    def _handle(self, method: str) -> None:
+        url = urlsplit(self.path)
+        etag = None
+        try:
+            body = self._read_body() if method != "GET" else None
+            handler, groups = self._route(method, url.path)
+            params = parse_qs(url.query)
+            if method == "GET":
+                etag = self.server.api.etag_for(url.path)
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(304, None, etag)
+                    return
+                status, payload = 200, handler(params, *groups)
+            else:
+                job = handler(params, body, *groups, if_match=self.headers.get("If-Match"))
+                status, payload, etag = self.server.writer.submit(job).result()
+        except ApiError as e:
+            status, payload, etag = e.status, {"error": e.message}, None
+        except Exception as e:
+            status, payload, etag = 500, {"error": f"Internal error: {e}"}, None
+        self._send(status, payload, etag)
+
+    def _send(self, status: int, payload, etag: Optional[str]) -> None:
+        data = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        if payload is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ExpenseServer(HTTPServer):
+    """HTTP server answering requests on a fixed pool of worker threads.
+    A worker serves one connection at a time, keep-alive included."""
+
+    def __init__(self, manager: ExpenseManager, address: Tuple[str, int] = ("127.0.0.1", DEFAULT_PORT),
+                 workers: int = 16, verbose: bool = False):
+        super().__init__(address, ApiHandler)
+        self.verbose = verbose
+        self.output = ThreadOutput(sys.stdout)
+        sys.stdout = self.output
+        self.writer = SerialWriter(manager, self.output)
+        self.api = ExpenseApi(manager, self.writer)
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="expense-api")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        """Stop accepting, let running requests finish and write what the
+        writer still has queued"""
+        super().server_close()
+        self.pool.shutdown(wait=True)
+        self.writer.stop()
+        sys.stdout = self.output.stream
+
+
+def serve(data_file: str = "expenses.json", host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+          workers: int = 16, verbose: bool = False, journal: bool = False) -> None:
+    """Open the ledger and serve the JSON API until interrupted"""
+    # Journal mode appends each batch of changes instead of rewriting the
+    # whole snapshot, which suits a write-heavy API on a large ledger
+    manager = create_manager(data_file, cache=True, **({"journal": True} if journal else {}))
+    server = ExpenseServer(manager, (host, port), workers, verbose)
+    print(f"Serving {data_file} on http://{host}:{server.server_address[1]}/ (Ctrl+C to stop)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve an expense ledger as a local HTTP/JSON API")
+    parser.add_argument("ledger", nargs="?", default="expenses.json")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=16, help="threads answering requests")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    parser.add_argument("--journal", action="store_true",
+                        help="append changes to the journal between snapshots (single-file JSON ledgers)")
+    args = parser.parse_args(argv)
+    serve(args.ledger, args.host, args.port, args.workers, args.verbose, args.journal)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
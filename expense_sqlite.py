@@ -0,0 +1,553 @@
+import json
+import sqlite3
+import sys
+import threading
+from datetime import date as Date
+from typing import List, Dict, Callable, Iterable, Iterator, Optional, Tuple
+
+from expense_budget import BudgetBook
+from expense_categories import CategoryRegistry
+from expense_history import FIELDS, History, field_changes
+from expense_ids import IdAllocator
+from expense_import import ImportResult, dedupe_key, drop_duplicates, iter_import_batches
+from expense_metrics import timed
+from expense_money import RateTable, to_minor
+from expense_query import SORT_FIELDS, tokenize
+from expense_reports import ReportCache
+from expense_tracker import Expense, ExpenseManager, exclusive, synchronized
+
+
+TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    id INTEGER PRIMARY KEY,
+    paise INTEGER NOT NULL,
+    category TEXT NOT NULL COLLATE NOCASE,
+    note TEXT NOT NULL DEFAULT '',
+    date TEXT NOT NULL,
+    currency TEXT,
+    original INTEGER
+);
+"""
+
+SCHEMA = TABLE.format(name="expenses") + """
+CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date);
+CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses (category);
+CREATE INDEX IF NOT EXISTS idx_expenses_category_date ON expenses (category, date);
+"""
+
+COLUMNS = "id, paise, category, note, date, currency, original"
+PLACEHOLDERS = "?, ?, ?, ?, ?, ?, ?"
+UPDATE_COLUMNS = "paise = ?, category = ?, note = ?, date = ?, currency = ?, original = ?"
+
+# Databases from before amounts were kept in paise have a REAL amount
+# column. The table is rebuilt in one transaction, converting each amount
+# with to_minor() exactly as JSON ledgers are converted.
+MIGRATE_TO_PAISE = "BEGIN;" + TABLE.format(name="expenses_paise") + """
+INSERT INTO expenses_paise (id, paise, category, note, date)
+    SELECT id, to_minor(amount), category, note, date FROM expenses;
+DROP TABLE expenses;
+ALTER TABLE expenses_paise RENAME TO expenses;
+COMMIT;
+"""
+
+
+def row_of(expense: Expense) -> tuple:
+    """expense as a tuple in COLUMNS order"""
+    currency, original = expense.foreign or (None, None)
+    return expense.id, expense.paise, expense.category, expense.note, expense.date, currency, original
+
+
+def set_fields(expense: Expense, fields: Dict) -> None:
+    """Apply ExpenseManager._priced_fields() output to an expense"""
+    for field in ("category", "note", "date"):
+        if fields.get(field) is not None:
+            setattr(expense, field, fields[field])
+    if "paise" in fields:
+        expense.paise = fields["paise"]
+        expense.foreign = (fields["currency"], fields["original"]) if fields["currency"] is not None else None
+
+
+class SqliteExpenseManager(ExpenseManager):
+    """ExpenseManager that keeps the ledger in a SQLite database.
+
+    Rows are not held in memory. Lookups, filters and summaries run as SQL
+    against the id primary key and the date/category indexes.
+    """
+
+    def __init__(self, data_file: str = "expenses.db", load: bool = True, history: bool = False):
+        self.data_file = data_file
+        self.category_registry = CategoryRegistry(data_file + ".categories.json", self.DEFAULT_CATEGORIES)
+        self.categories = self.category_registry.names
+        self.ids = IdAllocator(data_file + ".ids.json")
+        self.lock = threading.RLock()
+        self.save_scheduler = None
+        self.shared = False
+        self.version = 0
+        self._month_versions = {}
+        self._reset_version = 0
+        self.report_cache = ReportCache()
+        self.budget = BudgetBook.load(data_file + ".budget.json")
+        self.budget_alerts = []
+        self.rates = RateTable.load(data_file + ".rates.json")
+        self.history = History(data_file + ".history") if history else None
+        # Reports may be built on a background worker thread
+        self.conn = sqlite3.connect(data_file, check_same_thread=False)
+        self.conn.create_function("has_words", 2, lambda note, text: tokenize(text) <= tokenize(note),
+                                  deterministic=True)
+        self.conn.create_function("to_minor", 1, to_minor, deterministic=True)
+        if load:
+            self.load_expenses()
+
+    @property
+    def expenses(self) -> List[Expense]:
+        """Every row as an Expense object; this reads the whole table"""
+        cursor = self.conn.execute(f"SELECT {COLUMNS} FROM expenses ORDER BY id")
+        return [self._row_to_expense(row) for row in cursor]
+
+    @staticmethod
+    def _row_to_expense(row: tuple) -> Expense:
+        expense_id, paise, category, note, date, currency, original = row
+        return Expense.from_paise(paise, category, note, date, expense_id,
+                                  (currency, original) if currency is not None else None)
+
+    @timed()
+    @synchronized
+    def load_expenses(self) -> None:
+        """Create the schema if needed and make sure no existing id is handed out again"""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(expenses)")]
+        if "amount" in columns:
+            self.conn.executescript(MIGRATE_TO_PAISE)
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+        max_id = self.conn.execute("SELECT MAX(id) FROM expenses").fetchone()[0]
+        if max_id is not None:
+            self.ids.observe(max_id)
+        self.category_registry.refresh()
+        if self.category_registry.add_missing(
+                [row[0] for row in self.conn.execute("SELECT DISTINCT category FROM expenses")]):
+            self.category_registry.save()
+
+    def iter_load(self, batch_size: int = 1000) -> Iterator[int]:
+        """Rows stay in the database, so loading is a single step"""
+        self.load_expenses()
+        yield self.get_totals()[1]
+
+    @timed()
+    @exclusive
+    def save_expenses(self) -> None:
+
+        try:
+            self.conn.commit()
+        except Exception as e:
+            print(f"Error saving expenses: {e}")
+
+    def close(self) -> None:
+        self.conn.close()
+        self.ids.close()
+
+    @timed()
+    @exclusive
+    def add_expense(self, amount: float, category: str, note: str = "", currency: str = None) -> bool:
+
+        try:
+            if not self._check_fields(amount, category):
+                return False
+
+            date = Date.today().isoformat()
+            paise, foreign = self._price(amount, currency, date)
+            expense = Expense.from_paise(paise, category, note, date, self.ids.reserve(), foreign)
+            with self.conn:
+                self.conn.execute(f"INSERT INTO expenses ({COLUMNS}) VALUES ({PLACEHOLDERS})", row_of(expense))
+            self._touch((expense.date[:7],))
+            self._record("add", [[expense.id, None, expense.to_dict()]])
+            print(f"Expense added successfully: {expense}")
+            self._check_budgets([expense])
+            return True
+        except Exception as e:
+            print(f"Error adding expense: {e}")
+            return False
+
+    @timed()
+    @exclusive
+    def update_expense(self, expense_id: int, amount: float = None, category: str = None, note: str = None, date: str = None,
+                       currency: str = None) -> bool:
+
+        try:
+            expense = self.get_expense_by_id(expense_id)
+            if not expense:
+                print(f"Expense with ID {expense_id} not found")
+                return False
+
+            if not self._check_fields(amount, category):
+                return False
+
+            fields = self._priced_fields(expense, {"amount": amount, "category": category, "note": note,
+                                                   "date": date, "currency": currency})
+            before = expense.to_dict()
+            old_month = expense.date[:7]
+            set_fields(expense, fields)
+
+            with self.conn:
+                self.conn.execute(f"UPDATE expenses SET {UPDATE_COLUMNS} WHERE id = ?", row_of(expense)[1:] + (expense.id,))
+            self._touch({old_month, expense.date[:7]})
+            self._record("update", [[expense.id, *field_changes(before, expense.to_dict())]])
+            print(f"Expense updated successfully: {expense}")
+            self._check_budgets([expense])
+            return True
+        except Exception as e:
+            print(f"Error updating expense: {e}")
+            return False
+
+    @timed()
+    @exclusive
+    def delete_expense(self, expense_id: int) -> bool:
+
+        try:
+            expense = self.get_expense_by_id(expense_id)
+            if not expense:
+                print(f"Expense with ID {expense_id} not found")
+                return False
+
+            with self.conn:
+                self.conn.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
+            self._touch((expense.date[:7],))
+            self._record("delete", [[expense.id, expense.to_dict(), None]])
+            print(f"Expense deleted successfully: {expense}")
+            return True
+        except Exception as e:
+            print(f"Error deleting expense: {e}")
+            return False
+
+    def get_expense_by_id(self, expense_id: int) -> Optional[Expense]:
+
+        row = self.conn.execute(f"SELECT {COLUMNS} FROM expenses WHERE id = ?", (expense_id,)).fetchone()
+        return self._row_to_expense(row) if row else None
+
+    def get_page(self, offset: int, limit: int) -> List[Expense]:
+
+        cursor = self.conn.execute(f"SELECT {COLUMNS} FROM expenses ORDER BY id LIMIT ? OFFSET ?", (limit, offset))
+        return [self._row_to_expense(row) for row in cursor]
+
+    @timed()
+    @exclusive
+    def add_expenses(self, items: List[Dict]) -> bool:
+
+        try:
+            added = []
+            for i, item in enumerate(items):
+                if not self._check_fields(item["amount"], item["category"]):
+                    print(f"Batch rejected: item {i} is invalid")
+                    return False
+                try:
+                    date = item.get("date")
+                    date = Date.fromisoformat(date).isoformat() if date else Date.today().isoformat()
+                    paise, foreign = self._price(item["amount"], item.get("currency"), date)
+                except ValueError as e:
+                    print(f"Batch rejected: item {i}: {e}")
+                    return False
+                added.append(Expense.from_paise(paise, item["category"], item.get("note", ""), date, None, foreign))
+            for expense_id, expense in enumerate(added, self.ids.reserve(len(added))):
+                expense.id = expense_id
+            with self.conn:
+                self.conn.executemany(f"INSERT INTO expenses ({COLUMNS}) VALUES ({PLACEHOLDERS})",
+                                      [row_of(expense) for expense in added])
+            self._touch({expense.date[:7] for expense in added})
+            self._record("add", [[expense.id, None, expense.to_dict()] for expense in added])
+            print(f"Added {len(added)} expenses")
+            self._check_budgets(added)
+            return True
+        except Exception as e:
+            print(f"Error adding expenses: {e}")
+            return False
+
+    @timed()
+    @exclusive
+    def update_expenses(self, updates: Dict[int, Dict]) -> bool:
+
+        try:
+            updated = []
+            changes = []
+            months = set()
+            for expense_id, fields in updates.items():
+                expense = self.get_expense_by_id(expense_id)
+                if not expense:
+                    print(f"Batch rejected: expense with ID {expense_id} not found")
+                    return False
+                months.add(expense.date[:7])
+                if not self._check_fields(fields.get("amount"), fields.get("category")):
+                    print(f"Batch rejected: update for ID {expense_id} is invalid")
+                    return False
+                try:
+                    fields = self._priced_fields(expense, fields)
+                except ValueError as e:
+                    print(f"Batch rejected: update for ID {expense_id}: {e}")
+                    return False
+                before = expense.to_dict()
+                set_fields(expense, fields)
+                updated.append(expense)
+                changes.append([expense_id, *field_changes(before, expense.to_dict())])
+
+            with self.conn:
+                self.conn.executemany(f"UPDATE expenses SET {UPDATE_COLUMNS} WHERE id = ?",
+                                      [row_of(expense)[1:] + (expense.id,) for expense in updated])
+            self._touch(months | {expense.date[:7] for expense in updated})
+            self._record("update", changes)
+            print(f"Updated {len(updated)} expenses")
+            self._check_budgets(updated)
+            return True
+        except Exception as e:
+            print(f"Error updating expenses: {e}")
+            return False
+
+    @timed()
+    @exclusive
+    def delete_expenses(self, expense_ids: List[int]) -> bool:
+
+        try:
+            found = {expense_id: self.get_expense_by_id(expense_id) for expense_id in expense_ids}
+            missing = [expense_id for expense_id, expense in found.items() if expense is None]
+            if missing:
+                print(f"Batch rejected: expenses not found: {missing[:10]}")
+                return False
+
+            with self.conn:
+                self.conn.executemany("DELETE FROM expenses WHERE id = ?", [(i,) for i in expense_ids])
+            self._touch({expense.date[:7] for expense in found.values()})
+            self._record("delete", [[expense.id, expense.to_dict(), None] for expense in found.values()])
+            print(f"Deleted {len(expense_ids)} expenses")
+            return True
+        except Exception as e:
+            print(f"Error deleting expenses: {e}")
+            return False
+
+    @timed()
+    @synchronized
+    def query(self, date_from: str = None, date_to: str = None, min_amount: float = None, max_amount: float = None,
+              categories: Iterable[str] = None, text: str = None, note_contains: str = None,
+              sort_by: str = None, descending: bool = False, offset: int = 0, limit: int = None) -> List[Expense]:
+        """Same criteria as ExpenseManager.query, run as one SQL statement"""
+        if sort_by is not None and sort_by not in SORT_FIELDS:
+            print(f"Invalid sort field. Available fields: {', '.join(SORT_FIELDS)}")
+            return []
+
+        clauses = []
+        params = []
+        for clause, value in (("date >= ?", date_from), ("date <= ?", date_to),
+                              ("paise >= ?", None if min_amount is None else to_minor(min_amount)),
+                              ("paise <= ?", None if max_amount is None else to_minor(max_amount))):
+            if value is not None and value != "":
+                clauses.append(clause)
+                params.append(value)
+        if categories:
+            categories = list(categories)
+            # The category column is NOCASE, so this matches case-insensitively
+            clauses.append(f"category IN ({', '.join('?' * len(categories))})")
+            params.extend(categories)
+        words = tokenize(text) if text else None
+        if words:
+            # LIKE narrows the rows cheaply; has_words then checks whole words
+            for word in sorted(words):
+                clauses.append("note LIKE ?")
+                params.append(f"%{word}%")
+            clauses.append("has_words(note, ?)")
+            params.append(text)
+        if note_contains:
+            clauses.append("instr(lower(note), ?) > 0")
+            params.append(note_contains.lower())
+
+        sql = f"SELECT {COLUMNS} FROM expenses"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        direction = " DESC" if descending else ""
+        if sort_by == "amount":
+            sort_by = "paise"
+        sql += f" ORDER BY {sort_by}{direction}, id" if sort_by else f" ORDER BY id{direction}"
+        sql += " LIMIT ? OFFSET ?"
+        params.extend((-1 if limit is None else limit, offset))
+        return [self._row_to_expense(row) for row in self.conn.execute(sql, params)]
+
+    @timed()
+    @exclusive
+    def import_file(self, path: str, fmt: str = None, default_category: str = None, dedupe: bool = True,
+                    workers: int = 1, rejects_file: str = None, batch_size: int = 10000) -> Optional[ImportResult]:
+        """Same pipeline as ExpenseManager.import_file, inserted in a single transaction"""
+        result = ImportResult()
+        first_id = None
+        seen = None
+        if dedupe:
+            cursor = self.conn.execute("SELECT date, paise, note FROM expenses")
+            seen = {dedupe_key(date, paise, note) for date, paise, note in cursor}
+        try:
+            with self.conn:
+                for rows, rejects in iter_import_batches(path, self.categories, fmt, default_category,
+                                                         workers, batch_size):
+                    result.rejects.extend(rejects)
+                    if seen is not None:
+                        rows = drop_duplicates(rows, seen, result)
+                    batch_id = self.ids.reserve(len(rows))
+                    if first_id is None:
+                        first_id = batch_id
+                    self.conn.executemany(f"INSERT INTO expenses ({COLUMNS}) VALUES ({PLACEHOLDERS})",
+                                          [(expense_id, paise, category, note, date, None, None) for expense_id, (
+                                              date, paise, category, note) in enumerate(rows, batch_id)])
+                    result.added += len(rows)
+                    self._touch({row[0][:7] for row in rows})
+        except Exception as e:
+            # The transaction is rolled back; the reserved ids are left unused
+            print(f"Error importing expenses: {e}")
+            return None
+
+        if result.added and self.history is not None:
+            # Ids only go up, so the imported rows are the ones from the first batch's on
+            cursor = self.conn.execute(f"SELECT {COLUMNS} FROM expenses WHERE id >= ? ORDER BY id", (first_id,))
+            self._record("import", [[row[0], None, self._row_to_expense(row).to_dict()] for row in cursor])
+        if rejects_file and result.rejects:
+            result.write_rejects(rejects_file)
+            print(f"Rejected rows written to: {rejects_file}")
+        print(result)
+        return result
+
+    @synchronized
+    def _apply_changes(self, changes: List[list], log: Callable[[List[list]], None]) -> None:
+        """Same as ExpenseManager._apply_changes, in one transaction"""
+        applied = []
+        months = set()
+        with self.conn:
+            for change in changes:
+                expense_id, before, after = change
+                row = self.conn.execute("SELECT date FROM expenses WHERE id = ?", (expense_id,)).fetchone()
+                if after is None:
+                    if row:
+                        self.conn.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
+                        months.add(row[0][:7])
+                        applied.append(change)
+                elif before is None:
+                    if not row:
+                        expense = Expense.from_dict(dict(after, id=expense_id))
+                        self.conn.execute(f"INSERT INTO expenses ({COLUMNS}) VALUES ({PLACEHOLDERS})",
+                                          row_of(expense))
+                        self.ids.observe(expense_id)
+                        months.add(expense.date[:7])
+                        applied.append(change)
+                elif row:
+                    fields = [field for field in FIELDS if field in after]
+                    assignments = ", ".join(f"{field} = ?" for field in fields)
+                    self.conn.execute(f"UPDATE expenses SET {assignments} WHERE id = ?",
+                                      [after[field] for field in fields] + [expense_id])
+                    months.update((row[0][:7], after.get("date", row[0])[:7]))
+                    applied.append(change)
+        self._touch(months)
+        self._register_categories(applied)
+        log(applied)
+
+    def _recategorize(self, old: str, new: str) -> None:
+        # A single UPDATE, found through the category index
+        with self.conn:
+            moved = self.conn.execute("UPDATE expenses SET category = ? WHERE category = ?", (new, old)).rowcount
+        if moved:
+            self._touch_all()
+        if self.budget.recategorize(old, new):
+            self.budget.save()
+
+    @synchronized
+    def get_totals(self) -> Tuple[float, int]:
+
+        # SUM of an INTEGER column is an exact integer; TOTAL would be a float
+        total, count = self.conn.execute("SELECT COALESCE(SUM(paise), 0), COUNT(*) FROM expenses").fetchone()
+        return total / 100, count
+
+    @synchronized
+    def get_category_month_totals(self) -> Dict[Tuple[str, str], float]:
+
+        cursor = self.conn.execute(
+            "SELECT category, substr(date, 1, 7), SUM(paise) FROM expenses GROUP BY category, substr(date, 1, 7)")
+        return {(category, month): total / 100 for category, month, total in cursor}
+
+    def _month_spent(self, category: Optional[str], month: str) -> float:
+
+        sql = "SELECT COALESCE(SUM(paise), 0) FROM expenses WHERE date BETWEEN ? AND ?"
+        params = [month + "-01", month + "-31"]
+        if category is not None:
+            sql += " AND category = ?"
+            params.append(category)
+        return self.conn.execute(sql, params).fetchone()[0] / 100
+
+    @synchronized
+    def get_summary_totals(self) -> Tuple[float, int, Dict[str, float], Dict[str, float]]:
+
+        total_spent = 0
+        count = 0
+        category_totals = {}
+        month_totals = {}
+        # One grouped pass over the table; the per-month rollup happens here
+        cursor = self.conn.execute(
+            "SELECT category, substr(date, 1, 7), SUM(paise), COUNT(*) "
+            "FROM expenses GROUP BY category, substr(date, 1, 7)")
+        for category, month, total, rows in cursor:
+            total_spent += total
+            count += rows
+            category_totals[category] = category_totals.get(category, 0) + total
+            month_totals[month] = month_totals.get(month, 0) + total
+        return (total_spent / 100, count, {category: total / 100 for category, total in category_totals.items()},
+                {month: total / 100 for month, total in month_totals.items()})
+
+    def _export_rows(self) -> Iterator[Tuple]:
+
+        return self.conn.execute(f"SELECT {COLUMNS} FROM expenses ORDER BY id")
+
+    def _report_rows(self) -> Iterator[Tuple[str, str, int]]:
+
+        return self.conn.execute("SELECT category, date, paise FROM expenses")
+
+    def _report_rows_for_months(self, months: List[str]) -> Iterator[Tuple[str, str, int]]:
+
+        for month in months:
+            yield from self.conn.execute("SELECT category, date, paise FROM expenses WHERE date BETWEEN ? AND ?",
+                                         (month + "-01", month + "-31"))
+
+    def _category_month_cells(self) -> Dict[Tuple[str, str], Tuple[int, int]]:
+
+        cursor = self.conn.execute(
+            "SELECT category, substr(date, 1, 7), SUM(paise), COUNT(*) "
+            "FROM expenses GROUP BY category, substr(date, 1, 7)")
+        return {(category, month): (total, count) for category, month, total, count in cursor}
+
+    def migrate_json(self, json_file: str) -> int:
+        """Import an expenses.json ledger, returning the number of rows copied.
+        Expenses whose id is already in the database, or repeated in the
+        file, get new ids instead of replacing the earlier row."""
+        with open(json_file, 'r') as f:
+            data = json.load(f)
+
+        expenses = [Expense.from_dict(d) for d in data]
+        with self.lock:
+            taken = {expense_id for (expense_id,) in self.conn.execute("SELECT id FROM expenses")}
+            for expense in expenses:
+                if expense.id is not None:
+                    self.ids.observe(expense.id)
+            renumbered = 0
+            for expense in expenses:
+                if expense.id is None or expense.id in taken:
+                    expense.id = self.ids.reserve()
+                    renumbered += 1
+                taken.add(expense.id)
+            with self.conn:
+                self.conn.executemany(f"INSERT INTO expenses ({COLUMNS}) VALUES ({PLACEHOLDERS})",
+                                      [row_of(expense) for expense in expenses])
+            self._touch_all()
+            self.load_expenses()
+        if renumbered:
+            print(f"Gave new ids to {renumbered} expenses whose ids were already taken")
+        return len(expenses)
+
+
+def migrate_json_to_sqlite(json_file: str = "expenses.json", db_file: str = "expenses.db") -> SqliteExpenseManager:
+    """One-shot migration of a JSON ledger into a SQLite database"""
+    manager = SqliteExpenseManager(db_file)
+    count = manager.migrate_json(json_file)
+    print(f"Migrated {count} expenses from {json_file} to {db_file}")
+    return manager
+
+
+if __name__ == "__main__":
+    migrate_json_to_sqlite(*sys.argv[1:3]).close()
@@ -0,0 +1,343 @@
+import contextlib
+import itertools
+import json
+import marshal
+import os
+import re
+import tempfile
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Ledger records are flat dicts. For those the C encoder with these
+# separators produces exactly the body of json.dumps(record, indent=2) at
+# element depth, at a fraction of the cost of the pure-Python indent path.
+_FLAT_ENCODER = json.JSONEncoder(separators=(",\n    ", ": "))
+_INDENT_ENCODER = json.JSONEncoder(indent=2)
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_SEPARATOR = re.compile(r"[ \t\n\r]*([,\]])[ \t\n\r]*")
+
+
+def _encode_element(record: Dict) -> str:
+    if not record or any(isinstance(value, (dict, list, tuple)) for value in record.values()):
+        return _INDENT_ENCODER.encode(record).replace("\n", "\n  ")
+    return "{\n    " + _FLAT_ENCODER.encode(record)[1:-1] + "\n  }"
+
+
+def _encode_flat_batch(records: List[Dict]) -> str:
+    # One C-level encode for the whole batch. Encoded strings never contain
+    # a raw newline, so "},\n    {" only occurs between two records.
+    body = _FLAT_ENCODER.encode(records)[2:-2].replace("},\n    {", "\n  },\n  {\n    ")
+    return "{\n    " + body + "\n  }"
+
+
+# Read once, as the only way to read the umask is to set it, which would
+# race with files other threads are creating
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _file_mode(path: str) -> int:
+    """Permission bits path has, or that open() would give a new file"""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+@contextlib.contextmanager
+def atomic_open(path: str, mode: str = 'w'):
+    """Open a temp file next to path for writing; on success it is flushed to
+    disk and renamed over path, on failure it is removed. The result keeps
+    path's permissions (mkstemp creates owner-only files), so a ledger
+    shared between users stays readable and writable by all of them."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_snapshot(path: str, records: Iterable[Dict], batch_size: int = 1000, flat: bool = False) -> int:
+    """Atomically replace path with a JSON array of records.
+
+    Records are serialized a batch at a time, so the full list of dicts is
+    never built. The output is byte-identical to json.dump(list(records), f,
+    indent=2). Pass flat=True when no record is empty or holds a dict or
+    list, which lets whole batches go through the C encoder. Returns the
+    number of bytes written.
+    """
+    written = 0
+    with atomic_open(path) as f:
+        if flat:
+            records = iter(records)
+            while True:
+                batch = list(itertools.islice(records, batch_size))
+                if not batch:
+                    break
+                data = ("[\n  " if not written else ",\n  ") + _encode_flat_batch(batch)
+                f.write(data)
+                written += len(data)
+        chunk = []
+        for record in records:
+            prefix = "[\n  " if not written and not chunk else ",\n  "
+            chunk.append(prefix + _encode_element(record))
+            if len(chunk) >= batch_size:
+                data = "".join(chunk)
+                f.write(data)
+                written += len(data)
+                chunk = []
+        chunk.append("\n]" if written or chunk else "[]")
+        data = "".join(chunk)
+        f.write(data)
+        written += len(data)
+    return written
+
+
+def write_json(path: str, data) -> None:
+    """Atomically replace path with data as indented JSON"""
+    with atomic_open(path) as f:
+        json.dump(data, f, indent=2)
+
+
+# First record of a ledger cache file; bump it when the payload layout changes
+CACHE_FORMAT = "expense-cache-2"
+
+
+def write_cache(path: str, identity: Tuple[int, int], payload) -> None:
+    """Atomically write a binary cache of a parsed ledger. identity is the
+    (mtime_ns, size) of the source file the payload was parsed from."""
+    with atomic_open(path, 'wb') as f:
+        f.write(marshal.dumps((CACHE_FORMAT, tuple(identity))))
+        f.write(marshal.dumps(payload))
+
+
+def read_cache(path: str, identity: Tuple[int, int]) -> Optional[object]:
+    """The payload of the cache at path, or None if it is missing, damaged or
+    was written for a source file with a different mtime or size"""
+    header = marshal.dumps((CACHE_FORMAT, tuple(identity)))
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(header)) != header:
+                return None
+            # marshal.loads on one buffer is several times faster than
+            # marshal.load pulling from the file object
+            return marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    """Yield the elements of a top-level JSON array one at a time.
+
+    The file is read in chunks and each element is decoded as soon as it is
+    complete, so memory stays proportional to one chunk rather than the
+    whole file. Raises ValueError on malformed input.
+    """
+    scan_once = json.JSONDecoder().scan_once
+    with open(path, 'r') as f:
+        buffer = f.read(chunk_size)
+        eof = False
+        position = _WHITESPACE.match(buffer).end()
+        if buffer[position:position + 1] != "[":
+            raise ValueError("expected a JSON array")
+        position = _WHITESPACE.match(buffer, position + 1).end()
+        while position == len(buffer) and not eof:
+            data = f.read(chunk_size)
+            eof = not data
+            buffer += data
+            position = _WHITESPACE.match(buffer, position).end()
+        if buffer[position:position + 1] == "]":
+            return
+
+        while True:
+            # An element only counts once the separator after it has been
+            # read, so one that straddles the end of the buffer is simply
+            # decoded again after the next read
+            position = _WHITESPACE.match(buffer, position).end()
+            # Fast path for files written by json.dump(indent=2): raw newlines
+            # never occur inside JSON strings, so "\n  }," only appears where
+            # a top-level element ends. Everything up to the last one in the
+            # buffer can be decoded in a single C-level json.loads call.
+            cut = buffer.rfind("\n  },", position)
+            if cut != -1:
+                try:
+                    elements = json.loads("[" + buffer[position:cut + 4] + "]")
+                except ValueError:
+                    elements = None
+                if elements is not None:
+                    yield from elements
+                    position = cut + 5
+                    continue
+            try:
+                element, end = scan_once(buffer, position)
+                separator = _SEPARATOR.match(buffer, end) if end < len(buffer) else None
+            except (StopIteration, ValueError):
+                separator = None
+            if separator is None:
+                if eof:
+                    raise ValueError(f"malformed JSON array near offset {position}")
+                data = f.read(chunk_size)
+                eof = not data
+                buffer = buffer[position:] + data
+                position = 0
+                continue
+
+            yield element
+            if separator.group(1) == "]":
+                return
+            position = separator.end()
+
+
+class ExpenseJournal:
+    """Append-only log of ledger mutations stored next to the snapshot file.
+
+    Each record is one compact JSON object per line. A record only counts
+    once its trailing newline is on disk, so a crash mid-write leaves a torn
+    last line that replay() discards. offset is the byte position just past
+    the last record read or written, so a reader can pick up only what was
+    appended after it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.record_count = 0
+        self.offset = 0
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def append(self, record: Dict) -> None:
+        self.append_many([record])
+
+    def append_many(self, records: List[Dict]) -> None:
+        if not records:
+            return
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records).encode('utf-8')
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+        self.record_count += len(records)
+        self.offset += len(data)
+
+    def replay(self, start: int = 0) -> Iterator[Dict]:
+        """Yield the valid records from byte offset start on, cutting off a torn tail"""
+        if start == 0:
+            self.record_count = 0
+        self.offset = start
+        if not os.path.exists(self.path):
+            return
+        torn = False
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    torn = True
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    torn = True
+                    break
+                self.offset += len(line)
+                self.record_count += 1
+                yield record
+        if torn:
+            # Drop the partial record so later appends start on a clean line
+            with open(self.path, 'r+b') as f:
+                f.truncate(self.offset)
+
+    def discard_before(self, offset: int, records: int) -> None:
+        """Drop the first records records, which end at byte offset, keeping
+        any appended after them. A crash part-way leaves them in place, and
+        replaying them over a snapshot that already holds them is harmless."""
+        if offset >= self.offset:
+            self.clear()
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            tail = f.read(self.offset - offset)
+        with atomic_open(self.path, 'wb') as f:
+            f.write(tail)
+        self.record_count -= records
+        self.offset -= offset
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.record_count = 0
+        self.offset = 0
+
+
+class FileLock:
+    """Exclusive advisory lock held through a side file, shared by every
+    process that opens the same ledger. Re-entrant within one process."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+        self._depth = 0
+
+    def acquire(self) -> None:
+        if self._depth == 0:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            _lock_file(self._fd)
+        self._depth += 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            _unlock_file(self._fd)
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._depth = 0
+
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+if fcntl is not None:
+    def _lock_file(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock_file(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+else:
+    def _lock_file(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                # LK_LOCK itself only retries for about 10 seconds
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
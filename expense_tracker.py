@@ -1,103 +1,818 @@
 
 
-import json
+import collections
+import functools
+import gc
+import itertools
 import os
-from datetime import datetime
-from typing import List, Dict, Optional
+import sys
+import threading
+from datetime import date as Date, datetime
+from typing import List, Dict, Callable, Iterable, Iterator, Optional, Tuple
+
+from contextlib import contextmanager, nullcontext
+
+from expense_reports import (SUMMARY, Partial, Report, ReportCache, cells_suffice, make_spec, render_text,
+                             scan_rows_by_month)
+from expense_categories import CategoryRegistry
+from expense_history import History, apply_to_rows, field_changes, invert
+from expense_ids import IdAllocator
+from expense_budget import FREQUENCIES, MONTH_PATTERN, WARN_AT, Budget, BudgetBook, BudgetStatus, RecurringRule
+from expense_metrics import metrics, timed
+from expense_money import BASE_CURRENCY, CURRENCY_CODE, RateTable, format_minor, minor_digits, to_minor
+from expense_storage import (ExpenseJournal, FileLock, iter_json_array, read_cache, write_cache, write_json,
+                             write_snapshot)
+
+
+def synchronized(method):
+    """Run a manager method while holding the manager's lock"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def exclusive(method):
+    """Run a manager method that changes the ledger. Besides the manager's
+    lock this holds the ledger file lock of a shared ledger, after first
+    catching up with whatever other processes wrote."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock, self._ledger_lock():
+            if self.shared:
+                self._sync()
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def gc_paused():
+    """Suspend the cyclic garbage collector while many objects are created at
+    once; otherwise it re-scans the growing heap over and over"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
 
 
 class Expense:
     
+    __slots__ = ("paise", "category", "note", "date", "id", "foreign")
     
     def __init__(self, amount: float, category: str, note: str = "", date: str = None, expense_id: int = None):
-        self.amount = amount
-        self.category = category
+        # Amounts are held as whole paise so sums are exact; amount is the
+        # rupee view of them
+        self.paise = to_minor(amount)
+        # Category names are interned: every expense in a category holds
+        # the same string object instead of its own copy
+        self.category = sys.intern(category)
         self.note = note
         self.date = date or datetime.now().strftime("%Y-%m-%d")
-        self.id = expense_id or int(datetime.now().timestamp())
+        # None until the expense is stored; managers assign ids from their
+        # IdAllocator
+        self.id = expense_id
+        # (currency, amount in its minor units) for an expense entered in
+        # another currency; paise then holds the converted amount
+        self.foreign = None
+    
+    @classmethod
+    def from_paise(cls, paise: int, category: str, note: str, date: str, expense_id: int,
+                   foreign: Tuple[str, int] = None) -> 'Expense':
+        expense = cls.__new__(cls)
+        expense.paise = paise
+        expense.category = sys.intern(category)
+        expense.note = note
+        expense.date = date
+        expense.id = expense_id
+        expense.foreign = foreign
+        return expense
+    
+    @property
+    def amount(self) -> float:
+        return self.paise / 100
+    
+    @amount.setter
+    def amount(self, value: float) -> None:
+        """Set the amount in rupees; the expense is then a rupee expense"""
+        self.paise = to_minor(value)
+        self.foreign = None
+    
+    @property
+    def currency(self) -> str:
+        return self.foreign[0] if self.foreign is not None else BASE_CURRENCY
     
     def to_dict(self) -> Dict:
         
-        return {
+        data = {
             "id": self.id,
-            "amount": self.amount,
+            "paise": self.paise,
             "category": self.category,
             "note": self.note,
             "date": self.date
         }
+        if self.foreign is not None:
+            data["currency"], data["original"] = self.foreign
+        return data
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'Expense':
         
-        expense = cls(data["amount"], data["category"], data["note"], data["date"], data["id"])
+        if "paise" in data:
+            expense = cls.from_paise(data["paise"], data["category"], data["note"], data["date"], data["id"])
+        else:
+            # Ledgers written before amounts were kept in paise hold rupee
+            # floats, which to_minor converts exactly
+            expense = cls(data["amount"], data["category"], data["note"], data["date"], data["id"])
+        if data.get("currency") is not None:
+            expense.foreign = (data["currency"], data["original"])
         return expense
     
+    @classmethod
+    def from_columns(cls, ids: List[int], paise: List[int], categories: List[str], notes: List[str],
+                     dates: List[str], foreign: List[Optional[Tuple[str, int]]]) -> List['Expense']:
+        """Build expenses from parallel columns. The slots are filled with
+        C-level map() calls instead of running __init__ once per row."""
+        expenses = list(map(cls.__new__, itertools.repeat(cls, len(ids))))
+        for field, values in (("id", ids), ("paise", paise), ("category", categories),
+                              ("note", notes), ("date", dates), ("foreign", foreign)):
+            collections.deque(map(getattr(cls, field).__set__, expenses, values), 0)
+        return expenses
+    
     def __str__(self) -> str:
-        return f"ID: {self.id} | Date: {self.date} | Category: {self.category} | Amount: Rs.{self.amount:.2f} | Note: {self.note}"
+        text = f"ID: {self.id} | Date: {self.date} | Category: {self.category} | Amount: Rs.{format_minor(self.paise)}"
+        if self.foreign is not None:
+            currency, original = self.foreign
+            text += f" ({currency} {format_minor(original, minor_digits(currency))})"
+        return text + f" | Note: {self.note}"
+
+
+def snapshot_records(columns) -> Iterator[Dict]:
+    """Expense.to_dict() of every row of ExpenseManager._snapshot_columns()"""
+    for expense_id, paise, category, note, date, foreign in zip(*columns):
+        record = {"id": expense_id, "paise": paise, "category": category, "note": note, "date": date}
+        if foreign is not None:
+            record["currency"], record["original"] = foreign
+        yield record
 
 
 class ExpenseManager:
     
+    DEFAULT_CATEGORIES = ["Food", "Travel", "Bills", "Entertainment", "Shopping", "Health", "Other"]
     
-    def __init__(self, data_file: str = "expenses.json"):
+    def __init__(self, data_file: str = "expenses.json", journal: bool = False, compact_threshold: int = 1000,
+                 columnar: bool = False, shared: bool = False, cache: bool = False, load: bool = True,
+                 history: bool = False):
         self.data_file = data_file
+        # With cache=True the parsed snapshot is also kept in a binary file,
+        # valid while the snapshot's mtime and size are unchanged, so a warm
+        # start skips JSON parsing
+        self.cache_file = data_file + ".cache" if cache else None
+        # Columnar mode keeps rows in a ColumnarExpenseList instead of a list
+        # of Expense objects; indexing it builds Expense objects on demand
+        self.columnar = columnar
         self.expenses: List[Expense] = []
-        self.categories = ["Food", "Travel", "Bills", "Entertainment", "Shopping", "Health", "Other"]
-        self.next_id = 1  # Counter for unique IDs
-        self.load_expenses()
+        self._positions: Dict[int, int] = {}  # expense id -> index in self.expenses
+        # Running aggregates, kept in step with every mutation.
+        # Each value is [total paise, count]; keys whose count drops to 0 are
+        # removed. Totals are whole paise, so they are exact.
+        self._total = 0
+        self._category_totals: Dict[str, list] = {}
+        self._month_totals: Dict[str, list] = {}
+        self._category_month_totals: Dict[Tuple[str, str], list] = {}
+        # Date and note-token indexes for query(); built on first use and
+        # then kept in step with every mutation
+        self._index = None
+        # Bumped by every mutation. Each month also remembers the version
+        # that last touched it, so cached per-month report results stay
+        # valid while other months are edited.
+        self.version = 0
+        self._month_versions: Dict[str, int] = {}
+        self._reset_version = 0
+        self.report_cache = ReportCache()
+        # Categories are persisted next to the ledger. self.categories is
+        # the registry's live list of names.
+        self.category_registry = CategoryRegistry(data_file + ".categories.json", self.DEFAULT_CATEGORIES)
+        self.categories = self.category_registry.names
+        # New ids come from a persisted allocator shared by every process
+        # and partition of the ledger, so they are never reused
+        self.ids = IdAllocator(data_file + ".ids.json")
+        # In journal mode mutations are appended to the journal and the
+        # snapshot is only rewritten once compact_threshold records pile up
+        self.journal_mode = journal or shared
+        self.compact_threshold = compact_threshold
+        self.journal = ExpenseJournal(data_file + ".journal")
+        # A shared ledger may be open in several processes at once. Every
+        # change is made under an OS file lock, after replaying what other
+        # processes appended to the journal, so edits merge instead of the
+        # last save winning and new ids never collide.
+        self.shared = shared
+        self.file_lock = FileLock(data_file + ".lock") if shared else None
+        self._snapshot_seen = None
+        # Mutations, saves and report reads hold this lock so a background
+        # worker can save or build reports while the GUI keeps editing
+        self.lock = threading.RLock()
+        # Saves copy the rows under the lock and write them outside it; one
+        # save at a time, so an older snapshot never replaces a newer one
+        self._saving = False
+        self._save_done = threading.Condition(self.lock)
+        # When set, full rewrites are handed to this callable (for example
+        # BackgroundWorker.request_save) instead of being written inline
+        self.save_scheduler: Optional[Callable[[], None]] = None
+        # Recurring rules and budgets live in their own file next to the
+        # ledger. budget_alerts holds the budgets the last add or update
+        # pushed to their warning level or past their limit.
+        self.budget = BudgetBook.load(data_file + ".budget.json")
+        self.budget_alerts: List[BudgetStatus] = []
+        # Exchange rates for expenses entered in other currencies, which are
+        # converted to rupees at the rate for their date
+        self.rates = RateTable.load(data_file + ".rates.json")
+        # With history=True every change is logged as a delta in
+        # data_file.history, which backs undo(), redo() and as_of()
+        self.history = History(data_file + ".history") if history else None
+        # load=False leaves the ledger empty so the caller can run
+        # iter_load() itself, for example on a background thread
+        if load:
+            self.load_expenses()
     
+    @timed()
+    @synchronized
     def load_expenses(self) -> None:
-        """Load expenses from JSON file"""
-        if os.path.exists(self.data_file):
+        """Load expenses from the JSON snapshot and replay the journal on top"""
+        with self._ledger_lock():
+            for _ in self.iter_load():
+                pass
+    
+    def _ledger_lock(self):
+        return self.file_lock if self.shared else nullcontext()
+    
+    def _snapshot_identity(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.data_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+    
+    @timed()
+    @synchronized
+    def sync(self) -> bool:
+        """Pick up changes other processes made to a shared ledger.
+        Returns True if anything changed."""
+        if not self.shared:
+            return False
+        with self._ledger_lock():
+            return self._sync()
+    
+    def _sync(self) -> bool:
+        self.category_registry.refresh()
+        journal_size = self.journal.size()
+        if self._snapshot_identity() != self._snapshot_seen or journal_size < self.journal.offset:
+            # Someone compacted the ledger: start over from the new snapshot
+            self.load_expenses()
+            return True
+        if journal_size == self.journal.offset:
+            return False
+        for record in self.journal.replay(self.journal.offset):
+            self._apply_journal_record(record)
+        return True
+    
+    def iter_load(self, batch_size: int = 1000) -> Iterator[int]:
+        """Load the ledger incrementally, yielding the number of expenses
+        loaded so far after every batch_size rows. Callers such as the GUI
+        can show the first rows while the rest is still being parsed."""
+        self._reset()
+        self.category_registry.refresh()
+        self._snapshot_seen = self._snapshot_identity()
+        if self._load_cache():
+            yield len(self.expenses)
+        elif os.path.exists(self.data_file):
             try:
-                with open(self.data_file, 'r') as f:
-                    data = json.load(f)
-                    self.expenses = [Expense.from_dict(expense_data) for expense_data in data]
-                    # Set next_id to be higher than the highest existing ID
-                    if self.expenses:
-                        max_id = max(expense.id for expense in self.expenses)
-                        self.next_id = max_id + 1
-            except (json.JSONDecodeError, FileNotFoundError):
-                self.expenses = []
+                batch = []
+                for expense_data in iter_json_array(self.data_file):
+                    batch.append(Expense.from_dict(expense_data))
+                    if len(batch) == batch_size:
+                        self._insert_many(batch)
+                        batch = []
+                        yield len(self.expenses)
+                self._insert_many(batch)
+                self._write_cache(self._snapshot_seen, self._snapshot_columns(), self._aggregates_copy())
+            except (ValueError, FileNotFoundError):
+                self._reset()
+        
+        # A journal left behind is replayed even when journal mode is off;
+        # the next save_expenses() folds it into the snapshot
+        for record in self.journal.replay():
+            self._apply_journal_record(record)
+        # Ledgers written before the registry existed may use categories
+        # that were only ever added in memory
+        if self.category_registry.add_missing(self._category_totals):
+            self.category_registry.save()
+        
+        # Ids written before the allocator existed (or by hand) may be
+        # above its mark, or repeated
+        if self.expenses:
+            self.ids.observe(max(self._ids()))
+        if len(self._positions) != len(self.expenses):
+            repaired = self._repair_duplicate_ids()
+            print(f"Gave new ids to {len(repaired)} expenses whose ids were duplicated")
+            self.save_expenses()
+        yield len(self.expenses)
+    
+    def _repair_duplicate_ids(self) -> List[Expense]:
+        """Give every expense whose id already appeared earlier in the ledger
+        a new id, returning the renumbered expenses"""
+        seen = set()
+        repaired = []
+        for position, expense_id in enumerate(self._ids()):
+            if expense_id in seen:
+                expense = self.expenses[position]
+                expense.id = self.ids.reserve()
+                # Columnar rows are copies, so write the new id back
+                self.expenses[position] = expense
+                repaired.append(expense)
+            seen.add(expense_id)
+        self._rebuild_index()
+        self._index = None
+        self._touch({expense.date[:7] for expense in repaired})
+        return repaired
+    
+    def _load_cache(self) -> bool:
+        """Restore the snapshot from the binary cache if it is still valid"""
+        if self.cache_file is None or self._snapshot_seen is None:
+            return False
+        with gc_paused():
+            payload = read_cache(self.cache_file, self._snapshot_seen[:2])
+            if payload is None:
+                return False
+            columns, aggregates = payload
+            self.expenses = self._make_store(Expense.from_columns(*columns))
+            self._rebuild_index()
+        self._total, self._category_totals, self._month_totals, self._category_month_totals = aggregates
+        self._touch_all()
+        return True
+    
+    def _snapshot_columns(self) -> Tuple[list, list, list, list, list, list]:
+        """(ids, paise, categories, notes, dates, foreign) of every expense as
+        it is now. Expenses are updated in place, so this is what a save
+        copies out before it lets go of the lock."""
+        # Repeated categories, notes and dates share one string object, which
+        # marshal then writes once and restores as a single shared object
+        pool = {}
+        columns = ([], [], [], [], [], [])
+        ids, paise, categories, notes, dates, foreign = columns
+        for expense in self.expenses:
+            ids.append(expense.id)
+            paise.append(expense.paise)
+            categories.append(pool.setdefault(expense.category, expense.category))
+            notes.append(pool.setdefault(expense.note, expense.note))
+            dates.append(pool.setdefault(expense.date, expense.date))
+            foreign.append(expense.foreign)
+        return columns
+    
+    def _aggregates_copy(self):
+        """The running aggregates, with their [paise, count] entries copied"""
+        return (self._total,) + tuple({key: entry[:] for key, entry in totals.items()} for totals in (
+            self._category_totals, self._month_totals, self._category_month_totals))
+    
+    def _write_cache(self, identity: Optional[Tuple[int, int, int]], columns, aggregates) -> None:
+        """Write the binary cache of the snapshot file with the given identity,
+        which holds the rows in columns"""
+        if self.cache_file is None or identity is None:
+            return
+        try:
+            write_cache(self.cache_file, identity[:2], (columns, aggregates))
+        except (OSError, ValueError) as e:
+            print(f"Could not write ledger cache: {e}")
+    
+    def _reset(self) -> None:
+        self.expenses = self._make_store([])
+        self._rebuild_index()
+        self._rebuild_aggregates()
+        self._index = None
+        self._touch_all()
+    
+    def _apply_journal_record(self, record: Dict) -> None:
+        # Replay is idempotent: a crash between writing a snapshot and
+        # clearing the journal leaves records the snapshot already holds,
+        # so adds of existing ids overwrite them and changes to missing rows
+        # are skipped
+        op = record.get("op")
+        if op == "add" and record["expense"]["id"] not in self._positions:
+            expense = Expense.from_dict(record["expense"])
+            self._insert_expense(expense)
+            self.ids.observe(expense.id)
+        elif op in ("add", "update"):
+            data = record["expense"]
+            expense = self.get_expense_by_id(data["id"])
+            if expense:
+                # The record holds the whole row, so a missing currency
+                # means a rupee expense
+                self._apply_fields(expense, dict({"currency": None, "original": None}, **data))
+        elif op == "delete":
+            if "ids" in record:
+                self._remove_expenses(set(record["ids"]))
+            elif record["id"] in self._positions:
+                self._remove_expense(record["id"])
+    
+    def _make_store(self, expenses) -> List[Expense]:
+        """Build the container that holds the ledger rows"""
+        if self.columnar:
+            from expense_columnar import ColumnarExpenseList
+            return ColumnarExpenseList(self.categories, expenses)
+        return list(expenses)
+    
+    def _ids(self, start: int = 0):
+        """Expense ids from position start onwards, without building rows"""
+        if self.columnar:
+            return self.expenses.ids[start:]
+        return [expense.id for expense in self.expenses[start:]]
+    
+    def _rebuild_index(self) -> None:
+        self._positions = {expense_id: i for i, expense_id in enumerate(self._ids())}
+    
+    def _touch(self, months: Iterable[str]) -> None:
+        """Record a change to the given YYYY-MM months"""
+        self.version += 1
+        for month in months:
+            self._month_versions[month] = self.version
+    
+    def _touch_all(self) -> None:
+        self.version += 1
+        self._month_versions = {}
+        self._reset_version = self.version
+    
+    def _month_version(self, month: str) -> int:
+        return self._month_versions.get(month, self._reset_version)
+    
+    def _insert_expense(self, expense: Expense) -> None:
+        self._touch((expense.date[:7],))
+        self._positions[expense.id] = len(self.expenses)
+        self.expenses.append(expense)
+        self._aggregate(expense, 1)
+        if self._index is not None:
+            self._index.add(expense)
+    
+    def _insert_many(self, expenses: List[Expense]) -> None:
+        self._touch({expense.date[:7] for expense in expenses})
+        start = len(self.expenses)
+        self.expenses.extend(expenses)
+        self._positions.update(zip([expense.id for expense in expenses], range(start, start + len(expenses))))
+        (self._total, self._category_totals, self._month_totals,
+         self._category_month_totals) = self._accumulate(expenses, self._total, self._category_totals,
+                                                         self._month_totals, self._category_month_totals)
+        if self._index is not None:
+            for expense in expenses:
+                self._index.add(expense)
+    
+    def _remove_expense(self, expense_id: int) -> Expense:
+        position = self._positions.pop(expense_id)
+        expense = self.expenses.pop(position)
+        self._touch((expense.date[:7],))
+        # Everything after the removed slot shifts down by one
+        for i, shifted_id in enumerate(self._ids(position), position):
+            self._positions[shifted_id] = i
+        self._aggregate(expense, -1)
+        if self._index is not None:
+            self._index.remove(expense)
+        return expense
+    
+    def _remove_expenses(self, expense_ids: set) -> List[Expense]:
+        if self.columnar:
+            removed = self.expenses.remove_ids(expense_ids)
+        else:
+            removed = [expense for expense in self.expenses if expense.id in expense_ids]
+            self.expenses = [expense for expense in self.expenses if expense.id not in expense_ids]
+        self._rebuild_index()
+        self._touch({expense.date[:7] for expense in removed})
+        for expense in removed:
+            self._aggregate(expense, -1)
+            if self._index is not None:
+                self._index.remove(expense)
+        return removed
+    
+    def _apply_fields(self, expense: Expense, fields: Dict) -> None:
+        """Set amount (rupees) or paise, category, note and date on an
+        expense, keeping aggregates in step. Fields that are None are left
+        alone, except currency and original (as in to_dict()), which are set
+        whenever present."""
+        old = Expense.from_paise(expense.paise, expense.category, expense.note, expense.date, expense.id,
+                                 expense.foreign)
+        for field in ("amount", "paise", "category", "note", "date"):
+            if fields.get(field) is not None:
+                setattr(expense, field, fields[field])
+        if "currency" in fields:
+            currency = fields["currency"]
+            expense.foreign = (currency, fields["original"]) if currency is not None else None
+        expense.category = sys.intern(expense.category)
+        # Columnar rows are copies, so write the changes back. This is the
+        # step that can fail (a row the columns cannot hold), so it comes
+        # before the aggregates and the index change.
+        self.expenses[self._positions[expense.id]] = expense
+        self._aggregate(old, -1)
+        if self._index is not None:
+            self._index.remove(old)
+        self._touch({old.date[:7], expense.date[:7]})
+        self._aggregate(expense, 1)
+        if self._index is not None:
+            self._index.add(expense)
     
+    def _aggregate(self, expense: Expense, sign: int) -> None:
+        """Add (sign=1) or remove (sign=-1) one expense from the running aggregates"""
+        amount = expense.paise * sign
+        month = expense.date[:7]  # YYYY-MM
+        for totals, key in ((self._category_totals, expense.category),
+                            (self._month_totals, month),
+                            (self._category_month_totals, (expense.category, month))):
+            entry = totals.get(key)
+            if entry is None:
+                totals[key] = [amount, sign]
+            elif entry[1] + sign == 0:
+                del totals[key]
+            else:
+                entry[0] += amount
+                entry[1] += sign
+        self._total = self._total + amount if self._category_totals else 0
+    
+    def _compute_aggregates(self) -> Tuple[int, Dict[str, list], Dict[str, list], Dict[Tuple[str, str], list]]:
+        """Full recompute of the running aggregates from self.expenses"""
+        if self.columnar:
+            return self.expenses.compute_aggregates()
+        return self._accumulate(self.expenses, 0, {}, {}, {})
+    
+    @staticmethod
+    def _accumulate(expenses, total: int, category_totals: Dict[str, list], month_totals: Dict[str, list],
+                    category_month_totals: Dict[Tuple[str, str], list]):
+        """Add expenses into the given aggregate dicts and return them with the new total"""
+        for expense in expenses:
+            amount = expense.paise
+            month = expense.date[:7]
+            total += amount
+            for totals, key in ((category_totals, expense.category),
+                                (month_totals, month),
+                                (category_month_totals, (expense.category, month))):
+                entry = totals.get(key)
+                if entry is None:
+                    totals[key] = [amount, 1]
+                else:
+                    entry[0] += amount
+                    entry[1] += 1
+        return total, category_totals, month_totals, category_month_totals
+    
+    def _rebuild_aggregates(self) -> None:
+        (self._total, self._category_totals,
+         self._month_totals, self._category_month_totals) = self._compute_aggregates()
+    
+    @timed()
     def save_expenses(self) -> None:
+        """Write a fresh snapshot atomically and reset the journal.
         
+        Only copying the rows out holds the manager's lock. Serializing,
+        fsync and rename happen outside it, so a save on the background
+        worker does not hold up edits on the GUI thread; whatever those
+        journal in the meantime stays in the journal. A shared ledger is
+        saved wholly under its file lock, so no other process can append
+        between the snapshot and the journal reset.
+        """
+        with self.lock:
+            while self._saving:
+                self._save_done.wait()
+            self._saving = True
+        try:
+            if self.shared:
+                with self.lock, self._ledger_lock():
+                    self._sync()
+                    self._write_snapshot(self._save_state())
+            else:
+                with self.lock:
+                    state = self._save_state()
+                self._write_snapshot(state)
+        finally:
+            with self.lock:
+                self._saving = False
+                self._save_done.notify_all()
+    
+    def _save_state(self):
+        """What a save writes, copied under the lock: the rows, the aggregates
+        for the cache, and the journal and history positions they reflect"""
+        aggregates = self._aggregates_copy() if self.cache_file is not None else None
+        seq = self.history.seq if self.history is not None else None
+        return self._snapshot_columns(), aggregates, self.journal.offset, self.journal.record_count, seq
+    
+    def _write_snapshot(self, state) -> None:
+        columns, aggregates, journal_offset, journal_records, seq = state
         try:
-            with open(self.data_file, 'w') as f:
-                json.dump([expense.to_dict() for expense in self.expenses], f, indent=2)
+            written = write_snapshot(self.data_file, snapshot_records(columns), flat=True)
+            metrics.observe("save_expenses.bytes", written)
+            identity = self._snapshot_identity()
+            self._write_cache(identity, columns, aggregates)
+            with self.lock:
+                self.journal.discard_before(journal_offset, journal_records)
+                self._snapshot_seen = identity
+                # The file is the state after seq only if nothing was logged since
+                if self.history is not None and self.history.seq == seq and self.history.checkpoint_due():
+                    self.history.add_checkpoint(self.data_file)
         except Exception as e:
             print(f"Error saving expenses: {e}")
     
-    def add_expense(self, amount: float, category: str, note: str = "") -> bool:
+    def compact(self) -> None:
+        """Fold the journal into a new snapshot"""
+        self.save_expenses()
+    
+    def _schedule_save(self) -> None:
+        if self.save_scheduler is not None:
+            self.save_scheduler()
+        else:
+            self.save_expenses()
+    
+    def _persist(self, op: str, expenses: List[Expense]) -> None:
+        """Record a mutation of one or more expenses, either in the journal or as a full save"""
+        if not self.journal_mode:
+            self._schedule_save()
+            return
         
+        if op == "delete":
+            records = [{"op": op, "ids": [expense.id for expense in expenses]}]
+        else:
+            records = [{"op": op, "expense": expense.to_dict()} for expense in expenses]
         try:
-            if amount <= 0:
-                print("Amount must be greater than 0")
-                return False
-            
-            if category not in self.categories:
-                print(f"Invalid category. Available categories: {', '.join(self.categories)}")
+            self.journal.append_many(records)
+            metrics.count("journal_records", len(records))
+        except Exception as e:
+            print(f"Error writing journal, saving full snapshot instead: {e}")
+            self.save_expenses()
+            return
+        
+        if self.journal.record_count >= self.compact_threshold:
+            self._schedule_save()
+    
+    def _check_fields(self, amount: float = None, category: str = None) -> bool:
+        """Validate amount and category, printing the reason on failure"""
+        if amount is not None and amount <= 0:
+            print("Amount must be greater than 0")
+            return False
+        
+        if category is not None and category not in self.category_registry:
+            print(f"Invalid category. Available categories: {', '.join(self.categories)}")
+            return False
+        
+        return True
+    
+    def _price(self, amount: float, currency: Optional[str], date: str) -> Tuple[int, Optional[Tuple[str, int]]]:
+        """(paise, foreign) for amount given in currency (rupees if None) on
+        date. Raises ValueError for an unknown currency, a missing rate or
+        an amount below one minor unit."""
+        if currency is None or currency == BASE_CURRENCY:
+            paise, foreign = to_minor(amount), None
+        else:
+            if not CURRENCY_CODE.match(str(currency)):
+                raise ValueError(f"invalid currency {currency!r}; use a code such as USD")
+            original = to_minor(amount, minor_digits(currency))
+            if original <= 0:
+                raise ValueError(f"amount is less than one {currency} minor unit")
+            paise, foreign = self.rates.convert(original, currency, date), (currency, original)
+        if paise <= 0:
+            raise ValueError("amount is less than Rs.0.01")
+        return paise, foreign
+    
+    def _priced_fields(self, expense: Expense, fields: Dict) -> Dict:
+        """Update fields for _apply_fields(), a new amount (in
+        fields["currency"], or rupees) converted to paise at the expense's
+        date. Raises ValueError like _price(), or for a date that is not
+        YYYY-MM-DD."""
+        priced = {field: fields.get(field) for field in ("category", "note", "date")}
+        if priced["date"] is not None:
+            # Checked before anything changes; the month keys, partitions and
+            # the columnar store all rely on ISO dates
+            priced["date"] = Date.fromisoformat(priced["date"]).isoformat()
+        if fields.get("amount") is not None:
+            priced["paise"], foreign = self._price(fields["amount"], fields.get("currency"),
+                                                   priced["date"] or expense.date)
+            priced["currency"], priced["original"] = foreign or (None, None)
+        return priced
+    
+    @synchronized
+    def set_rate(self, currency: str, rate: float, date: str = None) -> bool:
+        """Record that one unit of currency costs rate rupees from date
+        (default today) on, for expenses entered in that currency"""
+        try:
+            date = Date.fromisoformat(date).isoformat() if date else Date.today().isoformat()
+            self.rates.set_rate(currency, rate, date)
+            self.rates.save()
+            print(f"Exchange rate set: 1 {currency} = Rs.{rate} from {date}")
+            return True
+        except ValueError as e:
+            print(f"Error setting exchange rate: {e}")
+            return False
+    
+    @timed()
+    @exclusive
+    def add_expense(self, amount: float, category: str, note: str = "", currency: str = None) -> bool:
+        """Add an expense dated today. With currency (e.g. "USD") amount is
+        in that currency and is converted at today's rate from self.rates."""
+        try:
+            if not self._check_fields(amount, category):
                 return False
             
-            expense = Expense(amount, category, note, expense_id=self.next_id)
-            self.next_id += 1  # Increment for next expense
-            self.expenses.append(expense)
-            self.save_expenses()
+            date = Date.today().isoformat()
+            paise, foreign = self._price(amount, currency, date)
+            expense = Expense.from_paise(paise, category, note, date, self.ids.reserve(), foreign)
+            self._insert_expense(expense)
+            self._record("add", [[expense.id, None, expense.to_dict()]])
+            self._persist("add", [expense])
             print(f"Expense added successfully: {expense}")
+            self._check_budgets([expense])
             return True
         except Exception as e:
             print(f"Error adding expense: {e}")
             return False
     
-    def view_expenses(self, filter_category: str = None, filter_date: str = None) -> None:
+    def _query_index(self):
+        if self._index is None:
+            from expense_query import ExpenseIndex
+            self._index = ExpenseIndex(self.expenses)
+        return self._index
+    
+    @timed()
+    @synchronized
+    def query(self, date_from: str = None, date_to: str = None, min_amount: float = None, max_amount: float = None,
+              categories: Iterable[str] = None, text: str = None, note_contains: str = None,
+              sort_by: str = None, descending: bool = False, offset: int = 0, limit: int = None) -> List[Expense]:
+        """Return the expenses matching every given criterion.
         
-        filtered_expenses = self.expenses.copy()
+        Date and amount bounds are inclusive. categories matches any of the
+        given names, ignoring case. text matches notes containing each of its
+        words as a whole word (a text without words, such as "!!", filters
+        nothing); note_contains is a plain case-insensitive substring test. Results come in ledger order unless sort_by names a
+        field (id, date, amount, category or note).
+        """
+        from expense_query import SORT_FIELDS, order_page, tokenize
         
-        if filter_category:
-            filtered_expenses = [exp for exp in filtered_expenses if exp.category.lower() == filter_category.lower()]
+        if sort_by is not None and sort_by not in SORT_FIELDS:
+            print(f"Invalid sort field. Available fields: {', '.join(SORT_FIELDS)}")
+            return []
+        
+        # Narrow the candidates through the indexes first: the token index
+        # for text, then a bisected slice of the date index for a date range
+        ids = None
+        date_ordered = False
+        words = tokenize(text) if text else None
+        if words:
+            index = self._query_index()
+            if index.tokens is None:
+                index.build_tokens(self.expenses)
+            ids = index.ids_with_tokens(words)
+        if date_from or date_to:
+            in_range = self._query_index().ids_in_date_range(date_from or None, date_to or None)
+            ids = in_range if ids is None else [expense_id for expense_id in in_range if expense_id in ids]
+            date_ordered = True
         
+        if ids is None:
+            rows = iter(self.expenses)
+        else:
+            positions = [self._positions[expense_id] for expense_id in ids]
+            if sort_by != "date" or not date_ordered:
+                positions.sort()
+            rows = (self.expenses[position] for position in positions)
+        
+        wanted = None
+        if categories:
+            # Case-insensitive matching is resolved once per distinct
+            # category name, so rows are tested with an exact set lookup
+            folded = {category.lower() for category in categories}
+            wanted = {name for name in self._category_totals if name.lower() in folded}
+        needle = note_contains.lower() if note_contains else None
+        low = to_minor(min_amount) if min_amount is not None else None
+        high = to_minor(max_amount) if max_amount is not None else None
+        if wanted is not None or min_amount is not None or max_amount is not None or needle:
+            rows = (expense for expense in rows
+                    if (wanted is None or expense.category in wanted)
+                    and (low is None or expense.paise >= low)
+                    and (high is None or expense.paise <= high)
+                    and (not needle or needle in expense.note.lower()))
+        
+        if sort_by == "date" and date_ordered and not descending:
+            # Rows came off the date index, already in (date, id) order.
+            # Reversed, ties would come out in descending id order.
+            sort_by = None
+        return order_page(rows, sort_by, descending, offset, limit)
+    
+    @timed()
+    def filter_expenses(self, filter_category: str = None, filter_date: str = None, **criteria) -> List[Expense]:
+        """Return the expenses matching an exact category and/or date, plus
+        any further query() criteria"""
+        if filter_category:
+            criteria["categories"] = [filter_category]
         if filter_date:
-            filtered_expenses = [exp for exp in filtered_expenses if exp.date == filter_date]
+            criteria["date_from"] = criteria["date_to"] = filter_date
+        return self.query(**criteria)
+    
+    @timed()
+    def view_expenses(self, filter_category: str = None, filter_date: str = None, **criteria) -> None:
+        
+        filtered_expenses = self.filter_expenses(filter_category, filter_date, **criteria)
         
         if not filtered_expenses:
             print("No expenses found matching the criteria.")
@@ -110,39 +825,37 @@ class ExpenseManager:
             print(expense)
         print("="*80)
     
-    def update_expense(self, expense_id: int, amount: float = None, category: str = None, note: str = None, date: str = None) -> bool:
-        
+    @timed()
+    @exclusive
+    def update_expense(self, expense_id: int, amount: float = None, category: str = None, note: str = None, date: str = None,
+                       currency: str = None) -> bool:
+        """Change the given fields of an expense. A new amount is in
+        currency, or rupees if that is None."""
         try:
             expense = self.get_expense_by_id(expense_id)
             if not expense:
                 print(f"Expense with ID {expense_id} not found")
                 return False
             
-            if amount is not None:
-                if amount <= 0:
-                    print("Amount must be greater than 0")
-                    return False
-                expense.amount = amount
-            
-            if category is not None:
-                if category not in self.categories:
-                    print(f"Invalid category. Available categories: {', '.join(self.categories)}")
-                    return False
-                expense.category = category
-            
-            if note is not None:
-                expense.note = note
+            if not self._check_fields(amount, category):
+                return False
             
-            if date is not None:
-                expense.date = date
+            fields = self._priced_fields(expense, {"amount": amount, "category": category, "note": note,
+                                                   "date": date, "currency": currency})
+            before = expense.to_dict()
+            self._apply_fields(expense, fields)
             
-            self.save_expenses()
+            self._record("update", [[expense.id, *field_changes(before, expense.to_dict())]])
+            self._persist("update", [expense])
             print(f"Expense updated successfully: {expense}")
+            self._check_budgets([expense])
             return True
         except Exception as e:
             print(f"Error updating expense: {e}")
             return False
     
+    @timed()
+    @exclusive
     def delete_expense(self, expense_id: int) -> bool:
         
         try:
@@ -151,59 +864,270 @@ class ExpenseManager:
                 print(f"Expense with ID {expense_id} not found")
                 return False
             
-            self.expenses.remove(expense)
-            self.save_expenses()
+            self._remove_expense(expense_id)
+            self._record("delete", [[expense.id, expense.to_dict(), None]])
+            self._persist("delete", [expense])
             print(f"Expense deleted successfully: {expense}")
             return True
         except Exception as e:
             print(f"Error deleting expense: {e}")
             return False
     
+    def _load_ids(self, expense_ids: Iterable[int]) -> None:
+        """Make sure the given ids are in memory; only ledgers that load
+        rows lazily have anything to do here"""
+    
     def get_expense_by_id(self, expense_id: int) -> Optional[Expense]:
         
-        for expense in self.expenses:
-            if expense.id == expense_id:
-                return expense
-        return None
+        self._load_ids((expense_id,))
+        position = self._positions.get(expense_id)
+        if position is None:
+            return None
+        return self.expenses[position]
     
-    def get_summary_report(self, save_to_file: bool = False) -> None:
+    def get_page(self, offset: int, limit: int) -> List[Expense]:
+        """Return up to limit expenses starting at position offset"""
+        return self.expenses[offset:offset + limit]
+    
+    @timed()
+    @exclusive
+    def add_expenses(self, items: List[Dict]) -> bool:
+        """Add a batch of expenses given as dicts with amount, category and
+        optional note/date/currency. Nothing is added unless every item is
+        valid."""
+        try:
+            batch = []
+            for i, item in enumerate(items):
+                if not self._check_fields(item["amount"], item["category"]):
+                    print(f"Batch rejected: item {i} is invalid")
+                    return False
+                try:
+                    date = item.get("date")
+                    date = Date.fromisoformat(date).isoformat() if date else Date.today().isoformat()
+                    paise, foreign = self._price(item["amount"], item.get("currency"), date)
+                except ValueError as e:
+                    print(f"Batch rejected: item {i}: {e}")
+                    return False
+                batch.append(Expense.from_paise(paise, item["category"], item.get("note", ""), date, None, foreign))
+            
+            # One consecutive run of ids for the whole batch
+            first_id = self.ids.reserve(len(batch))
+            added = []
+            for expense_id, expense in enumerate(batch, first_id):
+                expense.id = expense_id
+                self._insert_expense(expense)
+                added.append(expense)
+            
+            self._record("add", [[expense.id, None, expense.to_dict()] for expense in added])
+            self._persist("add", added)
+            print(f"Added {len(added)} expenses")
+            self._check_budgets(added)
+            return True
+        except Exception as e:
+            print(f"Error adding expenses: {e}")
+            return False
+    
+    @timed()
+    @exclusive
+    def update_expenses(self, updates: Dict[int, Dict]) -> bool:
+        """Apply {expense_id: {field: value}} updates as one batch; amount,
+        category, note and date may be given. All ids must exist."""
+        try:
+            self._load_ids(updates)
+            for expense_id, fields in updates.items():
+                if expense_id not in self._positions:
+                    print(f"Batch rejected: expense with ID {expense_id} not found")
+                    return False
+                if not self._check_fields(fields.get("amount"), fields.get("category")):
+                    print(f"Batch rejected: update for ID {expense_id} is invalid")
+                    return False
+            priced = {}
+            for expense_id, fields in updates.items():
+                try:
+                    priced[expense_id] = self._priced_fields(self.expenses[self._positions[expense_id]], fields)
+                except ValueError as e:
+                    print(f"Batch rejected: update for ID {expense_id}: {e}")
+                    return False
+            
+            updated = []
+            changes = []
+            for expense_id, fields in priced.items():
+                expense = self.expenses[self._positions[expense_id]]
+                before = expense.to_dict()
+                self._apply_fields(expense, fields)
+                updated.append(expense)
+                changes.append([expense_id, *field_changes(before, expense.to_dict())])
+            
+            self._record("update", changes)
+            self._persist("update", updated)
+            print(f"Updated {len(updated)} expenses")
+            self._check_budgets(updated)
+            return True
+        except Exception as e:
+            print(f"Error updating expenses: {e}")
+            return False
+    
+    @timed()
+    @exclusive
+    def delete_expenses(self, expense_ids: List[int]) -> bool:
+        """Delete a batch of expenses by id. All ids must exist."""
+        try:
+            self._load_ids(expense_ids)
+            missing = [expense_id for expense_id in expense_ids if expense_id not in self._positions]
+            if missing:
+                print(f"Batch rejected: expenses not found: {missing[:10]}")
+                return False
+            
+            removed = self._remove_expenses(set(expense_ids))
+            self._record("delete", [[expense.id, expense.to_dict(), None] for expense in removed])
+            self._persist("delete", removed)
+            print(f"Deleted {len(removed)} expenses")
+            return True
+        except Exception as e:
+            print(f"Error deleting expenses: {e}")
+            return False
+    
+    @timed()
+    @exclusive
+    def import_file(self, path: str, fmt: str = None, default_category: str = None, dedupe: bool = True,
+                    workers: int = 1, rejects_file: str = None, batch_size: int = 10000):
+        """Bulk-import expenses from a CSV or JSON Lines file (fmt "csv" or
+        "jsonl", guessed from the extension by default).
         
-        if not self.expenses:
-            print("No expenses found.")
-            return
+        Rows are streamed and validated in batches; invalid ones are collected
+        in a rejects report (written as CSV to rejects_file if given) rather
+        than failing the import. Rows whose (date, amount, note) is already in
+        the ledger or earlier in the file are skipped when dedupe is set.
+        workers > 1 parses large files in a process pool. The ledger is
+        persisted once at the end. Returns an ImportResult, or None if the
+        file could not be read, in which case nothing is imported.
+        """
+        from expense_import import dedupe_key, drop_duplicates, iter_import_batches, ImportResult
         
-        total_spent = sum(expense.amount for expense in self.expenses)
+        result = ImportResult()
+        start = len(self.expenses)
+        seen = {dedupe_key(expense.date, expense.paise, expense.note) for expense in self.expenses} if dedupe else None
+        try:
+            for rows, rejects in iter_import_batches(path, self.categories, fmt, default_category, workers, batch_size):
+                result.rejects.extend(rejects)
+                if seen is not None:
+                    rows = drop_duplicates(rows, seen, result)
+                batch = [Expense.from_paise(paise, category, note, date, expense_id)
+                         for expense_id, (date, paise, category, note) in enumerate(rows, self.ids.reserve(len(rows)))]
+                self._insert_many(batch)
+        except Exception as e:
+            print(f"Error importing expenses: {e}")
+            # The reserved ids are simply left unused
+            self._remove_expenses(set(self._ids(start)))
+            return None
         
-        # Group by category
-        category_totals = {}
-        for expense in self.expenses:
-            category_totals[expense.category] = category_totals.get(expense.category, 0) + expense.amount
+        result.added = len(self.expenses) - start
+        if result.added:
+            self._record("import", [[expense.id, None, expense.to_dict()] for expense in self.expenses[start:]])
+            # One write for the whole import. A large import goes straight
+            # into a new snapshot instead of through the journal.
+            if not self.journal_mode or result.added >= self.compact_threshold:
+                self._schedule_save()
+            else:
+                self._persist("add", self.expenses[start:])
+        if rejects_file and result.rejects:
+            result.write_rejects(rejects_file)
+            print(f"Rejected rows written to: {rejects_file}")
+        print(result)
+        return result
+    
+    @synchronized
+    def get_totals(self) -> Tuple[float, int]:
+        """Return (total, count) for the ledger, the total in rupees"""
+        return self._total / 100, len(self.expenses)
+    
+    @synchronized
+    def get_summary_totals(self) -> Tuple[float, int, Dict[str, float], Dict[str, float]]:
+        """Return (total, count, category_totals, month_totals) for the ledger, in rupees"""
+        category_totals = {category: entry[0] / 100 for category, entry in self._category_totals.items()}
+        month_totals = {month: entry[0] / 100 for month, entry in self._month_totals.items()}
+        return self._total / 100, len(self.expenses), category_totals, month_totals
+    
+    @synchronized
+    def get_category_month_totals(self) -> Dict[Tuple[str, str], float]:
+        """Return totals in rupees keyed by (category, YYYY-MM)"""
+        return {key: entry[0] / 100 for key, entry in self._category_month_totals.items()}
+    
+    def _report_rows(self) -> Iterator[Tuple[str, str, int]]:
+        """(category, date, paise) for every expense, for the report engine"""
+        if self.columnar:
+            return self.expenses.report_rows()
+        return ((expense.category, expense.date, expense.paise) for expense in self.expenses)
+    
+    def _category_month_cells(self) -> Dict[Tuple[str, str], Tuple[int, int]]:
+        """(total paise, count) per (category, YYYY-MM), from the running aggregates"""
+        return {key: (entry[0], entry[1]) for key, entry in self._category_month_totals.items()}
+    
+    def _report_rows_for_months(self, months: List[str]) -> Iterator[Tuple[str, str, int]]:
+        """Report rows dated in the given YYYY-MM months"""
+        if len(months) * 4 < len(self._month_totals):
+            # A few months: pull just their rows through the date index
+            index = self._query_index()
+            for month in months:
+                for expense_id in index.ids_in_date_range(month + "-01", month + "-31"):
+                    expense = self.expenses[self._positions[expense_id]]
+                    yield expense.category, expense.date, expense.paise
+            return
+        wanted = set(months)
+        for row in self._report_rows():
+            if row[1][:7] in wanted:
+                yield row
+    
+    @timed()
+    @synchronized
+    def build_report(self, specs=None, workers: int = 1, chunk_size: int = 50000) -> Report:
+        """Build a Report for the given (group_by, stats) specs, the classic
+        summary by default.
         
-        # Group by month
-        month_totals = {}
-        for expense in self.expenses:
-            month = expense.date[:7]  # YYYY-MM
-            month_totals[month] = month_totals.get(month, 0) + expense.amount
+        Specs that only need sums and counts by category and/or month are
+        answered from the running aggregates; anything else scans the
+        ledger, across workers processes if workers > 1. Results are cached
+        in report_cache. Scans are cached per month, so after an edit only
+        the months it touched are scanned again.
+        """
+        specs = SUMMARY if specs is None else tuple(make_spec(*spec) for spec in specs)
+        report = self.report_cache.get(("report", specs), self.version)
+        if report is not None:
+            return report.copy()
         
-        # Generate report text
-        report_lines = []
-        report_lines.append("="*60)
-        report_lines.append("EXPENSE SUMMARY REPORT")
-        report_lines.append("="*60)
-        report_lines.append(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        report_lines.append(f"Total Expenses: Rs.{total_spent:.2f}")
-        report_lines.append(f"Total Transactions: {len(self.expenses)}")
+        cells = self._category_month_cells()
+        if cells_suffice(specs):
+            partial = Partial(specs).add_cells(cells)
+        else:
+            partial = Partial(specs)
+            months = sorted({month for _, month in cells})
+            stale = []
+            for month in months:
+                cached = self.report_cache.get(("month", specs, month), self._month_version(month))
+                if cached is None:
+                    stale.append(month)
+                else:
+                    partial.merge(cached)
+            if stale:
+                rows = self._report_rows_for_months(stale) if len(stale) < len(months) else self._report_rows()
+                for month, fresh in scan_rows_by_month(rows, specs, workers, chunk_size).items():
+                    self.report_cache.put(("month", specs, month), self._month_version(month), fresh, fresh.size())
+                    partial.merge(fresh)
         
-        report_lines.append("\nBy Category:")
-        for category, total in sorted(category_totals.items()):
-            percentage = (total / total_spent) * 100 if total_spent > 0 else 0
-            report_lines.append(f"  {category}: Rs.{total:.2f} ({percentage:.1f}%)")
+        report = partial.finish()
+        self.report_cache.put(("report", specs), self.version, report,
+                              sum(len(table.rows) for table in report.tables))
+        return report
+    
+    @timed()
+    def get_summary_report(self, save_to_file: bool = False) -> None:
         
-        report_lines.append("\nBy Month:")
-        for month, total in sorted(month_totals.items()):
-            report_lines.append(f"  {month}: Rs.{total:.2f}")
+        report = self.build_report()
+        if not report.count:
+            print("No expenses found.")
+            return
         
-        report_lines.append("="*60)
+        report_lines = render_text(report).split("\n")
         
         # Display report
         for line in report_lines:
@@ -213,8 +1137,52 @@ class ExpenseManager:
         if save_to_file:
             self.save_summary_to_file(report_lines)
     
-    def save_summary_to_file(self, report_lines: list) -> None:
-        """Save summary report to a text file"""
+    def _export_rows(self) -> Iterator[Tuple]:
+        """(id, paise, category, note, date, currency, original) for every
+        expense, for expense_export"""
+        self.load_all()
+        if self.columnar:
+            return self.expenses.export_rows()
+        no_currency = (None, None)
+        return ((expense.id, expense.paise, expense.category, expense.note, expense.date) + (expense.foreign or no_currency)
+                for expense in self.expenses)
+    
+    @timed()
+    @synchronized
+    def export(self, path: str, fmt: str = None, full: bool = False):
+        """Append the expenses added, changed or deleted since the last export
+        to path to it, streaming. The format (jsonl, csv, cols or parquet)
+        comes from the file name unless given; a .gz name is gzipped. The
+        first export, or full=True, writes every expense. Returns an
+        expense_export.ExportResult, or None if the export failed."""
+        from expense_export import export_rows
+        
+        try:
+            result = export_rows(self._export_rows(), path, fmt, full)
+        except (OSError, ValueError) as e:
+            print(f"Error exporting expenses: {e}")
+            return None
+        print(result)
+        return result
+    
+    @timed()
+    @synchronized
+    def find_anomalies(self, days: int = 3, similarity: float = 0.5, window: int = 50, spread: float = 3.0,
+                       factor: float = 3.0, min_history: int = 10):
+        """Find exact duplicates, near-duplicates (same amount and category
+        within days, notes sharing at least similarity of their words) and
+        outliers far above the rolling median of their category's previous
+        window expenses. See expense_anomalies.find_anomalies for the exact
+        rules. Returns an expense_anomalies.AnomalyReport."""
+        from expense_anomalies import find_anomalies
+        
+        with gc_paused():
+            report = find_anomalies(self._export_rows(), days, similarity, window, spread, factor, min_history)
+        print(report)
+        return report
+    
+    def save_summary_to_file(self, report_lines: list) -> Optional[str]:
+        """Save summary report to a text file and return its name"""
         try:
             # Generate filename with current date and time
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -225,27 +1193,398 @@ class ExpenseManager:
                     f.write(line + '\n')
             
             print(f"\nSummary report saved to: {filename}")
+            return filename
         except Exception as e:
             print(f"Error saving summary report: {e}")
+            return None
+    
+    def _month_spent(self, category: Optional[str], month: str) -> float:
+        """Spending in rupees in month for one category, or for all of them if None"""
+        entry = self._month_totals.get(month) if category is None else self._category_month_totals.get((category, month))
+        return entry[0] / 100 if entry is not None else 0.0
+    
+    def _check_budgets(self, expenses: Iterable[Expense]) -> None:
+        """Check the budgets the given expenses count against, reading the
+        running totals, and keep those at their warning level or over their
+        limit in budget_alerts"""
+        alerts = []
+        if self.budget.budgets:
+            checked = set()
+            for expense in expenses:
+                month = expense.date[:7]
+                for budget in self.budget.applicable(expense.category, month):
+                    key = (budget.category, month)
+                    if key in checked:
+                        continue
+                    checked.add(key)
+                    status = BudgetStatus(budget, month, self._month_spent(budget.category, month))
+                    if status.level != "ok":
+                        alerts.append(status)
+                        print(f"Budget {status.level}: {status}")
+        self.budget_alerts = alerts
+    
+    @exclusive
+    def add_recurring(self, amount: float, category: str, note: str = "", frequency: str = "monthly",
+                      start: str = None, end: str = None, interval: int = 1) -> Optional[int]:
+        """Add a rule repeating an expense every interval days, weeks or
+        months from start (default today) until end (inclusive, optional).
+        Occurrences up to today are added at once, later ones as
+        materialize_recurring() reaches them. Returns the rule id."""
+        if not self._check_fields(amount, category):
+            return None
+        if frequency not in FREQUENCIES:
+            print(f"Invalid frequency. Available frequencies: {', '.join(FREQUENCIES)}")
+            return None
+        if not isinstance(interval, int) or interval < 1:
+            print("Interval must be a whole number of at least 1")
+            return None
+        start = start or Date.today().isoformat()
+        try:
+            start = Date.fromisoformat(start).isoformat()
+            end = Date.fromisoformat(end).isoformat() if end else None
+        except ValueError:
+            print("Invalid date format. Please use YYYY-MM-DD")
+            return None
+        if end is not None and end < start:
+            print("End date must not be before the start date")
+            return None
+        
+        rule = self.budget.add_rule(RecurringRule(amount, category, note, frequency, start, end, interval))
+        print(f"Recurring expense added: {rule}")
+        if not self._materialize(Date.today().isoformat()):
+            self.budget.save()
+        return rule.id
+    
+    @exclusive
+    def remove_recurring(self, rule_id: int) -> bool:
+        """Stop a rule; expenses it already added stay in the ledger"""
+        rule = self.budget.remove_rule(rule_id)
+        if rule is None:
+            print(f"Recurring rule with ID {rule_id} not found")
+            return False
+        self.budget.save()
+        print(f"Recurring expense removed: {rule}")
+        return True
     
+    @exclusive
+    def materialize_recurring(self, until: str = None) -> int:
+        """Add every recurring occurrence due on or before until (default
+        today) and return how many were added"""
+        return self._materialize(until or Date.today().isoformat())
+    
+    def _materialize(self, until: str) -> int:
+        occurrences = self.budget.due(until)
+        if not occurrences:
+            return 0
+        if not self.add_expenses([{"amount": rule.amount, "category": rule.category, "note": rule.note, "date": day}
+                                  for rule, day in occurrences]):
+            # Leave the occurrences due, so the next run adds them
+            self.budget.rewind(occurrences)
+            return 0
+        self.budget.save()
+        return len(occurrences)
+    
+    @exclusive
+    def set_budget(self, limit: float, category: str = None, month: str = None, warn_at: float = WARN_AT) -> bool:
+        """Set the budget for a category (default: all categories) in a
+        YYYY-MM month (default: every month). It warns from warn_at of the
+        limit onwards."""
+        if limit is None or limit <= 0:
+            print("Budget limit must be greater than 0")
+            return False
+        if category is not None and category not in self.category_registry:
+            print(f"Invalid category. Available categories: {', '.join(self.categories)}")
+            return False
+        if month is not None and not MONTH_PATTERN.match(month):
+            print("Invalid month format. Please use YYYY-MM")
+            return False
+        if not 0 < warn_at <= 1:
+            print("warn_at must be between 0 and 1")
+            return False
+        
+        budget = Budget(limit, category, month, warn_at)
+        self.budget.set_budget(budget)
+        self.budget.save()
+        print(f"Budget set: {category or 'All categories'} "
+              f"{'in ' + month if month else 'every month'}, Rs.{limit:.2f}")
+        return True
+    
+    @exclusive
+    def remove_budget(self, category: str = None, month: str = None) -> bool:
+        
+        if self.budget.remove_budget(category, month) is None:
+            print("No such budget")
+            return False
+        self.budget.save()
+        return True
+    
+    @synchronized
+    def budget_status(self, month: str = None) -> List[BudgetStatus]:
+        """Utilization of every budget in force in month (default: this
+        month), most used first"""
+        month = month or Date.today().isoformat()[:7]
+        statuses = [BudgetStatus(budget, month, self._month_spent(budget.category, month))
+                    for budget in self.budget.for_month(month)]
+        statuses.sort(key=lambda status: status.utilization, reverse=True)
+        return statuses
+    
+    def _record(self, op: str, changes: List[list]) -> None:
+        """Log a change in the history; updates that changed nothing are left
+        out. Called before the change is persisted, so that a checkpoint
+        taken by that save is filed under the right sequence number."""
+        if self.history is None:
+            return
+        changes = [change for change in changes if change[1] != change[2]]
+        if changes:
+            self.history.record(op, changes)
+    
+    def _apply_changes(self, changes: List[list], log: Callable[[List[list]], None]) -> None:
+        """Apply history changes to the ledger and persist them, skipping
+        any whose row is not in the state it expects (for example already
+        deleted). The changes applied are passed to log before they are
+        persisted, as with _record()."""
+        self._load_ids(change[0] for change in changes)
+        applied, added, updated, removed = [], [], [], set()
+        for change in changes:
+            expense_id, before, after = change
+            present = expense_id in self._positions and expense_id not in removed
+            if after is None:
+                if present:
+                    removed.add(expense_id)
+                    applied.append(change)
+            elif before is None:
+                if not present:
+                    expense = Expense.from_dict(dict(after, id=expense_id))
+                    self._insert_expense(expense)
+                    self.ids.observe(expense_id)
+                    added.append(expense)
+                    applied.append(change)
+            elif present:
+                expense = self.expenses[self._positions[expense_id]]
+                self._apply_fields(expense, after)
+                updated.append(expense)
+                applied.append(change)
+        deleted = self._remove_expenses(removed) if removed else []
+        self._register_categories(applied)
+        log(applied)
+        if applied:
+            if not self.journal_mode:
+                self._schedule_save()
+            else:
+                for op, expenses in (("delete", deleted), ("add", added), ("update", updated)):
+                    if expenses:
+                        self._persist(op, expenses)
+    
+    def _register_categories(self, changes: List[list]) -> None:
+        # A row brought back by undo or redo may name a category that was
+        # renamed or merged away since the change was recorded
+        names = {change[2]["category"] for change in changes if change[2] and "category" in change[2]}
+        if self.category_registry.add_missing(sorted(names)):
+            self.category_registry.save()
+    
+    def can_undo(self) -> bool:
+        return self.history is not None and bool(self.history.undo_stack)
+    
+    def can_redo(self) -> bool:
+        return self.history is not None and bool(self.history.redo_stack)
+    
+    @timed()
+    @exclusive
+    def undo(self) -> bool:
+        """Revert the most recent change that has not been undone yet"""
+        if not self.can_undo():
+            print("Nothing to undo")
+            return False
+        seq = self.history.undo_stack[-1]
+        entry = self.history.read(seq)
+        if entry is None:
+            self.history.undo_stack.pop()
+            print("That change is no longer in the history")
+            return False
+        self._apply_changes(invert(entry["changes"]), lambda applied: self.history.undone(seq, applied))
+        print(f"Undid {entry['op']} of {len(entry['changes'])} expense(s)")
+        return True
+    
+    @timed()
+    @exclusive
+    def redo(self) -> bool:
+        """Re-apply the change undone most recently"""
+        if not self.can_redo():
+            print("Nothing to redo")
+            return False
+        seq = self.history.redo_stack[-1]
+        entry = self.history.read(seq)
+        if entry is None:
+            self.history.redo_stack.pop()
+            print("That change is no longer in the history")
+            return False
+        self._apply_changes(entry["changes"], lambda applied: self.history.redone(seq, applied))
+        print(f"Redid {entry['op']} of {len(entry['changes'])} expense(s)")
+        return True
+    
+    @timed()
+    @synchronized
+    def as_of(self, when: str) -> Optional[List[Expense]]:
+        """The ledger as it stood at when, a YYYY-MM-DD date (meaning the end
+        of that day) or an ISO timestamp, in id order. Returns None if the
+        history is off or does not reach back that far."""
+        if self.history is None:
+            print("History is not enabled for this ledger")
+            return None
+        try:
+            moment = datetime.fromisoformat(when)
+        except (TypeError, ValueError):
+            print("Invalid date format. Please use YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS")
+            return None
+        if len(when) == 10:
+            moment = moment.replace(hour=23, minute=59, second=59, microsecond=999999)
+        plan = self.history.plan(moment.isoformat(timespec="microseconds"))
+        if plan is None:
+            print(f"History only reaches back to {self.history.horizon[:19]}")
+            return None
+        
+        target, checkpoint = plan
+        if checkpoint is None:
+            # Undo the changes made since, starting from the current ledger
+            self.load_all()
+            rows = {expense.id: expense.to_dict() for expense in self.expenses}
+            for entry in reversed(list(self.history.entries(target, self.history.seq))):
+                apply_to_rows(rows, invert(entry["changes"]))
+        else:
+            # Replay forward from the last checkpoint before it
+            rows = {data["id"]: data for data in iter_json_array(checkpoint[2])}
+            for entry in self.history.entries(checkpoint[0], target):
+                apply_to_rows(rows, entry["changes"])
+        return [Expense.from_dict(rows[expense_id]) for expense_id in sorted(rows)]
+    
+    @synchronized
     def add_category(self, category: str) -> bool:
         
-        if category in self.categories:
-            print(f"Category '{category}' already exists")
+        category = category.strip() if category else ""
+        if not category:
+            print("Category name cannot be empty")
             return False
         
-        self.categories.append(category)
+        existing = self.category_registry.resolve(category)
+        if existing is not None:
+            print(f"Category '{existing}' already exists")
+            return False
+        
+        self.category_registry.add(category)
+        self.category_registry.save()
         print(f"Category '{category}' added successfully")
         return True
     
+    def load_all(self) -> None:
+        """Bring every expense into memory; only ledgers that load rows
+        lazily have anything to do here"""
+    
+    @timed()
+    @exclusive
+    def rename_category(self, old: str, new: str) -> bool:
+        """Rename a category, moving its expenses, budgets and recurring
+        rules along in one pass and saving once"""
+        new = new.strip() if new else ""
+        if old not in self.category_registry:
+            print(f"Category '{old}' not found")
+            return False
+        if not new:
+            print("Category name cannot be empty")
+            return False
+        existing = self.category_registry.resolve(new)
+        if existing is not None and existing != old:
+            print(f"Category '{existing}' already exists; merge the categories instead")
+            return False
+        if new == old:
+            return True
+        
+        self._recategorize(old, new)
+        self.category_registry.rename(old, new)
+        self.category_registry.save()
+        print(f"Category '{old}' renamed to '{new}'")
+        return True
+    
+    @timed()
+    @exclusive
+    def merge_category(self, source: str, target: str) -> bool:
+        """Move every expense, budget and recurring rule of category source
+        into target and drop source, saving once"""
+        for category in (source, target):
+            if category not in self.category_registry:
+                print(f"Category '{category}' not found")
+                return False
+        if source == target:
+            print("Cannot merge a category into itself")
+            return False
+        
+        self._recategorize(source, target)
+        self.category_registry.remove(source)
+        self.category_registry.save()
+        print(f"Category '{source}' merged into '{target}'")
+        return True
+    
+    def _recategorize(self, old: str, new: str) -> None:
+        """Move every expense in category old to new in a single pass over
+        the ledger, carry the aggregates over and rewrite the snapshot once"""
+        self.load_all()
+        new = sys.intern(new)
+        months = {month for category, month in self._category_month_totals if category == old}
+        if months:
+            if self.columnar:
+                self.expenses.recategorize(old, new)
+            else:
+                for expense in self.expenses:
+                    if expense.category == old:
+                        expense.category = new
+            
+            def rekey(totals, key_of):
+                merged = {}
+                for key, (amount, count) in totals.items():
+                    entry = merged.setdefault(key_of(key), [0, 0])
+                    entry[0] += amount
+                    entry[1] += count
+                return merged
+            
+            self._category_totals = rekey(self._category_totals,
+                                          lambda category: new if category == old else category)
+            self._category_month_totals = rekey(self._category_month_totals,
+                                                lambda key: (new, key[1]) if key[0] == old else key)
+            self._touch(months)
+            self._schedule_save()
+        if self.budget.recategorize(old, new):
+            self.budget.save()
+    
     def view_categories(self) -> None:
         
         print("\nAvailable Categories:")
         for i, category in enumerate(self.categories, 1):
             print(f"{i}. {category}")
+    
+    def metrics_snapshot(self) -> Dict:
+        """Timers, sizes and counters from expense_metrics (empty unless
+        EXPENSE_METRICS is set) plus report cache stats, ready for JSON"""
+        snapshot = metrics.snapshot()
+        snapshot["report_cache"] = self.report_cache.stats()
+        snapshot["expenses"] = self.get_totals()[1]
+        return snapshot
+    
+    def dump_metrics(self, path: str) -> None:
+        """Write metrics_snapshot() to path as JSON"""
+        write_json(path, self.metrics_snapshot())
 
 
-
-
-
-
+def create_manager(data_file: str = "expenses.json", **kwargs) -> ExpenseManager:
+    """Open a ledger with the storage backend matching its file extension"""
+    if data_file.endswith((".db", ".sqlite", ".sqlite3")):
+        # SQLite does its own locking, and rows are read from the database
+        # rather than kept in memory, so every process sees every change
+        from expense_sqlite import SqliteExpenseManager
+        return SqliteExpenseManager(data_file, load=kwargs.get("load", True), history=kwargs.get("history", False))
+    if kwargs.pop("partitioned", False) or os.path.isdir(data_file):
+        from expense_partitions import PartitionedExpenseManager
+        # Partitions are small files; only single-file ledgers are cached
+        kwargs.pop("cache", None)
+        if kwargs.pop("shared", False):
+            print("Partitioned ledgers cannot be shared; changes other processes save will not be seen")
+        return PartitionedExpenseManager(data_file, **kwargs)
+    return ExpenseManager(data_file, **kwargs)
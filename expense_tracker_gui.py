@@ -3,20 +3,39 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 from datetime import datetime
-from expense_tracker import ExpenseManager, Expense
+from expense_tracker import ExpenseManager, Expense, create_manager
+from expense_metrics import dump_at_exit, metrics
+from expense_money import format_minor
+from expense_reports import render_text
+from expense_worker import BackgroundWorker
 
 
 class ExpenseTrackerGUI:
     
     
-    def __init__(self):
-        self.manager = ExpenseManager()
+    def __init__(self, data_file: str = "expenses.json", shared: bool = False):
+        # The window comes up first; the ledger is read on the worker thread
+        # (from the binary cache when it is still valid). Changes are logged
+        # for Undo, Redo and As Of, except on a shared ledger: the history
+        # log is written by one process only.
+        self.manager = create_manager(data_file, cache=True, load=False, history=not shared, shared=shared)
+        # Saves and report files are written on a worker thread
+        self.worker = BackgroundWorker(self.manager)
+        self.manager.save_scheduler = self.worker.request_save
+        # EXPENSE_METRICS=metrics.json writes the manager's metrics on exit
+        dump_at_exit(self.manager.metrics_snapshot)
+        self.shown_save_time = None
+        self.loaded_count = None  # rows read so far while loading, else None
+        self.shown_count = None
+        self.stop_loading = False
         self.root = tk.Tk()
         self.root.title("Personal Expense Tracker")
         self.root.geometry("800x600")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         self.setup_ui()
-        self.refresh_expense_list()
+        self.start_loading()
+        self.poll_worker()
     
     def setup_ui(self):
         
@@ -52,8 +71,19 @@ class ExpenseTrackerGUI:
                   command=self.download_report).pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="Filter", 
                   command=self.filter_dialog).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Undo", 
+                  command=self.undo).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Redo", 
+                  command=self.redo).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="As Of...", 
+                  command=self.as_of_dialog).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Review...", 
+                  command=self.review_anomalies).pack(side=tk.LEFT, padx=5)
         ttk.Button(buttons_frame, text="Refresh", 
                   command=self.refresh_expense_list).pack(side=tk.LEFT, padx=(5, 0))
+        self.action_buttons = buttons_frame.winfo_children()
+        self.root.bind("<Control-z>", lambda event: self.undo())
+        self.root.bind("<Control-y>", lambda event: self.redo())
         
         # Expenses list frame
         list_frame = ttk.LabelFrame(main_frame, text="Expenses", padding="5")
@@ -79,12 +109,14 @@ class ExpenseTrackerGUI:
         self.expense_tree.column("Note", width=300)
         
         # Scrollbar
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.expense_tree.yview)
-        self.expense_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL)
         
         self.expense_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         
+        # Only the rows scrolled into view exist as Treeview items
+        self.expense_list = VirtualExpenseList(self.expense_tree, scrollbar)
+        
         # Status bar
         self.status_var = tk.StringVar()
         self.status_var.set("Ready")
@@ -92,25 +124,61 @@ class ExpenseTrackerGUI:
                               relief=tk.SUNKEN, anchor=tk.W)
         status_bar.grid(row=3, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(10, 0))
     
+    def start_loading(self):
+        """Load the ledger on the worker thread, showing rows as they arrive.
+        The buttons stay disabled until every row is in."""
+        for button in self.action_buttons:
+            button.state(["disabled"])
+        self.status_var.set("Loading expenses...")
+        self.loaded_count = 0
+        self.expense_list.show_ledger(self.manager)
+        self.worker.submit(self.load_ledger, callback=self.loading_done, error_callback=self.loading_failed)
+    
+    def load_ledger(self):
+        """Worker side of start_loading(). The manager lock is held one batch
+        at a time, so the Tk thread can page through what is loaded so far."""
+        batches = self.manager.iter_load(batch_size=5000)
+        while not self.stop_loading:
+            with self.manager.lock:
+                count = next(batches, None)
+            if count is None:
+                return
+            self.loaded_count = count
+    
+    def loading_done(self, result):
+        
+        self.loaded_count = None
+        for button in self.action_buttons:
+            button.state(["!disabled"])
+        # Recurring expenses that fell due since the last run
+        self.manager.materialize_recurring()
+        self.refresh_expense_list()
+        self.show_budget_alerts()
+    
+    def loading_failed(self, error):
+        
+        self.loaded_count = None
+        for button in self.action_buttons:
+            button.state(["!disabled"])
+        self.update_status()
+        messagebox.showerror("Error", f"Could not load expenses: {error}")
+    
     def refresh_expense_list(self):
         """Refresh the expense list display"""
-        # Clear existing items
-        for item in self.expense_tree.get_children():
-            self.expense_tree.delete(item)
-        
-        # Add expenses to tree
-        for expense in self.manager.expenses:
-            self.expense_tree.insert("", tk.END, values=(
-                expense.id,
-                expense.date,
-                expense.category,
-                f"Rs.{expense.amount:.2f}",
-                expense.note
-            ))
-        
-        # Update status
-        total_expenses = sum(exp.amount for exp in self.manager.expenses)
-        self.status_var.set(f"Total Expenses: Rs.{total_expenses:.2f} | Count: {len(self.manager.expenses)}")
+        # Pick up edits other processes made to a shared ledger
+        self.manager.sync()
+        self.expense_list.show_ledger(self.manager)
+        self.update_status()
+    
+    def update_status(self):
+        
+        total_expenses, count = self.manager.get_totals()
+        status = f"Total Expenses: Rs.{total_expenses:.2f} | Count: {count}"
+        # Only recorded when instrumentation is enabled
+        self.shown_save_time = metrics.last_time("save_expenses")
+        if self.shown_save_time is not None:
+            status += f" | Last save: {self.shown_save_time * 1000:.0f} ms"
+        self.status_var.set(status)
     
     def add_expense_dialog(self):
         
@@ -118,8 +186,10 @@ class ExpenseTrackerGUI:
         if dialog.result:
             amount, category, note, date = dialog.result
             if self.manager.add_expense(amount, category, note):
-                self.refresh_expense_list()
+                self.expense_list.refresh()
+                self.update_status()
                 messagebox.showinfo("Success", "Expense added successfully!")
+                self.show_budget_alerts()
     
     def update_expense_dialog(self):
         
@@ -141,8 +211,78 @@ class ExpenseTrackerGUI:
         if dialog.result:
             amount, category, note, date = dialog.result
             if self.manager.update_expense(expense_id, amount, category, note, date):
-                self.refresh_expense_list()
+                self.expense_list.refresh()
+                self.update_status()
                 messagebox.showinfo("Success", "Expense updated successfully!")
+                self.show_budget_alerts()
+    
+    def show_budget_alerts(self):
+        """Warn about budgets the last change brought near or over their limit"""
+        if self.manager.budget_alerts:
+            lines = [f"{status.level.capitalize()}: {status}" for status in self.manager.budget_alerts]
+            messagebox.showwarning("Budget", "\n".join(lines))
+    
+    def undo(self):
+        
+        # The shortcuts stay live while loading; the buttons do not
+        if self.loaded_count is not None:
+            return
+        if self.manager.undo():
+            self.refresh_expense_list()
+        else:
+            self.status_var.set("Nothing to undo")
+    
+    def redo(self):
+        
+        if self.loaded_count is not None:
+            return
+        if self.manager.redo():
+            self.refresh_expense_list()
+        else:
+            self.status_var.set("Nothing to redo")
+    
+    def as_of_dialog(self):
+        """Show the ledger as it stood at an earlier date, read-only"""
+        when = simpledialog.askstring("As Of", "Show the ledger as of (YYYY-MM-DD or YYYY-MM-DDTHH:MM):",
+                                      parent=self.root)
+        if not when:
+            return
+        rows = self.manager.as_of(when.strip())
+        if rows is None:
+            messagebox.showerror("Error", "Invalid date, or the history does not reach back that far.")
+            return
+        self.expense_list.show_rows(rows)
+        total = sum(expense.amount for expense in rows)
+        self.status_var.set(f"Ledger as of {when.strip()}: Rs.{total:.2f} in {len(rows)} expenses "
+                            f"(Refresh to return)")
+    
+    def review_anomalies(self):
+        """Scan for duplicates and outliers in the background, then review them"""
+        self.status_var.set("Looking for duplicates and outliers...")
+        self.worker.submit(self.manager.find_anomalies,
+                           callback=self.anomalies_found, error_callback=self.anomalies_failed)
+    
+    def anomalies_found(self, report):
+        
+        self.update_status()
+        if not report.findings:
+            messagebox.showinfo("Review", f"No duplicates or outliers found in {report.rows} expenses.")
+            return
+        
+        dialog = AnomalyDialog(self.root, report)
+        if dialog.result:
+            if not messagebox.askyesno("Confirm Delete", f"Delete {len(dialog.result)} expenses?"):
+                return
+            if self.manager.delete_expenses(dialog.result):
+                self.refresh_expense_list()
+                messagebox.showinfo("Success", f"Deleted {len(dialog.result)} expenses.")
+            else:
+                messagebox.showerror("Error", "Some of those expenses no longer exist; nothing was deleted.")
+    
+    def anomalies_failed(self, error):
+        
+        self.update_status()
+        messagebox.showerror("Error", f"Could not scan the expenses: {error}")
     
     def delete_expense_dialog(self):
         
@@ -158,12 +298,14 @@ class ExpenseTrackerGUI:
                                    "Are you sure you want to delete this expense?")
         if result:
             if self.manager.delete_expense(expense_id):
-                self.refresh_expense_list()
+                self.expense_list.discard(expense_id)
+                self.update_status()
                 messagebox.showinfo("Success", "Expense deleted successfully!")
     
     def show_summary_report(self):
         
-        if not self.manager.expenses:
+        report = self.manager.build_report()
+        if not report.count:
             messagebox.showinfo("Info", "No expenses found.")
             return
         
@@ -182,98 +324,116 @@ class ExpenseTrackerGUI:
         text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        # Generate report text
-        total_spent = sum(expense.amount for expense in self.manager.expenses)
-        
-        # Group by category
-        category_totals = {}
-        for expense in self.manager.expenses:
-            category_totals[expense.category] = category_totals.get(expense.category, 0) + expense.amount
-        
-        # Group by month
-        month_totals = {}
-        for expense in self.manager.expenses:
-            month = expense.date[:7]  # YYYY-MM
-            month_totals[month] = month_totals.get(month, 0) + expense.amount
-        
-        report_text = f"""EXPENSE SUMMARY REPORT
-{'='*50}
-Total Expenses: Rs.{total_spent:.2f}
-Total Transactions: {len(self.manager.expenses)}
-
-By Category:
-"""
-        for category, total in sorted(category_totals.items()):
-            percentage = (total / total_spent) * 100 if total_spent > 0 else 0
-            report_text += f"  {category}: Rs.{total:.2f} ({percentage:.1f}%)\n"
-        
-        report_text += "\nBy Month:\n"
-        for month, total in sorted(month_totals.items()):
-            report_text += f"  {month}: Rs.{total:.2f}\n"
-        
-        text_widget.insert(tk.END, report_text)
+        # Same text as the saved summary report
+        text_widget.insert(tk.END, render_text(report))
         text_widget.config(state=tk.DISABLED)
     
     def download_report(self):
         """Download summary report as text file"""
-        if not self.manager.expenses:
+        if not self.manager.get_summary_totals()[1]:
             messagebox.showinfo("Info", "No expenses found.")
             return
         
-        # Generate and save the report
-        self.manager.get_summary_report(save_to_file=True)
+        # Generate and save the report in the background
+        self.status_var.set("Saving report...")
+        self.worker.submit(self.manager.get_summary_report, save_to_file=True,
+                           callback=self.report_saved, error_callback=self.report_failed)
+    
+    def report_saved(self, result):
+        
+        self.update_status()
         messagebox.showinfo("Success", "Summary report has been saved as a text file!")
     
+    def report_failed(self, error):
+        
+        self.update_status()
+        messagebox.showerror("Error", f"Could not save the report: {error}")
+    
+    def poll_worker(self):
+        """Run callbacks for finished background work"""
+        self.worker.poll()
+        if self.loaded_count is not None and self.loaded_count != self.shown_count:
+            self.shown_count = self.loaded_count
+            self.expense_list.refresh()
+            self.status_var.set(f"Loading expenses... {self.shown_count:,} so far")
+        elif metrics.enabled and metrics.last_time("save_expenses") != self.shown_save_time:
+            self.update_status()
+        self.root.after(100, self.poll_worker)
+    
+    def on_close(self):
+        """Flush pending saves before the window goes away"""
+        self.status_var.set("Saving...")
+        self.root.update_idletasks()
+        self.stop_loading = True
+        self.worker.stop()
+        self.root.destroy()
+    
     def filter_dialog(self):
         """Show filter dialog"""
         filter_window = tk.Toplevel(self.root)
         filter_window.title("Filter Expenses")
-        filter_window.geometry("300x200")
+        filter_window.geometry("360x420")
         
         frame = ttk.Frame(filter_window, padding="10")
         frame.pack(fill=tk.BOTH, expand=True)
         
-        # Category filter
-        ttk.Label(frame, text="Category:").grid(row=0, column=0, sticky=tk.W, pady=5)
-        category_var = tk.StringVar()
-        category_combo = ttk.Combobox(frame, textvariable=category_var, 
-                                     values=[""] + self.manager.categories)
-        category_combo.grid(row=0, column=1, sticky=(tk.W, tk.E), pady=5)
-        
-        # Date filter
-        ttk.Label(frame, text="Date (YYYY-MM-DD):").grid(row=1, column=0, sticky=tk.W, pady=5)
-        date_var = tk.StringVar()
-        date_entry = ttk.Entry(frame, textvariable=date_var)
-        date_entry.grid(row=1, column=1, sticky=(tk.W, tk.E), pady=5)
+        # Category filter; any number of categories may be selected. Categories
+        # only found in older ledgers are offered too.
+        ttk.Label(frame, text="Categories:").grid(row=0, column=0, sticky=(tk.W, tk.N), pady=5)
+        known = set(self.manager.categories) | set(self.manager.get_summary_totals()[2])
+        category_names = sorted(known, key=str.lower)
+        category_list = tk.Listbox(frame, selectmode=tk.MULTIPLE, height=6, exportselection=False)
+        for name in category_names:
+            category_list.insert(tk.END, name)
+        category_list.grid(row=0, column=1, sticky=(tk.W, tk.E), pady=5)
+        
+        # Range and text filters
+        fields = {}
+        for row, (key, label) in enumerate((("date_from", "From date (YYYY-MM-DD):"),
+                                             ("date_to", "To date (YYYY-MM-DD):"),
+                                             ("min_amount", "Min amount:"),
+                                             ("max_amount", "Max amount:"),
+                                             ("text", "Note words:"),
+                                             ("note_contains", "Note contains:")), 1):
+            ttk.Label(frame, text=label).grid(row=row, column=0, sticky=tk.W, pady=5)
+            fields[key] = tk.StringVar()
+            ttk.Entry(frame, textvariable=fields[key]).grid(row=row, column=1, sticky=(tk.W, tk.E), pady=5)
+        
+        # Sort order
+        ttk.Label(frame, text="Sort by:").grid(row=7, column=0, sticky=tk.W, pady=5)
+        sort_var = tk.StringVar()
+        ttk.Combobox(frame, textvariable=sort_var, state="readonly",
+                     values=["", "date", "amount", "category", "note", "id"]).grid(row=7, column=1, sticky=(tk.W, tk.E), pady=5)
+        descending_var = tk.BooleanVar()
+        ttk.Checkbutton(frame, text="Descending", variable=descending_var).grid(row=8, column=1, sticky=tk.W)
         
         frame.columnconfigure(1, weight=1)
         
         def apply_filter():
-            category = category_var.get().strip()
-            date = date_var.get().strip()
-            
-            # Clear existing items
-            for item in self.expense_tree.get_children():
-                self.expense_tree.delete(item)
-            
-            # Apply filter and add filtered expenses
-            filtered_expenses = self.manager.expenses.copy()
-            
-            if category:
-                filtered_expenses = [exp for exp in filtered_expenses 
-                                   if exp.category.lower() == category.lower()]
+            criteria = {key: var.get().strip() or None for key, var in fields.items()}
+            try:
+                for key in ("date_from", "date_to"):
+                    if criteria[key]:
+                        datetime.strptime(criteria[key], "%Y-%m-%d")
+            except ValueError:
+                messagebox.showerror("Error", "Please enter dates in YYYY-MM-DD format.")
+                return
+            try:
+                for key in ("min_amount", "max_amount"):
+                    if criteria[key]:
+                        criteria[key] = float(criteria[key])
+            except ValueError:
+                messagebox.showerror("Error", "Please enter valid amounts.")
+                return
             
-            if date:
-                filtered_expenses = [exp for exp in filtered_expenses if exp.date == date]
+            criteria["categories"] = [category_names[i] for i in category_list.curselection()]
+            criteria["sort_by"] = sort_var.get() or None
+            criteria["descending"] = descending_var.get()
             
-            for expense in filtered_expenses:
-                self.expense_tree.insert("", tk.END, values=(
-                    expense.id,
-                    expense.date,
-                    expense.category,
-                    f"Rs.{expense.amount:.2f}",
-                    expense.note
-                ))
+            # Apply filter and show the filtered expenses
+            filtered_expenses = self.manager.query(**criteria)
+            self.expense_list.show_rows(filtered_expenses)
+            self.status_var.set(f"Showing {len(filtered_expenses)} matching expenses")
             
             filter_window.destroy()
         
@@ -283,7 +443,7 @@ By Category:
         
         # Buttons
         button_frame = ttk.Frame(frame)
-        button_frame.grid(row=2, column=0, columnspan=2, pady=20)
+        button_frame.grid(row=9, column=0, columnspan=2, pady=20)
         
         ttk.Button(button_frame, text="Apply Filter", command=apply_filter).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Clear Filter", command=clear_filter).pack(side=tk.LEFT, padx=5)
@@ -294,6 +454,180 @@ By Category:
         self.root.mainloop()
 
 
+class VirtualExpenseList:
+    """Windowed view over the expense Treeview.
+    
+    Only the rows that fit in the widget are materialized as Tk items. Rows
+    are fetched a page at a time (the window plus BUFFER rows either side)
+    either from the manager or from a filtered list, and the scrollbar is
+    driven by hand over the full row range. Re-rendering diffs the window
+    against what is already on screen, so a single add, update or delete
+    only touches the rows that actually changed.
+    """
+    
+    BUFFER = 50
+    
+    def __init__(self, tree, scrollbar):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.manager = None
+        self.rows = None  # filtered list being shown, or None for the whole ledger
+        self.offset = 0
+        self.visible_rows = int(tree.cget("height"))
+        self._rendered = {}  # iid -> values currently in the tree
+        self._cache = []
+        self._cache_start = 0
+        self._cache_valid = False
+        
+        scrollbar.configure(command=self.yview)
+        tree.bind("<Configure>", self._on_resize)
+        tree.bind("<MouseWheel>", self._on_mousewheel)
+        tree.bind("<Button-4>", lambda event: self.scroll(-3))
+        tree.bind("<Button-5>", lambda event: self.scroll(3))
+        tree.bind("<Up>", lambda event: self._on_arrow(-1))
+        tree.bind("<Down>", lambda event: self._on_arrow(1))
+        tree.bind("<Prior>", lambda event: self.scroll(-self.visible_rows))
+        tree.bind("<Next>", lambda event: self.scroll(self.visible_rows))
+    
+    def show_ledger(self, manager):
+        
+        self.manager = manager
+        self.rows = None
+        self.offset = 0
+        self.refresh()
+    
+    def show_rows(self, rows):
+        
+        self.rows = rows
+        self.offset = 0
+        self.refresh()
+    
+    def refresh(self):
+        """Re-fetch the visible window and update only the rows that changed"""
+        self._cache_valid = False
+        self._render()
+    
+    def discard(self, expense_id):
+        """Forget a deleted expense and re-render the window"""
+        if self.rows is not None:
+            self.rows = [expense for expense in self.rows if expense.id != expense_id]
+        self.refresh()
+    
+    def count(self):
+        
+        if self.rows is not None:
+            return len(self.rows)
+        if self.manager is None:
+            return 0
+        return self.manager.get_totals()[1]
+    
+    def _fetch(self, offset, limit):
+        if self.rows is not None:
+            return self.rows[offset:offset + limit]
+        return self.manager.get_page(offset, limit)
+    
+    def _window(self, total):
+        start = self.offset
+        end = min(start + self.visible_rows, total)
+        cache_end = self._cache_start + len(self._cache)
+        if not (self._cache_valid and self._cache_start <= start and (end <= cache_end or cache_end >= total)):
+            self._cache_start = max(0, start - self.BUFFER)
+            self._cache = self._fetch(self._cache_start, self.visible_rows + 2 * self.BUFFER)
+            self._cache_valid = True
+        return self._cache[start - self._cache_start:end - self._cache_start]
+    
+    @staticmethod
+    def _row_values(expense):
+        return (
+            expense.id,
+            expense.date,
+            expense.category,
+            f"Rs.{expense.amount:.2f}",
+            expense.note
+        )
+    
+    def _render(self):
+        total = self.count()
+        self.offset = max(0, min(self.offset, total - self.visible_rows))
+        
+        desired = []
+        seen = {}
+        for expense in self._window(total):
+            iid = str(expense.id)
+            # Legacy ledgers can hold duplicate ids; keep their items distinct
+            if iid in seen:
+                seen[iid] += 1
+                iid = f"{iid}#{seen[iid]}"
+            else:
+                seen[iid] = 0
+            desired.append((iid, self._row_values(expense)))
+        
+        desired_ids = {iid for iid, values in desired}
+        for iid in list(self._rendered):
+            if iid not in desired_ids:
+                self.tree.delete(iid)
+                del self._rendered[iid]
+        
+        for index, (iid, values) in enumerate(desired):
+            current = self._rendered.get(iid)
+            if current is None:
+                self.tree.insert("", index, iid=iid, values=values)
+            else:
+                if current != values:
+                    self.tree.item(iid, values=values)
+                if self.tree.index(iid) != index:
+                    self.tree.move(iid, "", index)
+            self._rendered[iid] = values
+        
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.visible_rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+    
+    def scroll(self, delta):
+        
+        self.offset += delta
+        self._render()
+        return "break"
+    
+    def yview(self, *args):
+        """Scrollbar command: translate moveto/scroll into a new offset"""
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * self.count())
+        elif args[0] == "scroll":
+            step = self.visible_rows if args[2] == "pages" else 1
+            self.offset += int(args[1]) * step
+        self._render()
+    
+    def _on_mousewheel(self, event):
+        return self.scroll(-3 if event.delta > 0 else 3)
+    
+    def _on_arrow(self, direction):
+        children = self.tree.get_children()
+        focus = self.tree.focus()
+        if not children or focus not in children:
+            return None
+        edge = children[0] if direction < 0 else children[-1]
+        if focus != edge:
+            return None  # normal Treeview navigation inside the window
+        self.scroll(direction)
+        children = self.tree.get_children()
+        if children:
+            target = children[0] if direction < 0 else children[-1]
+            self.tree.focus(target)
+            self.tree.selection_set(target)
+        return "break"
+    
+    def _on_resize(self, event):
+        style = ttk.Style()
+        row_height = int(style.lookup("Treeview", "rowheight") or 20)
+        # Leave room for the heading row
+        rows = max(1, (event.height - 25) // row_height)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self._render()
+
+
 class ExpenseDialog:
     
     
@@ -380,6 +714,77 @@ class ExpenseDialog:
                 messagebox.showerror("Error", "Please enter a valid amount.")
 
 
+class AnomalyDialog:
+    """Findings of ExpenseManager.find_anomalies as a tree: one parent row per
+    finding with its expenses beneath. result is the ids picked for deletion;
+    picking a duplicate group picks every expense in it but the first."""
+    
+    MAX_SHOWN = 1000
+    
+    def __init__(self, parent, report):
+        self.result = None
+        
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Review Duplicates and Outliers")
+        self.dialog.geometry("800x450")
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+        self.dialog.geometry("+%d+%d" % (parent.winfo_rootx() + 50, parent.winfo_rooty() + 50))
+        
+        frame = ttk.Frame(self.dialog, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        summary = str(report)
+        if len(report.findings) > self.MAX_SHOWN:
+            summary += f" (showing the first {self.MAX_SHOWN})"
+        ttk.Label(frame, text=summary).pack(anchor=tk.W, pady=(0, 5))
+        
+        tree_frame = ttk.Frame(frame)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        columns = ("ID", "Date", "Category", "Amount", "Note")
+        self.tree = ttk.Treeview(tree_frame, columns=columns, show="tree headings")
+        self.tree.heading("#0", text="Finding")
+        self.tree.column("#0", width=320)
+        for column, width in zip(columns, (70, 90, 100, 90, 200)):
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=width)
+        scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        for finding in report.findings[:self.MAX_SHOWN]:
+            parent_item = self.tree.insert("", tk.END, text=f"{finding.kind.capitalize()}: {finding.reason}",
+                                           open=True)
+            for expense_id, paise, category, note, date, _, _ in finding.rows:
+                self.tree.insert(parent_item, tk.END,
+                                 values=(expense_id, date, category, f"Rs.{format_minor(paise)}", note))
+        
+        button_frame = ttk.Frame(frame)
+        button_frame.pack(pady=(10, 0))
+        ttk.Button(button_frame, text="Delete Selected", command=self.delete_clicked).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Close", command=self.dialog.destroy).pack(side=tk.LEFT, padx=5)
+        
+        self.dialog.wait_window()
+    
+    def delete_clicked(self):
+        
+        ids = []
+        for item in self.tree.selection():
+            children = self.tree.get_children(item)
+            if children:
+                # A whole finding: keep the first of a duplicate group
+                items = children if len(children) == 1 else children[1:]
+            else:
+                items = (item,)
+            ids.extend(int(self.tree.item(child)['values'][0]) for child in items)
+        if not ids:
+            messagebox.showwarning("Warning", "Please select expenses or findings to delete.", parent=self.dialog)
+            return
+        self.result = list(dict.fromkeys(ids))
+        self.dialog.destroy()
+
+
 if __name__ == "__main__":
     app = ExpenseTrackerGUI()
     app.run()
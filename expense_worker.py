@@ -0,0 +1,124 @@
+import collections
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+
+class BackgroundWorker:
+    """Runs ExpenseManager saves and report generation off the Tk thread.
+
+    Saves requested with request_save() are coalesced: the worker waits
+    save_delay seconds after the first request, then writes once for every
+    request that arrived in the meantime. Other work is queued with
+    submit(). Its results are handed back through poll(), which the GUI
+    calls from root.after() so callbacks always run on the Tk thread.
+    """
+
+    def __init__(self, manager, save_delay: float = 0.25):
+        self.manager = manager
+        self.save_delay = save_delay
+        self.saves_requested = 0
+        self.saves_written = 0
+        self._tasks = collections.deque()
+        self._results = queue.SimpleQueue()
+        self._condition = threading.Condition()
+        self._save_pending = False
+        self._save_due = 0.0
+        self._busy = False
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="expense-worker", daemon=True)
+        self._thread.start()
+
+    def request_save(self) -> None:
+
+        with self._condition:
+            self.saves_requested += 1
+            if not self._save_pending:
+                self._save_pending = True
+                self._save_due = time.monotonic() + self.save_delay
+                self._condition.notify_all()
+
+    def submit(self, func: Callable, *args, callback: Optional[Callable] = None,
+               error_callback: Optional[Callable] = None, **kwargs) -> None:
+        """Run func(*args, **kwargs) on the worker; callback(result) or
+        error_callback(exception) is invoked later from poll()"""
+        with self._condition:
+            self._tasks.append((func, args, kwargs, callback, error_callback))
+            self._condition.notify_all()
+
+    def poll(self) -> None:
+        """Deliver finished results; call this on the UI thread"""
+        while True:
+            try:
+                callback, value = self._results.get_nowait()
+            except queue.Empty:
+                return
+            callback(value)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Write any pending save now and wait until the worker is idle"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._save_due = time.monotonic()
+            self._condition.notify_all()
+            while self._tasks or self._save_pending or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Flush outstanding work and shut the thread down"""
+        flushed = self.flush(timeout)
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        return flushed
+
+    def _next_job(self):
+        with self._condition:
+            while True:
+                if self._tasks:
+                    job = self._tasks.popleft()
+                    break
+                if self._save_pending:
+                    remaining = self._save_due - time.monotonic()
+                    if remaining <= 0 or self._stopping:
+                        self._save_pending = False
+                        job = None
+                        break
+                    self._condition.wait(remaining)
+                    continue
+                if self._stopping:
+                    return False
+                self._condition.wait()
+            self._busy = True
+            return job
+
+    def _run(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is False:
+                return
+            try:
+                if job is None:
+                    self.manager.save_expenses()
+                    self.saves_written += 1
+                else:
+                    func, args, kwargs, callback, error_callback = job
+                    try:
+                        result = func(*args, **kwargs)
+                    except Exception as e:
+                        print(f"Background task failed: {e}")
+                        if error_callback is not None:
+                            self._results.put((error_callback, e))
+                    else:
+                        if callback is not None:
+                            self._results.put((callback, result))
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
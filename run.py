@@ -4,8 +4,21 @@ import sys
 import os
 
 def main():
+    # EXPENSE_PROFILE=cprofile|tracemalloc profiles the whole session
+    from expense_metrics import start_profiling
+    start_profiling()
+    # run.py --serve [ledger] [--port N] serves the ledger as a local JSON
+    # API instead of opening the window (see expense_server.py)
+    if sys.argv[1:2] == ["--serve"]:
+        from expense_server import main as serve
+        serve(sys.argv[2:])
+        return
     from expense_tracker_gui import ExpenseTrackerGUI
-    ExpenseTrackerGUI().run()
+    # Optional ledger path; a .db/.sqlite file opens the SQLite backend,
+    # a directory the month-partitioned one. --shared lets several windows
+    # edit the same JSON ledger at once (see ExpenseManager's shared mode).
+    args = [arg for arg in sys.argv[1:] if arg != "--shared"]
+    ExpenseTrackerGUI(*args[:1], shared="--shared" in sys.argv[1:]).run()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,139 @@
+"""Random edits against every in-memory store, checking after each one that
+the running aggregates match a full recompute.
+
+Run with: python -m pytest -q tests  (or python -m unittest discover tests)
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_tracker import create_manager
+
+
+STEPS = 150
+MONTHS = ("2025-01", "2025-02", "2025-06", "2025-09", "2025-10")
+NOTES = ("lunch", "bus", "rent", "", "coffee beans")
+
+
+class RandomEdits:
+    """Applies one random operation at a time to a manager"""
+
+    def __init__(self, open_manager, directory: str, seed: int):
+        self.open_manager = open_manager
+        self.directory = directory
+        self.rng = random.Random(seed)
+        self.manager = open_manager()
+        self.imports = 0
+
+    def amount(self) -> float:
+        return round(self.rng.uniform(0.01, 2000), 2)
+
+    def date(self) -> str:
+        return f"{self.rng.choice(MONTHS)}-{self.rng.randint(1, 28):02d}"
+
+    def category(self) -> str:
+        return self.rng.choice(self.manager.categories)
+
+    def ids(self, count: int):
+        ids = [expense.id for expense in self.manager.expenses]
+        return self.rng.sample(ids, min(count, len(ids)))
+
+    def item(self) -> dict:
+        return {"amount": self.amount(), "category": self.category(), "note": self.rng.choice(NOTES),
+                "date": self.date()}
+
+    def fields(self) -> dict:
+        fields = {"amount": self.amount(), "category": self.category(), "date": self.date()}
+        return dict(self.rng.sample(sorted(fields.items()), self.rng.randint(1, 3)))
+
+    def add(self):
+        self.manager.add_expense(self.amount(), self.category(), self.rng.choice(NOTES))
+
+    def update(self):
+        for expense_id in self.ids(1):
+            self.manager.update_expense(expense_id, **self.fields())
+
+    def delete(self):
+        for expense_id in self.ids(1):
+            self.manager.delete_expense(expense_id)
+
+    def add_batch(self):
+        self.manager.add_expenses([self.item() for _ in range(self.rng.randint(1, 20))])
+
+    def update_batch(self):
+        self.manager.update_expenses({expense_id: self.fields() for expense_id in self.ids(10)})
+
+    def delete_batch(self):
+        self.manager.delete_expenses(self.ids(self.rng.randint(1, 10)))
+
+    def import_csv(self):
+        self.imports += 1
+        path = os.path.join(self.directory, f"import{self.imports}.csv")
+        with open(path, 'w', newline='') as f:
+            f.write("date,amount,category,note\n")
+            for _ in range(self.rng.randint(1, 30)):
+                item = self.item()
+                f.write(f"{item['date']},{item['amount']},{item['category']},{item['note']}\n")
+        self.manager.import_file(path)
+
+    def rename(self):
+        self.manager.rename_category(self.category(), f"Renamed {self.rng.randrange(10 ** 6)}")
+
+    def merge(self):
+        if len(self.manager.categories) > 2:
+            source, target = self.rng.sample(self.manager.categories, 2)
+            self.manager.merge_category(source, target)
+
+    def reopen(self):
+        self.manager.save_expenses()
+        self.manager.ids.close()
+        self.manager = self.open_manager()
+
+    OPERATIONS = (add, update, delete, add_batch, update_batch, delete_batch, import_csv, rename, merge, reopen)
+    WEIGHTS = (4, 4, 2, 3, 2, 2, 1, 1, 1, 1)
+
+    def step(self) -> str:
+        operation = self.rng.choices(self.OPERATIONS, self.WEIGHTS)[0]
+        operation(self)
+        return operation.__name__
+
+
+class AggregateTest(unittest.TestCase):
+
+    def check_store(self, open_manager, directory: str, seed: int = 1):
+        with contextlib.redirect_stdout(io.StringIO()):
+            edits = RandomEdits(open_manager, directory, seed)
+            for i in range(STEPS):
+                operation = edits.step()
+                manager = edits.manager
+                running = (manager._total, manager._category_totals, manager._month_totals,
+                           manager._category_month_totals)
+                self.assertEqual(running, manager._compute_aggregates(), f"after step {i} ({operation})")
+            edits.manager.ids.close()
+        self.assertGreater(len(manager.expenses), 0)
+
+    def test_list_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "expenses.json")
+            self.check_store(lambda: create_manager(path), directory)
+
+    def test_columnar_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "expenses.json")
+            self.check_store(lambda: create_manager(path, columnar=True), directory)
+
+    def test_partitioned_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "expenses")
+            # recent_months=1 leaves most months on disk after a reopen
+            self.check_store(lambda: create_manager(path, partitioned=True, recent_months=1), directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
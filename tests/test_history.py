@@ -0,0 +1,129 @@
+"""Undo, redo and as_of (expense_history.py) on every backend."""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_history import History
+from expense_tracker import create_manager
+
+
+BACKENDS = {"list": ("expenses.json", {}), "columnar": ("expenses.json", {"columnar": True}),
+            "sqlite": ("expenses.db", {}), "partitioned": ("expenses", {"partitioned": True})}
+
+
+def state(manager):
+    return sorted(tuple(expense.to_dict().items()) for expense in manager.query())
+
+
+def moment() -> str:
+    """A timestamp strictly between the history entries logged around it"""
+    time.sleep(0.002)
+    now = History.now()
+    time.sleep(0.002)
+    return now
+
+
+class HistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.stdout = contextlib.redirect_stdout(io.StringIO())
+        self.stdout.__enter__()
+        self.addCleanup(self.stdout.__exit__, None, None, None)
+
+    def open(self, backend: str):
+        path, kwargs = BACKENDS[backend]
+        manager = create_manager(os.path.join(self.directory.name, backend, path), history=True, **kwargs)
+        self.addCleanup(manager.close if hasattr(manager, "conn") else manager.ids.close)
+        return manager
+
+    def edits(self, manager):
+        """Make a series of changes, returning the ledger state before each"""
+        states = []
+        for edit in (lambda: manager.add_expenses([{"amount": 10, "category": "Food", "date": "2025-01-05"},
+                                                   {"amount": 20, "category": "Travel", "date": "2025-02-05"}]),
+                     lambda: manager.update_expense(1, amount=12.5, note="lunch"),
+                     lambda: manager.update_expenses({1: {"date": "2025-03-01"}, 2: {"category": "Bills"}}),
+                     lambda: manager.delete_expense(2),
+                     lambda: manager.add_expense(3, "Food", "tea")):
+            states.append(state(manager))
+            self.assertTrue(edit())
+        return states
+
+    def test_undo_and_redo_walk_the_changes(self):
+        for backend in BACKENDS:
+            with self.subTest(backend):
+                os.makedirs(os.path.join(self.directory.name, backend))
+                manager = self.open(backend)
+                states = self.edits(manager)
+                final = state(manager)
+                totals = manager.get_totals()
+
+                for expected in reversed(states):
+                    self.assertTrue(manager.undo())
+                    self.assertEqual(state(manager), expected)
+                self.assertFalse(manager.undo())
+                for _ in states:
+                    self.assertTrue(manager.redo())
+                self.assertFalse(manager.redo())
+                self.assertEqual(state(manager), final)
+                self.assertEqual(manager.get_totals(), totals)
+
+                # A new change clears what could be redone
+                manager.undo()
+                manager.add_expense(1, "Other")
+                self.assertFalse(manager.can_redo())
+
+    def test_log_survives_reopening(self):
+        os.makedirs(os.path.join(self.directory.name, "list"))
+        manager = self.open("list")
+        manager.add_expense(5, "Food")
+        when = moment()
+        manager.delete_expense(1)
+        manager.save_expenses()
+
+        reopened = self.open("list")
+        # Undo covers the changes of this session only; the log is kept
+        self.assertFalse(reopened.can_undo())
+        self.assertEqual([expense.paise for expense in reopened.as_of(when)], [500])
+
+    def test_as_of_rebuilds_past_states(self):
+        for backend in BACKENDS:
+            with self.subTest(backend):
+                os.makedirs(os.path.join(self.directory.name, backend))
+                manager = self.open(backend)
+                before = moment()
+                manager.add_expense(5, "Food")
+                after_add = moment()
+                manager.update_expense(1, amount=6)
+                manager.undo()
+                manager.delete_expense(1)
+
+                self.assertEqual([expense.paise for expense in manager.as_of(before)], [])
+                self.assertEqual([expense.paise for expense in manager.as_of(after_add)], [500])
+                self.assertEqual(manager.as_of(History.now()), [])
+                self.assertIsNone(manager.as_of("not a date"))
+
+    def test_as_of_replays_from_a_checkpoint(self):
+        os.makedirs(os.path.join(self.directory.name, "list"))
+        manager = self.open("list")
+        manager.history.checkpoint_every = 2
+        moments = []
+        for i in range(1, 8):
+            manager.add_expense(i, "Food")
+            manager.save_expenses()
+            moments.append(moment())
+        self.assertTrue(manager.history.checkpoints)
+        for i, when in enumerate(moments, 1):
+            self.assertEqual([expense.paise for expense in manager.as_of(when)], [n * 100 for n in range(1, i + 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
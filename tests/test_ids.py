@@ -0,0 +1,84 @@
+"""Expense id allocation (expense_ids.py)."""
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_ids import IdAllocator
+
+
+def reserve_many(path: str, seed: int, results) -> None:
+    rng = random.Random(seed)
+    allocator = IdAllocator(path)
+    ids = []
+    for _ in range(300):
+        count = rng.choice((1, 1, 1, 5, 40))
+        start = allocator.reserve(count)
+        ids.extend(range(start, start + count))
+    allocator.close()
+    results.put(ids)
+
+
+class IdAllocatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "expenses.json.ids.json")
+
+    def allocator(self) -> IdAllocator:
+        allocator = IdAllocator(self.path)
+        self.addCleanup(allocator.close)
+        return allocator
+
+    def test_ids_increase_and_blocks_grow(self):
+        allocator = self.allocator()
+        ids = [allocator.reserve() for _ in range(1000)]
+        self.assertEqual(ids, list(range(1, 1001)))
+        self.assertGreater(allocator.block, IdAllocator.MIN_BLOCK)
+        # A batch that does not fit the rest of the block gets a block of its own
+        start = allocator.reserve(5000)
+        self.assertGreater(start, 1000)
+        self.assertEqual(allocator.reserve(), start + 5000)
+
+    def test_ids_are_not_reused_after_reopening(self):
+        first = self.allocator()
+        handed_out = first.reserve()
+        second = self.allocator()
+        self.assertGreater(second.reserve(), handed_out + IdAllocator.MIN_BLOCK - 1)
+        self.assertEqual(first.reserve(), handed_out + 1)
+
+    def test_observe_skips_ids_in_use(self):
+        allocator = self.allocator()
+        allocator.reserve()
+        allocator.observe(10)
+        self.assertEqual(allocator.reserve(), 11)
+        # Past the block held, so the next block starts above it
+        allocator.observe(10 ** 9)
+        ids = [allocator.reserve() for _ in range(100)]
+        self.assertNotIn(10 ** 9, ids)
+        self.assertGreater(ids[-1], 10 ** 9)
+        self.assertGreater(self.allocator().reserve(), ids[-1])
+
+    def test_processes_never_share_an_id(self):
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        processes = [context.Process(target=reserve_many, args=(self.path, seed, results)) for seed in range(4)]
+        for process in processes:
+            process.start()
+        batches = [results.get(timeout=60) for _ in processes]
+        for process in processes:
+            process.join(60)
+            self.assertEqual(process.exitcode, 0)
+        ids = [expense_id for batch in batches for expense_id in batch]
+        self.assertEqual(len(ids), len(set(ids)))
+        for batch in batches:
+            self.assertEqual(batch, sorted(batch))
+
+
+if __name__ == "__main__":
+    unittest.main()
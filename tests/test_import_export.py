@@ -0,0 +1,108 @@
+"""Importing files (expense_import.py) and exporting changes (expense_export.py)."""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_export import iter_export
+from expense_tracker import ExpenseManager
+
+
+CSV = """Date,Amount,Category,Description
+2025-01-03,120.50,Food,"Lunch, office"
+2025-01-04,60,Travel,bus
+2025-01-04,60,Travel,bus
+2025-02-10,abc,Food,bad amount
+2025-02-11,15000,Rent,
+2025-02-12,1500,Bills,
+2025-02-30,10,Food,bad date
+2025-03-01,0.99,Food,"a ""special"" tea"
+"""
+
+
+def ledger(manager: ExpenseManager):
+    return {expense.id: (expense.date, expense.paise, expense.category, expense.note)
+            for expense in manager.expenses}
+
+
+def replay(path: str):
+    """The ledger an export describes: upserts keyed by id, last one wins"""
+    rows = {}
+    for record in iter_export(path):
+        if record["op"] == "delete":
+            rows.pop(record["id"], None)
+        else:
+            rows[record["id"]] = (record["date"], record["paise"], record["category"], record["note"] or "")
+    return rows
+
+
+class ImportExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.stdout = contextlib.redirect_stdout(io.StringIO())
+        self.stdout.__enter__()
+        self.addCleanup(self.stdout.__exit__, None, None, None)
+        self.manager = self.open("expenses.json")
+        with open(self.path("import.csv"), 'w', newline='') as f:
+            f.write(CSV)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def open(self, name: str) -> ExpenseManager:
+        manager = ExpenseManager(self.path(name))
+        self.addCleanup(manager.ids.close)
+        return manager
+
+    def test_import_validates_and_dedupes(self):
+        result = self.manager.import_file(self.path("import.csv"), rejects_file=self.path("rejects.csv"))
+        self.assertEqual((result.added, result.duplicates, len(result.rejects)), (4, 1, 3))
+        self.assertEqual(sorted(ledger(self.manager).values()),
+                         [("2025-01-03", 12050, "Food", "Lunch, office"), ("2025-01-04", 6000, "Travel", "bus"),
+                          ("2025-02-12", 150000, "Bills", ""), ("2025-03-01", 99, "Food", 'a "special" tea')])
+        self.assertEqual([line for line, _, _ in result.rejects], [5, 6, 8])
+        self.assertEqual(ledger(self.open("expenses.json")), ledger(self.manager))
+
+        # Importing the same file again adds nothing
+        self.assertEqual(self.manager.import_file(self.path("import.csv")).added, 0)
+
+    def test_exports_replay_to_the_ledger(self):
+        self.manager.import_file(self.path("import.csv"))
+        targets = ["export.jsonl", "export.csv", "export.cols", "export.jsonl.gz", "export.csv.gz"]
+        for name in targets:
+            with self.subTest(name):
+                result = self.manager.export(self.path(name))
+                self.assertTrue(result.full)
+                self.assertEqual(result.upserts, 4)
+                self.assertEqual(replay(self.path(name)), ledger(self.manager))
+
+        self.manager.update_expense(1, amount=99, note="dinner")
+        self.manager.delete_expense(2)
+        self.manager.add_expense(7, "Food", "snack")
+        for name in targets:
+            with self.subTest(name):
+                result = self.manager.export(self.path(name))
+                self.assertFalse(result.full)
+                self.assertEqual((result.upserts, result.deletes), (2, 1))
+                self.assertEqual(replay(self.path(name)), ledger(self.manager))
+                # Nothing changed since, so nothing more is written
+                result = self.manager.export(self.path(name))
+                self.assertEqual((result.upserts, result.deletes), (0, 0))
+                self.assertEqual(len(list(iter_export(self.path(name)))), 7)
+
+    def test_exported_jsonl_imports_into_an_empty_ledger(self):
+        self.manager.import_file(self.path("import.csv"))
+        self.manager.export(self.path("export.jsonl"))
+        copy = self.open("copy.json")
+        self.assertEqual(copy.import_file(self.path("export.jsonl")).added, 4)
+        self.assertEqual(sorted(ledger(copy).values()), sorted(ledger(self.manager).values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Journal mode: replaying expenses.json.journal on top of the snapshot."""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_storage import ExpenseJournal
+from expense_tracker import ExpenseManager
+
+
+def rows(manager: ExpenseManager):
+    return sorted(tuple(expense.to_dict().items()) for expense in manager.expenses)
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "expenses.json")
+        self.stdout = contextlib.redirect_stdout(io.StringIO())
+        self.stdout.__enter__()
+        self.addCleanup(self.stdout.__exit__, None, None, None)
+
+    def open(self, **kwargs) -> ExpenseManager:
+        manager = ExpenseManager(self.path, **kwargs)
+        self.addCleanup(manager.ids.close)
+        return manager
+
+    def edit(self, manager: ExpenseManager) -> None:
+        manager.add_expenses([{"amount": 10, "category": "Food", "note": "a", "date": "2025-01-01"},
+                              {"amount": 20, "category": "Travel", "note": "b", "date": "2025-02-01"},
+                              {"amount": 30, "category": "Bills", "note": "c", "date": "2025-03-01"}])
+        manager.update_expense(2, amount=25, note="bus")
+        manager.delete_expense(3)
+        manager.add_expense(5, "Food", "tea")
+
+    def test_reopening_replays_the_journal(self):
+        manager = self.open(journal=True)
+        manager.save_expenses()
+        self.edit(manager)
+        self.assertGreater(os.path.getsize(self.path + ".journal"), 0)
+        self.assertEqual(rows(self.open()), rows(manager))
+        self.assertEqual(self.open().get_totals(), manager.get_totals())
+
+    def test_torn_last_record_is_dropped(self):
+        manager = self.open(journal=True)
+        self.edit(manager)
+        expected = rows(manager)
+        with open(self.path + ".journal", 'ab') as f:
+            f.write(b'{"op":"add","expense":{"id":99,"paise":1')
+
+        reopened = self.open(journal=True)
+        self.assertEqual(rows(reopened), expected)
+        # The torn bytes are cut off, so the next record starts on its own line
+        reopened.add_expense(7, "Food")
+        self.assertEqual(len(self.open().expenses), len(expected) + 1)
+
+    def test_replay_over_a_snapshot_that_holds_it(self):
+        # A crash after the snapshot is renamed into place but before the
+        # journal is reset leaves records the snapshot already holds
+        manager = self.open(journal=True)
+        self.edit(manager)
+        journal = self.path + ".journal"
+        shutil.copyfile(journal, journal + ".old")
+        manager.save_expenses()
+        os.replace(journal + ".old", journal)
+
+        self.assertEqual(rows(self.open()), rows(manager))
+        self.assertEqual(self.open().get_totals(), manager.get_totals())
+
+    def test_discard_before_keeps_later_records(self):
+        journal = ExpenseJournal(self.path + ".journal")
+        journal.append_many([{"op": "delete", "ids": [1]}, {"op": "delete", "ids": [2]}])
+        offset, count = journal.offset, journal.record_count
+        journal.append({"op": "delete", "ids": [3]})
+
+        journal.discard_before(offset, count)
+        self.assertEqual(list(journal.replay()), [{"op": "delete", "ids": [3]}])
+        self.assertEqual(journal.record_count, 1)
+        journal.discard_before(journal.offset, journal.record_count)
+        self.assertFalse(os.path.exists(journal.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
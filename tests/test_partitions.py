@@ -0,0 +1,69 @@
+"""Month-partitioned ledgers (expense_partitions.py)."""
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_partitions import PartitionedExpenseManager
+
+
+def ledger_rows(*rows):
+    """Expense dicts for (id, paise, category, date) tuples"""
+    return [{"id": expense_id, "paise": paise, "category": category, "note": "", "date": date}
+            for expense_id, paise, category, date in rows]
+
+
+class PartitionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.json_file = os.path.join(self.directory.name, "expenses.json")
+        self.partitions = os.path.join(self.directory.name, "expenses")
+        self.stdout = contextlib.redirect_stdout(io.StringIO())
+        self.stdout.__enter__()
+        self.addCleanup(self.stdout.__exit__, None, None, None)
+
+    def write_json(self, rows):
+        with open(self.json_file, 'w') as f:
+            json.dump(rows, f)
+
+    def open(self, **kwargs) -> PartitionedExpenseManager:
+        manager = PartitionedExpenseManager(self.partitions, **kwargs)
+        self.addCleanup(manager.ids.close)
+        return manager
+
+    def test_migrated_categories_are_registered_after_reopening(self):
+        self.write_json(ledger_rows((1, 120000, "Rent", "2024-01-01"), (2, 500, "Pets", "2024-02-03")))
+        self.assertEqual(self.open().migrate_json(self.json_file), 2)
+        self.assertIn("Rent", self.open().categories)
+        os.remove(self.partitions + ".categories.json")
+
+        # Neither month is recent, so the categories only show in the manifest
+        manager = self.open(recent_months=1)
+        self.assertEqual(manager.expenses, [])
+        self.assertIn("Rent", manager.categories)
+        self.assertTrue(manager.add_expense(5, "Pets"))
+        self.assertIn("Rent", self.open().categories)
+
+    def test_migration_renumbers_taken_ids(self):
+        self.write_json(ledger_rows((1, 100, "Food", "2024-01-01"), (1, 200, "Food", "2024-01-02"),
+                                    (2, 300, "Food", "2024-03-01")))
+        self.assertEqual(self.open().migrate_json(self.json_file), 3)
+        self.assertEqual(self.open().migrate_json(self.json_file), 3)
+
+        manager = self.open()
+        manager.load_all()
+        ids = [expense.id for expense in manager.expenses]
+        self.assertEqual(len(set(ids)), 6)
+        self.assertEqual(sorted(expense.paise for expense in manager.expenses), [100, 100, 200, 200, 300, 300])
+        self.assertEqual(manager.get_totals(), (12.0, 6))
+
+
+if __name__ == "__main__":
+    unittest.main()
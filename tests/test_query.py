@@ -0,0 +1,82 @@
+"""ExpenseManager.query gives the same answer on every backend."""
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_tracker import create_manager
+
+
+NOTES = ("Lunch at office", "bus pass", "monthly rent", "", "coffee beans, 1kg", "Bus to office!", "lunch")
+
+CRITERIA = [
+    {},
+    {"text": "lunch"},
+    {"text": "office bus"},
+    {"text": "LUNCH!"},
+    {"text": "!!"},
+    {"text": "!!", "categories": ["food"]},
+    {"note_contains": "bus"},
+    {"categories": ["Food", "travel"]},
+    {"date_from": "2025-02-01", "date_to": "2025-06-30"},
+    {"date_from": "2025-06-15"},
+    {"min_amount": 100, "max_amount": 900.5},
+    {"sort_by": "amount", "descending": True, "limit": 7},
+    {"sort_by": "date", "offset": 5, "limit": 10},
+    {"sort_by": "note", "categories": ["Food"]},
+    {"descending": True, "limit": 3},
+    {"text": "office", "date_from": "2025-01-10", "sort_by": "date", "descending": True},
+]
+
+
+class QueryParityTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        rng = random.Random(7)
+        items = [{"amount": rng.choice((50, 100, 250.75, 900.5, 1200)),
+                  "category": rng.choice(("Food", "Travel", "Bills")), "note": rng.choice(NOTES),
+                  "date": f"2025-{rng.choice((1, 2, 6, 9)):02d}-{rng.randint(1, 28):02d}"}
+                 for _ in range(120)]
+        paths = {"list": ("expenses.json", {}), "columnar": ("columnar.json", {"columnar": True}),
+                 "sqlite": ("expenses.db", {}), "partitioned": ("expenses", {"partitioned": True, "recent_months": 1})}
+        cls.managers = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name, (path, kwargs) in paths.items():
+                manager = create_manager(os.path.join(cls.directory.name, path), **kwargs)
+                manager.add_expenses(items)
+                manager.save_expenses()
+                # Reopened, so the partitioned ledger loads months on demand
+                manager.ids.close()
+                cls.managers[name] = create_manager(os.path.join(cls.directory.name, path), **kwargs)
+
+    @classmethod
+    def tearDownClass(cls):
+        for manager in cls.managers.values():
+            manager.ids.close()
+        cls.managers["sqlite"].conn.close()
+        cls.directory.cleanup()
+
+    def test_backends_agree(self):
+        for criteria in CRITERIA:
+            results = {name: [expense.to_dict() for expense in manager.query(**criteria)]
+                       for name, manager in self.managers.items()}
+            with self.subTest(**criteria):
+                self.assertTrue(results["list"])
+                for name in ("columnar", "sqlite", "partitioned"):
+                    self.assertEqual(results[name], results["list"], name)
+
+    def test_text_without_words_filters_nothing(self):
+        for name, manager in self.managers.items():
+            with self.subTest(name):
+                self.assertEqual(len(manager.query(text="!!")), 120)
+
+
+if __name__ == "__main__":
+    unittest.main()
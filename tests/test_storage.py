@@ -0,0 +1,170 @@
+"""Snapshot and sidecar files written by expense_storage."""
+import contextlib
+import io
+import json
+import os
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import expense_tracker
+from expense_storage import atomic_open, iter_json_array, write_snapshot
+from expense_tracker import ExpenseManager
+
+
+def mode_of(path: str) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+class StreamingTest(unittest.TestCase):
+
+    RECORDS = [
+        {"id": 1, "paise": 1050, "category": "Food", "note": "caf\u00e9, [brackets] and {braces}", "date": "2025-01-01"},
+        {"id": 2, "paise": 300, "category": "Travel", "note": "quote \" and \\ backslash\n", "date": "2025-01-02"},
+        {"id": 3, "paise": 7, "category": "Bills", "note": "", "date": "2025-01-03", "currency": "USD", "original": 9},
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "expenses.json")
+
+    def read(self) -> str:
+        with open(self.path) as f:
+            return f.read()
+
+    def test_snapshot_is_byte_identical_to_json_dump(self):
+        # flat=True is only for records that are neither empty nor nested
+        cases = [(self.RECORDS * 700, False), (self.RECORDS * 700, True), ([], False), ([], True), ([{}], False),
+                 ([{"nested": {"a": [1, 2]}, "list": []}] + self.RECORDS, False)]
+        for records, flat in cases:
+            with self.subTest(rows=len(records), flat=flat):
+                written = write_snapshot(self.path, iter(records), batch_size=64, flat=flat)
+                self.assertEqual(self.read(), json.dumps(records, indent=2))
+                self.assertEqual(written, len(self.read()))
+
+    def test_reader_splits_elements_across_chunks(self):
+        records = self.RECORDS * 50
+        for text in (json.dumps(records), json.dumps(records, indent=2), json.dumps(records, indent="\t")):
+            with open(self.path, 'w') as f:
+                f.write(text)
+            for chunk_size in (1, 7, 64, 1 << 16):
+                with self.subTest(chunk_size=chunk_size):
+                    self.assertEqual(list(iter_json_array(self.path, chunk_size)), records)
+
+    def test_reader_rejects_malformed_input(self):
+        for text in ('{"id": 1}', '[{"id": 1},', '[{"id": 1} {"id": 2}]'):
+            with open(self.path, 'w') as f:
+                f.write(text)
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                list(iter_json_array(self.path, 4))
+
+
+@unittest.skipIf(os.name == "nt", "POSIX permission bits")
+class FileModeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "expenses.json")
+
+    def test_rewrite_keeps_mode(self):
+        with atomic_open(self.path) as f:
+            f.write("[]")
+        os.chmod(self.path, 0o664)
+        with atomic_open(self.path) as f:
+            f.write("[]")
+        self.assertEqual(mode_of(self.path), 0o664)
+
+    def test_new_file_follows_umask(self):
+        umask = os.umask(0o022)
+        os.umask(umask)
+        with atomic_open(self.path) as f:
+            f.write("[]")
+        self.assertEqual(mode_of(self.path), 0o666 & ~umask)
+
+    def test_save_keeps_ledger_and_sidecar_modes(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = ExpenseManager(self.path)
+            manager.add_expense(5, "Food")
+            manager.add_category("Pets")
+            manager.save_expenses()
+            sidecars = [self.path + ".ids.json", self.path + ".categories.json"]
+            for path in [self.path] + sidecars:
+                os.chmod(path, 0o660)
+            manager.add_expense(7, "Food")
+            manager.add_category("Garden")
+            manager.ids.reserve(10 ** 6)
+            manager.save_expenses()
+            manager.ids.close()
+        for path in [self.path] + sidecars:
+            self.assertEqual(mode_of(path), 0o660, path)
+
+
+class SaveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "expenses.json")
+        self.stdout = contextlib.redirect_stdout(io.StringIO())
+        self.stdout.__enter__()
+        self.addCleanup(self.stdout.__exit__, None, None, None)
+
+    def open(self, **kwargs) -> ExpenseManager:
+        manager = ExpenseManager(self.path, **kwargs)
+        self.addCleanup(manager.ids.close)
+        return manager
+
+    def save_while_editing(self, manager: ExpenseManager, edit) -> None:
+        """Save, running edit on another thread while the snapshot is written"""
+        write_snapshot = expense_tracker.write_snapshot
+        waited = []
+
+        def slow_write(*args, **kwargs):
+            thread = threading.Thread(target=edit)
+            thread.start()
+            thread.join(5)
+            waited.append(thread.is_alive())
+            return write_snapshot(*args, **kwargs)
+
+        with mock.patch.object(expense_tracker, "write_snapshot", slow_write):
+            manager.save_expenses()
+        self.assertEqual(waited, [False], "the edit waited for the save to finish")
+
+    def test_edit_during_save_is_journaled(self):
+        manager = self.open(journal=True)
+        manager.add_expenses([{"amount": 10, "category": "Food", "date": "2025-01-01"}] * 3)
+        self.save_while_editing(manager, lambda: manager.add_expense(7, "Travel"))
+
+        self.assertEqual(manager.journal.record_count, 1)
+        self.assertEqual(self.open().get_totals(), (37.0, 4))
+
+    def test_edit_during_save_is_saved_next_time(self):
+        manager = self.open(cache=True)
+        manager.add_expense(5, "Food")
+        # As in the GUI, edits only ask the background worker for a save
+        manager.save_scheduler = lambda: None
+        self.save_while_editing(manager, lambda: manager.update_expense(1, amount=8))
+        self.assertEqual(self.open(cache=True).get_totals(), (5.0, 1))
+
+        manager.save_expenses()
+        self.assertEqual(self.open(cache=True).get_totals(), (8.0, 1))
+
+    def test_snapshot_matches_json_dump(self):
+        manager = self.open()
+        manager.add_expenses([{"amount": 10.5, "category": "Food", "note": "caf\u00e9 \"x\"", "date": "2025-01-01"},
+                              {"amount": 3, "category": "Travel", "date": "2025-02-01"}])
+        manager.expenses[1].foreign = ("USD", 400)
+        manager.save_expenses()
+        with open(self.path) as f:
+            self.assertEqual(f.read(), json.dumps([expense.to_dict() for expense in manager.expenses], indent=2))
+
+
+if __name__ == "__main__":
+    unittest.main()